@@ -1,20 +1,106 @@
 import os
 import json
-import openai
+import time
+import uuid
+import asyncio
+import inspect
 import logging
-import requests
 from datetime import timedelta
-from dotenv import load_dotenv
+from services.utils import load_env
+
+# Before the other imports: several modules read their settings at import.
+load_env()
+
 from flask_cors import CORS, cross_origin
-from flask import Flask, request, jsonify, session, make_response
-from werkzeug.security import generate_password_hash, check_password_hash
-from db.operations import DB_OPERATOR
+from flask import (
+    Flask,
+    Response,
+    g,
+    request,
+    session,
+    redirect,
+    send_file,
+    stream_with_context,
+)
 from db.utils import get_curr_timestamp
-from prompt import PROMPT_TO_ANALYSE_QUERY
-
-logging.basicConfig(level=logging.DEBUG) 
+from services.admission import (
+    BACKGROUND,
+    FOREGROUND,
+    Overloaded,
+    client_ip,
+    create_rate_limiter,
+    create_upstream_gate,
+    current_client,
+    set_client,
+    set_priority,
+)
+from services.cache import create_response_cache
+from services.classifier import is_conversational
+from services.context import (
+    CONTEXT_ENABLED,
+    CONTEXT_READ_TURNS,
+    current_context,
+    pack_context,
+    set_context,
+    summary_prompt,
+    summary_range,
+    unsummarized,
+)
+from services.export import MIMETYPES, NDJSON, export_chunks
+from services.fanout import DB_POOL, MEDIA_POOL, TASK, TOOL_POOL, env_timeout
+from services.handler import INCOMING, STREAM, hasher_busy, rate_limited, upstream_unavailable
+from services.media_jobs import DONE, MEDIA_JOB_QUEUE, QueueFull
+from services.lazy import LAZY, LOOP_LOCAL
+from services.loop import LOOP_THREAD, spawn
+from services.passwords import PASSWORD_HASHER, HasherBusy
+from services.pipeline import (
+    DALL_E_MODEL,
+    IMG_SIZE,
+    OAI_MODEL,
+    ROUTER_TOOLS,
+    SINGLE_CALL_TOOLS,
+    answer_messages,
+    build_response,
+    parse_image_description,
+    router_messages,
+    single_call_messages,
+)
+from services.singleflight import create_single_flight
+from services.upstream import (
+    CircuitOpen,
+    DeadlineExceeded,
+    deadline,
+    get_upstream,
+    start_deadline,
+    upstream_available,
+    upstream_stats,
+)
+from services.sse import SSE_HEADERS, format_event, wants_stream
+from services.utils import normalize_query
+from services.logs import configure_logging, start_log_sampling
+from services.metrics import (
+    REGISTRY,
+    REQUEST_SECONDS,
+    SERVER_TIMING,
+    current_trace,
+    render_metrics,
+    server_timing_header,
+    span,
+    start_trace,
+    stats_collector,
+    timed,
+)
+from services.usage import (
+    TOTALS,
+    current_usage,
+    finish_request,
+    record_call,
+    set_pipeline,
+    start_request,
+    usage_collector,
+)
 
-load_dotenv()
+configure_logging()
 
 app = Flask(__name__)
 CORS(app, supports_credentials=True, origins=["https://www.speakimage.ai", "http://localhost:3000"])
@@ -28,330 +114,1003 @@ app.config["SESSION_COOKIE_SAMESITE"] = "None"
 app.config["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
 app.config["PIXABAY_API_KEY"] = os.getenv("PIXABAY_API_KEY")
 
-DBOPR = DB_OPERATOR()
-OAI_MODEL = "gpt-4o"
-DALL_E_MODEL = "dall-e-3"
-IMG_SIZE = "1024x1024"
+ANSWER_TIMEOUT = env_timeout("ANSWER_TIMEOUT", 60.0)
+DALL_E_TIMEOUT = env_timeout("DALL_E_TIMEOUT", 45.0)
+PIXABAY_TIMEOUT = env_timeout("PIXABAY_TIMEOUT", 5.0)
+# Budget for all upstream calls made while answering one chat request.
+CHAT_DEADLINE = env_timeout("CHAT_DEADLINE", 55.0)
+# Partial results for media tools; tools without one (get_answer) must succeed.
+TOOL_DEFAULTS = {"generate_image": (None, None, None)}
+MAX_MEDIA_JOB_WAIT = env_timeout("MAX_MEDIA_JOB_WAIT", 25.0)
+# Media jobs run in this process after the reply is sent and keep their state
+# in memory, so they need a long-running server (gunicorn, hypercorn). A
+# serverless function (Vercel sets VERCEL=1) is frozen once it replies; there
+# async_media requests render their media inline instead.
+ASYNC_MEDIA_JOBS = os.getenv("ASYNC_MEDIA_JOBS", "0" if os.getenv("VERCEL") else "1") != "0"
+CONTEXT_SUMMARY_MODEL = os.getenv("CONTEXT_SUMMARY_MODEL", OAI_MODEL)
+# "routed": router call + separate answer call, "single": one call returns both.
+CHAT_PIPELINE = os.getenv("CHAT_PIPELINE", "routed").lower()
+RESPONSE_CACHE = create_response_cache()
+
+
+# openai (pydantic/httpx), pymongo and requests are only imported once a
+# route needs them; see benchmarks/bench_coldstart.py.
+def create_db_operator():
+    from db.operations import DB_OPERATOR
+
+    operator = DB_OPERATOR()
+    if os.getenv("ENSURE_INDEXES_ON_STARTUP", "1") != "0":
+        try:
+            operator.ensure_indexes()
+        except Exception as e:
+            logging.error("Could not ensure indexes: %s", e)
+    return operator
+
+def create_openai_client():
+    from openai import AsyncOpenAI
+
+    # Retries happen in the upstream layer, within the request deadline.
+    return AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"), max_retries=0)
+
+def create_pixabay_client():
+    from services.pixabay import PIXABAY_CLIENT
+
+    return PIXABAY_CLIENT(app.config["PIXABAY_API_KEY"])
+
+def create_media_storage():
+    from services.media_store import create_media_store
+
+    return create_media_store(DBOPR)
 
-openai.api_key = os.getenv("OPENAI_API_KEY")
-client = openai
+DBOPR = LAZY(create_db_operator)
+client = LOOP_LOCAL(create_openai_client)
+PIXABAY = LAZY(create_pixabay_client)
+MEDIA_STORE = LAZY(create_media_storage)
+HASHER = PASSWORD_HASHER()
+# Identical concurrent queries / image descriptions share one upstream call.
+CHAT_FLIGHT = create_single_flight("chat")
+IMAGE_FLIGHT = create_single_flight("image")
+# Per-user/IP request budgets and a cap on OpenAI calls in flight.
+LIMITER = create_rate_limiter()
+UPSTREAM_GATE = create_upstream_gate()
+OPENAI = get_upstream("openai", ANSWER_TIMEOUT, gate=UPSTREAM_GATE)
+DALLE = get_upstream("dalle", DALL_E_TIMEOUT, gate=UPSTREAM_GATE)
+# Endpoints whose requests call OpenAI and so draw on the rate limits.
+ADMITTED_ENDPOINTS = {"init_chat", "generate_answer"}
+# The chat handlers are coroutines; the Flask routes run them on this loop.
+PIPELINE_LOOP = LOOP_THREAD("pipeline")
+
+REGISTRY.register_collector(usage_collector)
+REGISTRY.register_collector(stats_collector("speakimage_response_cache", RESPONSE_CACHE.stats))
+REGISTRY.register_collector(stats_collector("speakimage_pixabay_cache", PIXABAY.stats_when_loaded("stats")))
+REGISTRY.register_collector(stats_collector("speakimage_mongo_pool", DBOPR.stats_when_loaded("pool_stats")))
+REGISTRY.register_collector(
+    stats_collector("speakimage_user_cache", DBOPR.stats_when_loaded("user_cache_stats"))
+)
+REGISTRY.register_collector(stats_collector("speakimage_password_hasher", HASHER.stats))
+REGISTRY.register_collector(stats_collector("speakimage_media_store", MEDIA_STORE.stats_when_loaded("stats")))
+REGISTRY.register_collector(stats_collector("speakimage_chat_flight", CHAT_FLIGHT.stats))
+REGISTRY.register_collector(stats_collector("speakimage_image_flight", IMAGE_FLIGHT.stats))
+REGISTRY.register_collector(stats_collector("speakimage_upstream", upstream_stats))
+REGISTRY.register_collector(stats_collector("speakimage_admission", LIMITER.stats))
+if UPSTREAM_GATE is not None:
+    REGISTRY.register_collector(stats_collector("speakimage_upstream_gate", UPSTREAM_GATE.stats))
+
+
+def begin_request():
+    # Per-request state, for both apps. Worker threads are reused across
+    # requests, so every request starts empty.
+    start_request()
+    start_log_sampling()
+    start_trace()
+    set_context(())
+    start_deadline(None)
+    set_client(None)
+    set_priority(FOREGROUND)
+
+def admit(user_id, ip):
+    # Chat endpoints only; returns a 429 reply, or None when admitted.
+    set_client(user_id or ip)
+    retry_after = LIMITER.admit(user_id, ip)
+    return rate_limited(retry_after) if retry_after else None
+
+def reply_headers(streamed):
+    headers = {}
+    if SERVER_TIMING:
+        header = server_timing_header(current_trace())
+        if header:
+            headers["Server-Timing"] = header
+    usage = current_usage()
+    if usage is not None and usage.pipeline is not None:
+        headers["X-OpenAI-Calls"] = str(usage.total_calls)
+        headers["X-Chat-Pipeline"] = usage.pipeline
+        # Streamed responses are still running here; they report on close.
+        if not streamed:
+            finish_request()
+            logging.info("OpenAI usage: %s", usage.to_dict())
+    return headers
+
+def incoming():
+    return INCOMING(request.get_json(silent=True), request.args, request.headers, session)
+
+def respond(reply):
+    if isinstance(reply, STREAM):
+        chunks = PIPELINE_LOOP.iterate(reply.chunks) if inspect.isasyncgen(reply.chunks) else reply.chunks
+        return Response(stream_with_context(chunks), mimetype=reply.mimetype, headers=reply.headers)
+    return reply
+
+@app.before_request
+def start_request_state():
+    g.request_started = time.perf_counter()
+    begin_request()
+
+@app.before_request
+def admit_request():
+    if request.endpoint not in ADMITTED_ENDPOINTS:
+        return None
+    # Keyed on the session, not the unauthenticated user_id in the body.
+    return admit(session.get("email"), client_ip(request.headers, request.remote_addr))
+
+@app.after_request
+def finish_response(response):
+    started = g.get("request_started")
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started, request.method, route, str(response.status_code)
+        )
+    response.headers.update(reply_headers(response.is_streamed))
+    return response
 
+def handle_cache_stats():
+    return {
+        "response": RESPONSE_CACHE.stats(),
+        "pixabay": PIXABAY.stats(),
+        "chat_flight": CHAT_FLIGHT.stats(),
+        "image_flight": IMAGE_FLIGHT.stats(),
+        "users": DBOPR.user_cache_stats(),
+    }, 200
+
+def handle_upstream_stats():
+    return {
+        "upstreams": upstream_stats(),
+        "admission": LIMITER.stats(),
+        "gate": UPSTREAM_GATE.stats() if UPSTREAM_GATE is not None else None,
+    }, 200
+
+def handle_metrics():
+    return render_metrics(), 200, {"Content-Type": "text/plain; version=0.0.4"}
 
 @app.route("/api/health", methods=["GET"])
 def health_check():
     logging.debug("Health check endpoint was called.")
-    response = make_response(jsonify({"status": "healthy"}))
-    return response, 200
+    return {"status": "healthy"}, 200
+
+@app.route("/api/db-pool-stats", methods=["GET"])
+def db_pool_stats():
+    return DBOPR.pool_stats(), 200
+
+@app.route("/api/openai-usage", methods=["GET"])
+def openai_usage():
+    return TOTALS.snapshot(), 200
+
+@app.route("/api/cache-stats", methods=["GET"])
+def cache_stats():
+    return handle_cache_stats()
+
+@app.route("/api/upstream-stats", methods=["GET"])
+def upstream_status():
+    return handle_upstream_stats()
+
+@app.route("/api/metrics", methods=["GET"])
+def metrics():
+    return handle_metrics()
 
 @app.route("/")
 def home():
-    return jsonify({"message": "Welcome to the Speak Image Backend!"})
-
-def analyse_query(query):
-    tools = [
-        {
-            "type": "function",
-            "function": {
-                "name": "generate_image",
-                "description": "Generate an image related to description.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "description": {
-                            "type": "string",
-                            "description": "The description of image which needs to be generated",
-                        }
-                    },
-                    "required": ["description"],
-                },
-            },
-        },
-        {
-            "type": "function",
-            "function": {
-                "name": "get_answer",
-                "description": "Get the text response for the query from the user.",
-                "parameters": {
-                    "type": "object",
-                    "properties": {
-                        "query": {
-                            "type": "string",
-                            "description": "The query from the user that needs to be answered",
-                        }
-                    },
-                    "required": ["query"],
-                },
-            },
-        },
-    ]
+    return {"message": "Welcome to the Speak Image Backend!"}
 
-    messages = [
-        {"role": "system", "content": PROMPT_TO_ANALYSE_QUERY},
-        {"role": "user", "content": query},
-    ]
-    response = client.chat.completions.create(
+@timed("analyse_query")
+async def analyse_query(query):
+    response = await OPENAI.call(
+        client.chat.completions.create,
         model=OAI_MODEL,
-        messages=messages,
-        tools=tools,
+        messages=router_messages(query),
+        tools=ROUTER_TOOLS,
         tool_choice="auto",
         temperature=0.3,
     )
+    record_call("router", response)
+    return response
+
+@timed("answer_with_tools")
+async def answer_with_tools(query, stream=False):
+    response = await OPENAI.call(
+        client.chat.completions.create,
+        model=OAI_MODEL,
+        messages=single_call_messages(query),
+        tools=SINGLE_CALL_TOOLS,
+        tool_choice="auto",
+        stream=stream,
+    )
+    record_call("answer_with_tools", None if stream else response)
     return response
 
-def call_tool_funcs(tool_calls):
-    outputs = {}
+@timed("call_tool_funcs")
+async def call_tool_funcs(tool_calls, skip=()):
+    tasks = []
     for tool_call in tool_calls:
-        if tool_call.type == "function":
+        if tool_call.type == "function" and tool_call.function.name not in skip:
             function_name = tool_call.function.name
             args = json.loads(tool_call.function.arguments)
             function_to_call = globals().get(function_name)
             if function_to_call:
                 try:
-                    output = function_to_call(**args)
-                    outputs[function_name] = output
+                    inspect.signature(function_to_call).bind(**args)
                 except TypeError as e:
-                    logging.error(f"Argument mismatch in {function_name}: {str(e)}")
-                    logging.debug(f"Received arguments for {function_name}: {args}")
+                    logging.error("Argument mismatch in %s: %s", function_name, e)
+                    logging.debug("Received arguments for %s: %s", function_name, args)
                     continue
-    return outputs
-
-def get_answer(query):
-    messages = [
-        {
-            "role": "system",
-            "content": "Answer with a bit of detailed explanation. There could be causal question or specific question.",
-        },
-        {"role": "user", "content": query},
-    ]
-    response = client.chat.completions.create(model=OAI_MODEL, messages=messages)
+                tasks.append(
+                    TASK(
+                        function_name,
+                        function_to_call,
+                        timeout=ANSWER_TIMEOUT,
+                        default=TOOL_DEFAULTS.get(function_name),
+                        required=function_name not in TOOL_DEFAULTS,
+                        **args,
+                    )
+                )
+    # Tool calls are independent of each other, so run them side by side.
+    return await TOOL_POOL.run(tasks)
+
+@timed("get_answer")
+async def get_answer(query):
+    messages = answer_messages(query)
+    response = await OPENAI.call(client.chat.completions.create, model=OAI_MODEL, messages=messages)
+    record_call("answer", response)
     response_message = response.choices[0].message
-    logging.debug(f"MESSAGE: {response_message}")
+    logging.debug("MESSAGE: %s", response_message)
     return response_message.content
 
-def get_video_from_pixabay(description):
-    url = f"https://pixabay.com/api/videos/?key={app.config['PIXABAY_API_KEY']}&q={description}"
-    response = requests.get(url)
-    out = response.json()
-    if out.get("hits"):
-        return out["hits"][0]["videos"]["medium"]["url"]
-    return None
-
-def get_image_from_pixabay(description):
-    url = f"https://pixabay.com/api/?key={app.config['PIXABAY_API_KEY']}&q={description}&image_type=photo"
-    response = requests.get(url)
-    out = response.json()
-    if out.get("hits"):
-        large_img_url = out["hits"][0].get("largeImageURL")
-        return large_img_url if large_img_url else out["hits"][0]["imageURL"]
-    return None
-
-def generate_image(description):
-    response = client.images.generate(
-        model=DALL_E_MODEL, prompt=description, size=IMG_SIZE, n=1, quality="standard"
+async def stream_answer(query):
+    messages = answer_messages(query)
+    # Only opening the stream is retried (and counted against the upstream
+    # gate); a stream cut off midway is not.
+    stream = await OPENAI.call(client.chat.completions.create, model=OAI_MODEL, messages=messages, stream=True)
+    record_call("answer")
+    async for chunk in stream:
+        if chunk.choices and chunk.choices[0].delta.content:
+            yield chunk.choices[0].delta.content
+
+async def stream_answer_with_tools(query, tool_calls):
+    async for chunk in await answer_with_tools(query, stream=True):
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta
+        if delta.content:
+            yield delta.content
+        for tool_call in delta.tool_calls or []:
+            call = tool_calls.setdefault(tool_call.index, {"name": "", "arguments": ""})
+            if tool_call.function and tool_call.function.name:
+                call["name"] += tool_call.function.name
+            if tool_call.function and tool_call.function.arguments:
+                call["arguments"] += tool_call.function.arguments
+
+async def get_video_from_pixabay(description):
+    return await PIXABAY.search_video(description)
+
+async def get_image_from_pixabay(description):
+    return await PIXABAY.search_image(description)
+
+@timed("dalle")
+async def get_dalle_image(description):
+    stored_url = await MEDIA_POOL.call(MEDIA_STORE.find_by_prompt, description)
+    if stored_url:
+        return stored_url
+    # Stored images are free; only new generations count against the budget.
+    if not await DB_POOL.call(LIMITER.allow_image, current_client()):
+        logging.info("Image budget exhausted for this client, skipping DALL-E")
+        return None
+    response = await DALLE.call(
+        client.images.generate, model=DALL_E_MODEL, prompt=description, size=IMG_SIZE, n=1, quality="standard"
     )
-    gpt_image_url = response.data[0].url if response.data else None
-    pixabay_img_url = get_image_from_pixabay(description)
-    video_url = get_video_from_pixabay(description)
-    return gpt_image_url, pixabay_img_url, video_url
+    record_call("image")
+    url = response.data[0].url if response.data else None
+    if not url:
+        return None
+    # OpenAI URLs expire after a few hours; keep our own copy when configured.
+    with span("media_store"):
+        return await MEDIA_POOL.call(MEDIA_STORE.persist, url, description) or url
 
-def chat(user_query):
-    response = analyse_query(user_query)
+@timed("pixabay")
+async def get_pixabay_media(description):
+    return await PIXABAY.lookup(description)
+
+def media_tasks(description):
+    return [
+        TASK("dalle_image", get_dalle_image, description, timeout=DALL_E_TIMEOUT),
+        TASK("pixabay", get_pixabay_media, description, timeout=PIXABAY_TIMEOUT, default=(None, None)),
+    ]
+
+async def iter_media(description):
+    async for name, output in MEDIA_POOL.iter_completed(media_tasks(description)):
+        if name == "pixabay":
+            yield "pixabay_img", output[0]
+            yield "pixabay_video", output[1]
+        else:
+            yield name, output
+
+async def fetch_image_media(description):
+    outputs = await MEDIA_POOL.run(media_tasks(description))
+    pixabay_img_url, video_url = outputs["pixabay"]
+    return outputs["dalle_image"], pixabay_img_url, video_url
+
+@timed("generate_image")
+async def generate_image(description):
+    media, _ = await IMAGE_FLIGHT.do(normalize_query(description), fetch_image_media, description)
+    # Results shared across processes come back as JSON lists.
+    return tuple(media)
+
+@timed("media_job")
+async def render_media(description):
+    pixabay = asyncio.ensure_future(get_pixabay_media(description))
+    # DALLE.call already retries 429s and 5xx with backoff; retrying
+    # around it again would multiply the attempts.
+    try:
+        dalle_image = await get_dalle_image(description)
+    except Exception as e:
+        logging.error("DALL-E generation failed in media job: %s", e)
+        dalle_image = None
+    try:
+        pixabay_img_url, video_url = await asyncio.wait_for(pixabay, PIXABAY_TIMEOUT)
+    except Exception as e:
+        logging.error("Pixabay lookup failed in media job: %s", e)
+        pixabay_img_url, video_url = None, None
+    return {"dalle_image": dalle_image, "pixabay_img": pixabay_img_url, "pixabay_video": video_url}
+
+async def render_media_job(description):
+    # Jobs outlive the request that queued them, and its deadline. They
+    # queue behind interactive calls when the upstream gate is full.
+    set_priority(BACKGROUND)
+    with deadline(None):
+        return await render_media(description)
+
+MEDIA_JOBS = MEDIA_JOB_QUEUE(render_media_job)
+REGISTRY.register_collector(stats_collector("speakimage_media_jobs", MEDIA_JOBS.stats))
+
+def get_image_description(response):
+    if not response or not response.choices or not response.choices[0].message:
+        return None
+    return parse_image_description(
+        (tool_call.function.name, tool_call.function.arguments)
+        for tool_call in response.choices[0].message.tool_calls or []
+        if tool_call.type == "function"
+    )
+
+def media_available():
+    return DALLE.available() or upstream_available("pixabay")
+
+@timed("chat")
+async def chat(user_query, defer_media=False):
+    start_deadline(CHAT_DEADLINE)
+    if current_context():
+        # Follow-ups depend on their thread, so they can't share answers.
+        res_out = await run_chat_pipeline(user_query, defer_media)
+        res_out.pop("partial", None)
+        return res_out
+    with span("cache_lookup"):
+        cached = await DB_POOL.call(RESPONSE_CACHE.get, user_query)
+    if cached is not None:
+        set_pipeline("cache")
+        return {"response": cached}
+    key = f"{int(defer_media)}:{normalize_query(user_query)}"
+    res_out, leader = await CHAT_FLIGHT.do(key, run_chat_pipeline, user_query, defer_media)
+    partial = res_out.pop("partial", False)
+    if not leader:
+        set_pipeline("coalesced")
+        return res_out
+    # Responses with deferred media are cached once their media job finishes.
+    if (
+        not partial
+        and "response" in res_out
+        and res_out["response"]["text"]
+        and not res_out.get("media_description")
+    ):
+        await DB_POOL.call(RESPONSE_CACHE.set, user_query, res_out["response"])
+    return res_out
+
+def with_deferred_media(res_out, description):
+    if description:
+        res_out["media_description"] = description
+    return res_out
+
+def mark_partial(res_out, partial=True):
+    # Degraded answers (text-only while breakers are open, or no DALL-E
+    # image where one was asked for) are served but never cached.
+    if partial:
+        res_out["partial"] = True
+    return res_out
+
+async def run_chat_pipeline(user_query, defer_media=False):
+    if is_conversational(user_query):
+        set_pipeline("local")
+        return {"response": build_response(await get_answer(user_query))}
+    if CHAT_PIPELINE == "single":
+        set_pipeline("single")
+        return await chat_single_call(user_query, defer_media)
+    if not media_available():
+        # With both media upstreams failing, skip the router: text only.
+        set_pipeline("text-only")
+        return mark_partial({"response": build_response(await get_answer(user_query))})
+    set_pipeline("routed")
+    response = await analyse_query(user_query)
     if not response.choices or not response.choices[0].message:
         error_msg = "Invalid response structure received from OpenAI."
-        logging.error(f"{error_msg} Full response: {response}")
+        logging.error("%s Full response: %s", error_msg, response)
         return {"error": error_msg}
     tool_calls = response.choices[0].message.tool_calls
+    deferred = get_image_description(response) if defer_media and tool_calls else None
     outputs = (
-        call_tool_funcs(tool_calls)
+        await call_tool_funcs(tool_calls, skip=("generate_image",) if deferred else ())
         if tool_calls
-        else {"get_answer": get_answer(user_query)}
+        else {"get_answer": await get_answer(user_query)}
     )
     text = outputs.get("get_answer")
-    gpt_image_url, pixabay_img_url, video_url = outputs.get(
-        "generate_image", (None, None, None)
-    )
-    res_out = {
-        "text": text,
-        "dalle_image": gpt_image_url,
-        "pixabay_img": pixabay_img_url,
-        "pixabay_video": video_url,
+    media = outputs.get("generate_image", (None, None, None))
+    res_out = with_deferred_media({"response": build_response(text, media)}, deferred)
+    return mark_partial(res_out, "generate_image" in outputs and not media[0])
+
+async def chat_single_call(user_query, defer_media=False):
+    response = await answer_with_tools(user_query)
+    if not response.choices or not response.choices[0].message:
+        error_msg = "Invalid response structure received from OpenAI."
+        logging.error("%s Full response: %s", error_msg, response)
+        return {"error": error_msg}
+    text = response.choices[0].message.content
+    description = get_image_description(response)
+    tasks = []
+    if description and not defer_media:
+        tasks.append(
+            TASK(
+                "generate_image",
+                generate_image,
+                description,
+                timeout=ANSWER_TIMEOUT,
+                default=TOOL_DEFAULTS["generate_image"],
+            )
+        )
+    if not text:
+        # The model occasionally replies with only the tool call.
+        tasks.append(TASK("get_answer", get_answer, user_query, required=True))
+    outputs = await TOOL_POOL.run(tasks) if tasks else {}
+    text = text or outputs.get("get_answer")
+    media = outputs.get("generate_image", (None, None, None))
+    deferred = description if defer_media else None
+    res_out = with_deferred_media({"response": build_response(text, media)}, deferred)
+    return mark_partial(res_out, bool(description) and not defer_media and not media[0])
+
+def wants_async_media(req):
+    if not ASYNC_MEDIA_JOBS:
+        return False
+    return bool(req.data.get("async_media")) or req.args.get("async_media") in ("1", "true")
+
+def new_conversation(user_query, response, media_description=None):
+    conversation = {
+        "query": user_query,
+        "response": response,
+        "timestamp": get_curr_timestamp(),
     }
-    return {"response": res_out}
+    if media_description:
+        # The id lets the media job find this turn again once it finishes.
+        conversation["message_id"] = uuid.uuid4().hex
+        response["media_status"] = "pending"
+    return conversation
 
-@app.route("/api/init-chat", methods=["POST"])
-def init_chat():
-    user_query = request.json.get("query")
-    title_words = user_query.split(" ")[:5]
-    title = " ".join(title_words)
-    user_id = request.json.get("user_id")
+async def start_media_job(user_query, thread_id, conversation, description):
+    message_id = conversation["message_id"]
+    response = conversation["response"]
+    # Follow-up answers belong to their thread; like chat(), keep them out
+    # of the shared cache. The job runs after the request, so decide now.
+    cacheable = not current_context()
+
+    def on_done(job):
+        media = dict(job.result or {}, media_status=job.status)
+        DBOPR.update_message_media(thread_id, message_id, media)
+        # A job whose DALL-E step failed still completes with Pixabay media.
+        if cacheable and job.status == DONE and media.get("dalle_image"):
+            RESPONSE_CACHE.set(user_query, dict(response, **media))
+
+    try:
+        job = MEDIA_JOBS.submit(description, on_done)
+    except QueueFull:
+        # Too much queued work: render inline like the synchronous mode does.
+        logging.warning("Media job queue full, rendering inline")
+        media = dict(await render_media(description), media_status=DONE)
+        await DB_POOL.call(DBOPR.update_message_media, thread_id, message_id, media)
+        response.update(media)
+        return None
+    return {"job_id": job.id, "status": job.status}
+
+async def chat_stream(user_query):
+    start_deadline(CHAT_DEADLINE)
+    with span("cache_lookup"):
+        cached = None if current_context() else await DB_POOL.call(RESPONSE_CACHE.get, user_query)
+    if cached is not None:
+        set_pipeline("cache")
+        yield "token", {"text": cached["text"]}
+        for name in ("dalle_image", "pixabay_img", "pixabay_video"):
+            if cached.get(name):
+                yield "media", {"type": name, "url": cached[name]}
+        yield "done", {"response": dict(cached)}
+        return
+    res_out = build_response(None)
+    parts = []
+    router = None
+    tool_calls = {}
+    partial = False
+    if is_conversational(user_query):
+        set_pipeline("local")
+        tokens = stream_answer(user_query)
+    elif CHAT_PIPELINE == "single":
+        set_pipeline("single")
+        tokens = stream_answer_with_tools(user_query, tool_calls)
+    elif not media_available():
+        set_pipeline("text-only")
+        partial = True
+        tokens = stream_answer(user_query)
+    else:
+        set_pipeline("routed")
+        # The router only decides whether media is needed, so it runs while the
+        # answer tokens are already being streamed to the client.
+        router = asyncio.ensure_future(analyse_query(user_query))
+        tokens = stream_answer(user_query)
+    try:
+        async for token in tokens:
+            parts.append(token)
+            yield "token", {"text": token}
+        if not parts and tool_calls:
+            async for token in stream_answer(user_query):
+                parts.append(token)
+                yield "token", {"text": token}
+        res_out["text"] = "".join(parts)
+        description = None
+        if router is not None:
+            try:
+                description = get_image_description(await asyncio.wait_for(router, ANSWER_TIMEOUT))
+            except Exception as e:
+                logging.error("Router call failed while streaming: %s", e)
+                partial = True
+        elif tool_calls:
+            description = parse_image_description(
+                (call["name"], call["arguments"]) for call in tool_calls.values()
+            )
+    finally:
+        # The client may have gone away mid-stream.
+        if router is not None:
+            router.cancel()
+    if description:
+        async for name, url in iter_media(description):
+            res_out[name] = url
+            yield "media", {"type": name, "url": url}
+        partial = partial or not res_out["dalle_image"]
+    if res_out["text"] and not partial and not current_context():
+        await DB_POOL.call(RESPONSE_CACHE.set, user_query, res_out)
+    yield "done", {"response": res_out}
+
+@timed("load_context")
+async def load_conversation_context(thread_id):
+    # Sets the packed history for this request's pipeline calls and returns
+    # what schedule_context_summary needs afterwards.
+    if not CONTEXT_ENABLED:
+        return None
+    try:
+        page = await DB_POOL.call(DBOPR.get_history_page, thread_id, 0, CONTEXT_READ_TURNS, include_summary=True)
+    except Exception as e:
+        logging.error("Could not load conversation context: %s", e)
+        return None
+    if page is None:
+        return None
+    summary = page.get("summary") or {}
+    turns = unsummarized(page["messages"], page["total"], summary.get("turns", 0))
+    messages, tokens = pack_context(summary.get("text"), turns)
+    set_context(messages)
+    logging.debug("Conversation context: %s messages, %s tokens", len(messages), tokens)
+    return {"total": page["total"], "summary": summary}
+
+@timed("context_summary")
+async def update_context_summary(thread_id, total, summary):
+    # Runs after the request, in a copy of its context; drop its deadline.
+    start_deadline(None)
+    set_priority(BACKGROUND)
+    turns_range = summary_range(total, summary.get("turns", 0))
+    if turns_range is None:
+        return
+    start, end = turns_range
+    page = await DB_POOL.call(DBOPR.get_history_page, thread_id, offset=total - end, limit=end - start)
+    turns = list(reversed(page["messages"])) if page else []
+    if not turns:
+        return
+    response = await OPENAI.call(
+        client.chat.completions.create,
+        model=CONTEXT_SUMMARY_MODEL,
+        messages=summary_prompt(summary.get("text"), turns),
+    )
+    record_call("summary", response)
+    text = response.choices[0].message.content if response.choices else None
+    if text:
+        await DB_POOL.call(DBOPR.save_context_summary, thread_id, text.strip(), start + len(turns))
+
+def schedule_context_summary(thread_id, context):
+    # Runs after the answer is stored, off the request path.
+    if context is not None:
+        spawn(update_context_summary(thread_id, context["total"] + 1, context["summary"]))
+
+def stream_chat_response(user_query, persist):
+    async def generate():
+        try:
+            async for event, data in chat_stream(user_query):
+                if event == "done":
+                    data.update(await persist(data["response"]) or {})
+                yield format_event(event, data)
+        except Exception as e:
+            logging.error("Streaming request failed: %s", e)
+            yield format_event("error", {"error": str(e)})
+        finally:
+            usage = finish_request()
+            if usage is not None:
+                logging.info("OpenAI usage: %s", usage.to_dict())
+
+    return STREAM(generate(), "text/event-stream", SSE_HEADERS)
+
+async def handle_init_chat(req):
+    user_query = req.data.get("query")
+    user_id = req.data.get("user_id")
     if not user_query or not user_id:
-        return jsonify({"error": "user_query or user_id missing"}), 400
-    logging.debug(f"user query: {user_query}")
-    res_out = chat(user_query)
+        return {"error": "user_query or user_id missing"}, 400
+    title = " ".join(user_query.split(" ")[:5])
+    logging.debug("user query: %s", user_query)
+    if wants_stream(req):
+        async def persist(response):
+            conversation = {
+                "query": user_query,
+                "response": response,
+                "timestamp": get_curr_timestamp(),
+            }
+            return {"thread_id": await DB_POOL.call(DBOPR.init_chat_in_db, user_id, title, conversation)}
+
+        return stream_chat_response(user_query, persist)
+    try:
+        res_out = await chat(user_query, defer_media=wants_async_media(req))
+    except (CircuitOpen, DeadlineExceeded, Overloaded) as e:
+        return upstream_unavailable(e)
     if "response" in res_out:
-        conversation = {
-            "query": user_query,
-            "response": res_out["response"],
-            "timestamp": get_curr_timestamp(),
-        }
-        thread_id = DBOPR.init_chat_in_db(user_id, title, conversation)
-        logging.debug(f"Thread ID: {thread_id}")
-        return jsonify({"response": res_out["response"], "thread_id": thread_id}), 200
-    return jsonify(res_out), 500
+        description = res_out.pop("media_description", None)
+        conversation = new_conversation(user_query, res_out["response"], description)
+        thread_id = await DB_POOL.call(DBOPR.init_chat_in_db, user_id, title, conversation)
+        logging.debug("Thread ID: %s", thread_id)
+        body = {"response": res_out["response"], "thread_id": thread_id}
+        if description:
+            body["media_job"] = await start_media_job(user_query, thread_id, conversation, description)
+        return body, 200
+    return res_out, 500
 
-@app.route("/api/generate-answer", methods=["POST"])
-def generate_answer():
-    user_query = request.json.get("query")
-    thread_id = request.json.get("thread_id")
-    logging.info(f"Received Query: {user_query} | Thread ID: {thread_id}")
+async def handle_generate_answer(req):
+    user_query = req.data.get("query")
+    thread_id = req.data.get("thread_id")
+    logging.info("Received Query: %s | Thread ID: %s", user_query, thread_id)
     if not user_query or not thread_id:
         logging.error("No query or thread_id provided in request")
-        return jsonify({"error": "No query or thread_id provided"}), 400
-    try:
-        res_out = chat(user_query)
-        if "response" in res_out:
+        return {"error": "No query or thread_id provided"}, 400
+    context = await load_conversation_context(thread_id)
+    if wants_stream(req):
+        async def persist(response):
             conversation = {
                 "query": user_query,
-                "response": res_out["response"],
+                "response": response,
                 "timestamp": get_curr_timestamp(),
             }
-            DBOPR.add_message(thread_id, conversation)
-            return jsonify(res_out), 200
-        return jsonify(res_out), 500
+            await DB_POOL.call(DBOPR.add_message, thread_id, conversation)
+            schedule_context_summary(thread_id, context)
+
+        return stream_chat_response(user_query, persist)
+    try:
+        res_out = await chat(user_query, defer_media=wants_async_media(req))
+        if "response" in res_out:
+            description = res_out.pop("media_description", None)
+            conversation = new_conversation(user_query, res_out["response"], description)
+            await DB_POOL.call(DBOPR.add_message, thread_id, conversation)
+            schedule_context_summary(thread_id, context)
+            if description:
+                res_out["media_job"] = await start_media_job(user_query, thread_id, conversation, description)
+            return res_out, 200
+        return res_out, 500
+    except (CircuitOpen, DeadlineExceeded, Overloaded) as e:
+        return upstream_unavailable(e)
     except Exception as e:
-        logging.error(f"API request failed: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        logging.error("API request failed: %s", e)
+        return {"error": str(e)}, 500
 
-@app.route("/api/history", methods=["POST"])
-def chat_history():
-    thread_id = request.json.get("thread_id")
+def handle_media_job(req, job_id):
+    # ?wait=N long-polls for up to N seconds while the job is still running.
+    try:
+        wait = min(max(0.0, float(req.args.get("wait", 0))), MAX_MEDIA_JOB_WAIT)
+    except ValueError:
+        return {"error": "wait must be a number of seconds"}, 400
+    job = MEDIA_JOBS.wait(job_id, wait)
+    if job is None:
+        return {"error": "Media job not found"}, 404
+    return job.to_dict(), 200
+
+def locate_media(name):
+    # (local path, None), (None, signed URL), or None when there is no such file.
+    digest = name.split(".")[0]
+    if MEDIA_STORE.backend is None or len(digest) != 64 or not all(c in "0123456789abcdef" for c in digest):
+        return None
+    path = MEDIA_STORE.backend.local_path(name)
+    if path is not None:
+        return path, None
+    signed_url = MEDIA_STORE.backend.signed_url(name)
+    return (None, signed_url) if signed_url else None
+
+def handle_chat_history(req):
+    thread_id = req.data.get("thread_id")
+    if "limit" in req.data or "offset" in req.data:
+        try:
+            page = DBOPR.get_history_page(
+                thread_id,
+                offset=req.data.get("offset", 0),
+                limit=req.data.get("limit", 20),
+            )
+        except (TypeError, ValueError) as e:
+            return {"error": str(e)}, 400
+        if page is None:
+            return {"error": "Chat history not found"}, 404
+        return page, 200
     conversation = DBOPR.get_history(thread_id)
     if conversation:
-        return jsonify(conversation), 200
-    return jsonify({"error": "Chat history not found"}), 404
+        return conversation, 200
+    return {"error": "Chat history not found"}, 404
 
-@app.route("/api/clear-history", methods=["POST"])
-def clear_history():
-    thread_id = request.json.get("thread_id")
-    success = DBOPR.clear_history(thread_id)
+def handle_clear_history(req):
+    success = DBOPR.clear_history(req.data.get("thread_id"))
     if success:
-        return jsonify({"message": "Chat history cleared"}), 200
-    return jsonify({"error": "Chat history not found"}), 404
+        return {"message": "Chat history cleared"}, 200
+    return {"error": "Chat history not found"}, 404
 
-@app.route("/api/delete-chat", methods=["POST"])
-def delete_chat():
-    thread_id = request.json.get("thread_id")
-    DBOPR.delete_chat(thread_id)
-    return jsonify({"message": "chat deleted"}), 200
+def handle_delete_chat(req):
+    DBOPR.delete_chat(req.data.get("thread_id"))
+    return {"message": "chat deleted"}, 200
 
-@app.route("/signup", methods=["POST"])
-def signup():
-    data = request.get_json()
-    logging.debug('Data received: %s', data)
-    email = data.get("email")
-    password = data.get("password")
-    full_name = data.get("full_name")
+def handle_signup(req):
+    logging.debug("Signup request for: %s", req.data.get("email"))
+    email = req.data.get("email")
+    password = req.data.get("password")
+    full_name = req.data.get("full_name")
     if email and password and full_name:
         existing_user = DBOPR.find_user(email)
         if existing_user:
-            return jsonify({"error": "User already exists"}), 409
-        hashed_password = generate_password_hash(password)
+            return {"error": "User already exists"}, 409
+        try:
+            hashed_password = HASHER.hash(password)
+        except HasherBusy:
+            return hasher_busy()
         DBOPR.create_user(email, hashed_password, full_name)
-        return jsonify({"message": "User created successfully"}), 201
-    return jsonify({"error": "Invalid data"}), 400
+        return {"message": "User created successfully"}, 201
+    return {"error": "Invalid data"}, 400
 
-@app.route("/login", methods=["POST"])
-def login():
-    data = request.get_json()
-    logging.debug(f"Received login data: {data}")
+def handle_login(req):
+    logging.debug("Received login request for: %s", req.data.get("email"))
 
-    email = data.get("email")
-    password = data.get("password")
+    email = req.data.get("email")
+    password = req.data.get("password")
 
     if email and password:
-        logging.debug(f"Attempting to find user with email: {email}")
+        logging.debug("Attempting to find user with email: %s", email)
         user = DBOPR.find_user(email)
 
         if user:
-            logging.debug(f"User found: {user}")
-            if check_password_hash(user["password"], password):
+            logging.debug("User found: %s", user["_id"])
+            try:
+                password_ok = HASHER.verify(user["password"], password)
+            except HasherBusy:
+                return hasher_busy()
+            if password_ok:
                 logging.debug("Password check passed")
-                session.permanent = True
-                session["email"] = email
+                if HASHER.needs_rehash(user["password"]):
+                    HASHER.rehash_in_background(
+                        password, lambda hashed: DBOPR.update_password(user["_id"], hashed, email)
+                    )
+                req.session.permanent = True
+                req.session["email"] = email
                 user_id = user["_id"]  # Get the user_id
-                logging.debug(f"Login successful for user_id: {user_id}")
-                response = jsonify({"message": "Login successful", "user_id": user_id})
-                return response, 200
+                logging.debug("Login successful for user_id: %s", user_id)
+                return {"message": "Login successful", "user_id": user_id}, 200
             else:
                 logging.warning("Invalid password provided")
-                return jsonify({"error": "Invalid credentials"}), 401
+                return {"error": "Invalid credentials"}, 401
         else:
             logging.warning("User not found")
-            return jsonify({"error": "Invalid credentials"}), 401
+            return {"error": "Invalid credentials"}, 401
     else:
         logging.error("Invalid data received in request")
-        return jsonify({"error": "Invalid data"}), 400
+        return {"error": "Invalid data"}, 400
 
-@app.route("/logout", methods=["POST"])
-def logout():
-    session.pop("username", None)
-    return jsonify({"message": "Logged out successfully"}), 200
+def handle_logout(req):
+    req.session.pop("username", None)
+    return {"message": "Logged out successfully"}, 200
 
-@app.route("/api/get-users", methods=["GET"])
-def get_users():
+def wants_export(req):
+    return any(name in req.args for name in ("format", "after", "batch_size", "fields"))
+
+def export_reply(req, iterate):
+    # Streams straight from the Mongo cursor: ?format=ndjson|json,
+    # ?fields=a,b, ?batch_size=N, ?limit=N and ?after=<last _id> to resume.
+    fmt = req.args.get("format", NDJSON)
+    if fmt not in MIMETYPES:
+        return {"error": f"format must be one of {', '.join(MIMETYPES)}"}, 400
+    fields = [field for field in req.args.get("fields", "").split(",") if field] or None
+    try:
+        limit = int(req.args.get("limit", 0))
+        docs = iterate(
+            fields=fields,
+            after=req.args.get("after"),
+            batch_size=req.args.get("batch_size"),
+            limit=limit,
+        )
+    except ValueError as e:  # includes InvalidCursor
+        return {"error": str(e)}, 400
+    return STREAM(export_chunks(docs, fmt, limit or None), MIMETYPES[fmt])
+
+def handle_get_users(req):
+    if wants_export(req):
+        return export_reply(req, DBOPR.iter_users)
     try:
         users = DBOPR.get_users()
         if users is not None:
-            return jsonify(users), 200
+            return users, 200
         else:
-            return jsonify({"error": "Error fetching users"}), 500
+            return {"error": "Error fetching users"}, 500
     except Exception as e:
-        logging.error(f"Exception in /api/get-users: {str(e)}")
-        return jsonify({"error": "Internal server error"}), 500
+        logging.error("Exception in /api/get-users: %s", e)
+        return {"error": "Internal server error"}, 500
 
-@app.route("/api/get-chats/<user_id>", methods=["GET"])
-def get_chats(user_id):
+def handle_export_chats(req):
+    return export_reply(req, DBOPR.iter_chats)
+
+def wants_chat_page(req):
+    return "limit" in req.args or "after" in req.args
+
+def list_chats_page(req, user_id):
+    try:
+        page = DBOPR.list_chats(user_id, limit=req.args.get("limit", 20), after=req.args.get("after"))
+    except ValueError as e:  # includes InvalidCursor
+        return {"error": str(e)}, 400
+    return page, 200
+
+def handle_get_chats(req, user_id):
     try:
+        if wants_chat_page(req):
+            return list_chats_page(req, user_id)
         chats = DBOPR.get_chats_by_user_id(user_id)
         if chats is not None:
-            return jsonify(chats), 200
+            return chats, 200
         else:
-            return jsonify({"error": "Error fetching chats"}), 500
+            return {"error": "Error fetching chats"}, 500
     except Exception as e:
-        logging.error(f"Exception in /api/get-chats: {str(e)}")
-        return jsonify({"error": "Internal server error"}), 500
+        logging.error("Exception in /api/get-chats: %s", e)
+        return {"error": "Internal server error"}, 500
 
-@app.route("/api/get-chat/<chat_id>", methods=["GET"])
-def get_chat_by_id(chat_id):
-    logging.debug(f"Fetching chat with ID: {chat_id}")
+def handle_get_chat(req, chat_id):
+    logging.debug("Fetching chat with ID: %s", chat_id)
     chat = DBOPR.get_chat_by_id(chat_id)
     if chat:
-        return jsonify(chat), 200
+        return chat, 200
     else:
-        return jsonify({"error": "Chat not found"}), 404
+        return {"error": "Chat not found"}, 404
 
-@app.route("/api/get-user-chats/<user_id>", methods=["GET"])
-def get_user_chats(user_id):
-    logging.debug(f"Fetching chats for user_id: {user_id}")
+def handle_get_user_chats(req, user_id):
+    logging.debug("Fetching chats for user_id: %s", user_id)
+    if wants_chat_page(req):
+        return list_chats_page(req, user_id)
     chats = DBOPR.get_chats_by_user_id(user_id)
     if chats:
-        return jsonify(chats), 200
+        return chats, 200
     else:
-        return jsonify({"error": "Chats not found"}), 404
+        return {"error": "Chats not found"}, 404
 
-@app.route("/api/get-user/<user_id>", methods=["GET"])
-def get_user(user_id):
+def handle_get_user(req, user_id):
     try:
         user = DBOPR.get_user_by_id(user_id)
         if user is not None:
-            logging.debug(f"User found: {user}")
-            return jsonify(user), 200
+            logging.debug("User found: %s", user_id)
+            return user, 200
         else:
-            logging.warning(f"User not found with ID: {user_id}")
-            return jsonify({"error": "User not found"}), 404
+            logging.warning("User not found with ID: %s", user_id)
+            return {"error": "User not found"}, 404
     except Exception as e:
-        logging.error(f"Exception in /api/get-user: {str(e)}")
-        return jsonify({"error": "Internal server error"}), 500
+        logging.error("Exception in /api/get-user: %s", e)
+        return {"error": "Internal server error"}, 500
+
+# Flask routes. asgi.py serves the same handlers under Quart.
+
+@app.route("/api/init-chat", methods=["POST"])
+def init_chat():
+    return respond(PIPELINE_LOOP.run(handle_init_chat(incoming())))
+
+@app.route("/api/generate-answer", methods=["POST"])
+def generate_answer():
+    return respond(PIPELINE_LOOP.run(handle_generate_answer(incoming())))
+
+@app.route("/api/media-job/<job_id>", methods=["GET"])
+def media_job_status(job_id):
+    return handle_media_job(incoming(), job_id)
+
+@app.route("/media/<name>", methods=["GET"])
+def get_media(name):
+    from services.media_store import CACHE_MAX_AGE, content_type_for
+
+    location = locate_media(name)
+    if location is None:
+        return {"error": "Media not found"}, 404
+    path, signed_url = location
+    if signed_url:
+        return redirect(signed_url)
+    # conditional=True answers If-None-Match and Range requests.
+    response = send_file(
+        path, mimetype=content_type_for(name), conditional=True, etag=name.split(".")[0], max_age=CACHE_MAX_AGE
+    )
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route("/api/history", methods=["POST"])
+def chat_history():
+    return handle_chat_history(incoming())
+
+@app.route("/api/clear-history", methods=["POST"])
+def clear_history():
+    return handle_clear_history(incoming())
+
+@app.route("/api/delete-chat", methods=["POST"])
+def delete_chat():
+    return handle_delete_chat(incoming())
+
+@app.route("/signup", methods=["POST"])
+def signup():
+    return handle_signup(incoming())
+
+@app.route("/login", methods=["POST"])
+def login():
+    return handle_login(incoming())
+
+@app.route("/logout", methods=["POST"])
+def logout():
+    return handle_logout(incoming())
+
+@app.route("/api/get-users", methods=["GET"])
+def get_users():
+    return respond(handle_get_users(incoming()))
+
+@app.route("/api/export-chats", methods=["GET"])
+def export_chats():
+    return respond(handle_export_chats(incoming()))
+
+@app.route("/api/get-chats/<user_id>", methods=["GET"])
+def get_chats(user_id):
+    return handle_get_chats(incoming(), user_id)
+
+@app.route("/api/get-chat/<chat_id>", methods=["GET"])
+def get_chat_by_id(chat_id):
+    return handle_get_chat(incoming(), chat_id)
+
+@app.route("/api/get-user-chats/<user_id>", methods=["GET"])
+def get_user_chats(user_id):
+    return handle_get_user_chats(incoming(), user_id)
+
+@app.route("/api/get-user/<user_id>", methods=["GET"])
+def get_user(user_id):
+    return handle_get_user(incoming(), user_id)
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5000)
@@ -0,0 +1,265 @@
+import os
+import time
+import asyncio
+import inspect
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from services.utils import load_env
+
+# Before the other imports: several modules read their settings at import.
+load_env()
+
+from quart import Quart, Response, g, redirect, request, send_file, session
+from quart_cors import cors
+from app import (
+    ADMITTED_ENDPOINTS,
+    DBOPR,
+    admit,
+    begin_request,
+    handle_cache_stats,
+    handle_chat_history,
+    handle_clear_history,
+    handle_delete_chat,
+    handle_export_chats,
+    handle_generate_answer,
+    handle_get_chat,
+    handle_get_chats,
+    handle_get_user,
+    handle_get_user_chats,
+    handle_get_users,
+    handle_init_chat,
+    handle_login,
+    handle_logout,
+    handle_media_job,
+    handle_metrics,
+    handle_signup,
+    handle_upstream_stats,
+    locate_media,
+    reply_headers,
+)
+from services.admission import client_ip
+from services.handler import INCOMING, STREAM
+from services.metrics import REGISTRY, REQUEST_SECONDS, stats_collector
+from services.usage import TOTALS
+
+# The Quart app serves app.py's handlers; only the request plumbing lives
+# here. The chat handlers are coroutines and run on the event loop; the rest
+# block (Mongo, password hashing), so they run on a bounded pool.
+ASGI_WORKERS = int(os.getenv("ASGI_WORKERS", "64"))
+WORKERS = ThreadPoolExecutor(max_workers=ASGI_WORKERS, thread_name_prefix="asgi")
+
+app = Quart(__name__)
+app = cors(app, allow_credentials=True, allow_origin=["https://www.speakimage.ai", "http://localhost:3000"])
+
+app.secret_key = os.getenv("SECRET_KEY")
+app.permanent_session_lifetime = timedelta(days=15)
+app.config["SECRET_KEY"] = os.getenv("SECRET_KEY")
+app.config["SESSION_COOKIE_HTTPONLY"] = False
+app.config["SESSION_COOKIE_SECURE"] = True
+app.config["SESSION_COOKIE_SAMESITE"] = "None"
+
+
+class IN_FLIGHT:
+    def __init__(self, asgi_app):
+        self.asgi_app = asgi_app
+        self.current = 0
+        self.peak = 0
+        self.total = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.asgi_app(scope, receive, send)
+        self.current += 1
+        self.total += 1
+        self.peak = max(self.peak, self.current)
+        try:
+            await self.asgi_app(scope, receive, send)
+        finally:
+            self.current -= 1
+
+    def stats(self):
+        return {"in_flight": self.current, "peak_in_flight": self.peak, "requests": self.total}
+
+
+INFLIGHT = IN_FLIGHT(app.asgi_app)
+app.asgi_app = INFLIGHT
+
+REGISTRY.register_collector(stats_collector("speakimage_asgi", INFLIGHT.stats))
+
+
+async def incoming():
+    return INCOMING(await request.get_json(silent=True), request.args, request.headers, session)
+
+async def stream_chunks(context, chunks):
+    done = object()
+    pending = None
+    try:
+        while True:
+            pending = WORKERS.submit(context.run, next, chunks, done)
+            chunk = await asyncio.wrap_future(pending)
+            if chunk is done:
+                return
+            yield chunk
+    finally:
+        # Also when the client goes away mid-stream: close the generator
+        # (which records its usage) once the chunk in progress is done.
+        if pending is not None:
+            pending.add_done_callback(lambda _: WORKERS.submit(context.run, chunks.close))
+
+async def run(handler, *args):
+    if inspect.iscoroutinefunction(handler):
+        # Runs in this request's context, like the hooks below.
+        reply = await handler(*args)
+        context = None
+    else:
+        # In a copy of this request's context, so the handler sees the usage
+        # record, trace and admission client set by the hooks below.
+        context = contextvars.copy_context()
+        loop = asyncio.get_running_loop()
+        reply = await loop.run_in_executor(WORKERS, functools.partial(context.run, handler, *args))
+    if isinstance(reply, STREAM):
+        g.streamed = True
+        chunks = reply.chunks if inspect.isasyncgen(reply.chunks) else stream_chunks(context, reply.chunks)
+        return Response(chunks, mimetype=reply.mimetype, headers=reply.headers)
+    return reply
+
+@app.before_request
+async def start_request_state():
+    g.request_started = time.perf_counter()
+    begin_request()
+
+@app.before_request
+async def admit_request():
+    # The same limits as the Flask app; the image budget and the upstream
+    # gate are applied inside the shared handlers.
+    if request.endpoint not in ADMITTED_ENDPOINTS:
+        return None
+    # Keyed on the session, not the unauthenticated user_id in the body.
+    return admit(session.get("email"), client_ip(request.headers, request.remote_addr))
+
+@app.after_request
+async def finish_response(response):
+    started = g.get("request_started")
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        REQUEST_SECONDS.observe(
+            time.perf_counter() - started, request.method, route, str(response.status_code)
+        )
+    response.headers.update(reply_headers(g.get("streamed", False)))
+    return response
+
+@app.route("/api/health", methods=["GET"])
+async def health_check():
+    return {"status": "healthy"}, 200
+
+@app.route("/api/async-stats", methods=["GET"])
+async def async_stats():
+    return INFLIGHT.stats(), 200
+
+@app.route("/api/db-pool-stats", methods=["GET"])
+async def db_pool_stats():
+    return await run(DBOPR.pool_stats), 200
+
+@app.route("/api/openai-usage", methods=["GET"])
+async def openai_usage():
+    return TOTALS.snapshot(), 200
+
+@app.route("/api/cache-stats", methods=["GET"])
+async def cache_stats():
+    return await run(handle_cache_stats)
+
+@app.route("/api/upstream-stats", methods=["GET"])
+async def upstream_status():
+    return await run(handle_upstream_stats)
+
+@app.route("/api/metrics", methods=["GET"])
+async def metrics():
+    return await run(handle_metrics)
+
+@app.route("/")
+async def home():
+    return {"message": "Welcome to the Speak Image Backend!"}
+
+@app.route("/api/init-chat", methods=["POST"])
+async def init_chat():
+    return await run(handle_init_chat, await incoming())
+
+@app.route("/api/generate-answer", methods=["POST"])
+async def generate_answer():
+    return await run(handle_generate_answer, await incoming())
+
+@app.route("/api/media-job/<job_id>", methods=["GET"])
+async def media_job_status(job_id):
+    return await run(handle_media_job, await incoming(), job_id)
+
+@app.route("/media/<name>", methods=["GET"])
+async def get_media(name):
+    from services.media_store import CACHE_MAX_AGE, content_type_for
+
+    location = await run(locate_media, name)
+    if location is None:
+        return {"error": "Media not found"}, 404
+    path, signed_url = location
+    if signed_url:
+        return redirect(signed_url)
+    response = await send_file(path, mimetype=content_type_for(name), conditional=True, cache_timeout=CACHE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route("/api/history", methods=["POST"])
+async def chat_history():
+    return await run(handle_chat_history, await incoming())
+
+@app.route("/api/clear-history", methods=["POST"])
+async def clear_history():
+    return await run(handle_clear_history, await incoming())
+
+@app.route("/api/delete-chat", methods=["POST"])
+async def delete_chat():
+    return await run(handle_delete_chat, await incoming())
+
+@app.route("/signup", methods=["POST"])
+async def signup():
+    return await run(handle_signup, await incoming())
+
+@app.route("/login", methods=["POST"])
+async def login():
+    return await run(handle_login, await incoming())
+
+@app.route("/logout", methods=["POST"])
+async def logout():
+    return await run(handle_logout, await incoming())
+
+@app.route("/api/get-users", methods=["GET"])
+async def get_users():
+    return await run(handle_get_users, await incoming())
+
+@app.route("/api/export-chats", methods=["GET"])
+async def export_chats():
+    return await run(handle_export_chats, await incoming())
+
+@app.route("/api/get-chats/<user_id>", methods=["GET"])
+async def get_chats(user_id):
+    return await run(handle_get_chats, await incoming(), user_id)
+
+@app.route("/api/get-chat/<chat_id>", methods=["GET"])
+async def get_chat_by_id(chat_id):
+    return await run(handle_get_chat, await incoming(), chat_id)
+
+@app.route("/api/get-user-chats/<user_id>", methods=["GET"])
+async def get_user_chats(user_id):
+    return await run(handle_get_user_chats, await incoming(), user_id)
+
+@app.route("/api/get-user/<user_id>", methods=["GET"])
+async def get_user(user_id):
+    return await run(handle_get_user, await incoming(), user_id)
+
+@app.after_serving
+async def stop_workers():
+    WORKERS.shutdown(wait=False)
+
+if __name__ == "__main__":
+    app.run(host="0.0.0.0", port=5000)
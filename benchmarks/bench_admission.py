@@ -0,0 +1,92 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import threading
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.report import percentile
+from services.admission import BACKGROUND, FOREGROUND, MEMORY_BUCKETS, SQLITE_BUCKETS, UPSTREAM_GATE, set_priority
+
+
+def take_throughput(backend, takes, keys):
+    started = time.perf_counter()
+    for i in range(takes):
+        backend.take(f"user:{i % keys}", 1.0, 1.0, 10.0)
+    elapsed = time.perf_counter() - started
+    return {"takes_per_s": round(takes / elapsed), "mean_us": round(elapsed / takes * 1e6, 1)}
+
+
+def _drain(path, takes, results):
+    backend = SQLITE_BUCKETS(path)
+    # Refill is negligible over the run, so only the burst can be spent.
+    allowed = sum(1 for _ in range(takes) if not backend.take("user:shared", 1.0, 1e-6, 100.0))
+    results.put(allowed)
+
+
+def shared_bucket(path, processes, takes):
+    # Every process spends from the same bucket; across all of them exactly
+    # the burst capacity (100) may be admitted.
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_drain, args=(path, takes, results)) for _ in range(processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    allowed = sum(results.get() for _ in workers)
+    return {"processes": processes, "attempts": processes * takes, "allowed": allowed, "expected": 100}
+
+
+def gate_burst(max_in_flight, callers, service_s, background_share):
+    # A short burst of callers over the cap: all are served, foreground first.
+    gate = UPSTREAM_GATE(max_in_flight, max_wait=60.0)
+    waits = {FOREGROUND: [], BACKGROUND: []}
+    lock = threading.Lock()
+
+    def one(index):
+        priority = BACKGROUND if index % round(1 / background_share) == 0 else FOREGROUND
+        set_priority(priority)
+        started = time.perf_counter()
+        with gate.slot():
+            waited = time.perf_counter() - started
+            time.sleep(service_s)
+        with lock:
+            waits[priority].append(waited)
+
+    with ThreadPoolExecutor(max_workers=callers) as pool:
+        list(pool.map(one, range(callers)))
+    report = {"max_in_flight": max_in_flight, "callers": callers, "gate": gate.stats()}
+    for priority, name in ((FOREGROUND, "foreground"), (BACKGROUND, "background")):
+        values = sorted(waits[priority])
+        report[name] = {
+            "calls": len(values),
+            "p50_wait_s": round(percentile(values, 50), 4) if values else None,
+            "p95_wait_s": round(percentile(values, 95), 4) if values else None,
+        }
+    return report
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Rate limiter backends and the upstream concurrency gate.")
+    parser.add_argument("--takes", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=1000)
+    parser.add_argument("--processes", type=int, default=4)
+    parser.add_argument("--callers", type=int, default=64)
+    parser.add_argument("--max-in-flight", type=int, default=8)
+    args = parser.parse_args(argv)
+    directory = tempfile.mkdtemp(prefix="speakimage-admission-")
+    report = {
+        "memory": take_throughput(MEMORY_BUCKETS(), args.takes, args.keys),
+        "sqlite": take_throughput(SQLITE_BUCKETS(os.path.join(directory, "bench.sqlite3")), args.takes, args.keys),
+        "sqlite_shared": shared_bucket(os.path.join(directory, "shared.sqlite3"), args.processes, 100),
+        "gate": gate_burst(args.max_in_flight, args.callers, 0.05, 0.25),
+    }
+    print(json.dumps(report, indent=2))
+    return 0 if report["sqlite_shared"]["allowed"] == report["sqlite_shared"]["expected"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,74 @@
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+
+os.environ.setdefault("MONGO_URL_STATIC", "mongomock://localhost")
+
+from db.operations import BUCKETED, DB_OPERATOR
+from db.utils import get_curr_timestamp
+
+
+def make_message(turn):
+    return {
+        "query": f"Question number {turn}: how is life on Mars compared to Earth?",
+        "response": {
+            "text": "Mars is a cold desert world with a thin atmosphere. " * 30,
+            "dalle_image": None,
+            "pixabay_img": "https://cdn.pixabay.com/photo/example.jpg",
+            "pixabay_video": None,
+        },
+        "timestamp": get_curr_timestamp(),
+    }
+
+
+def timed(fn, *args, **kwargs):
+    started = time.perf_counter()
+    fn(*args, **kwargs)
+    return (time.perf_counter() - started) * 1000
+
+
+def summarize(samples):
+    return {
+        "mean_ms": round(statistics.mean(samples), 3),
+        "p50_ms": round(statistics.median(samples), 3),
+        "max_ms": round(max(samples), 3),
+    }
+
+
+def run_layout(storage, turns, reads):
+    operator = DB_OPERATOR(storage=storage)
+    thread_id = operator.init_chat_in_db("bench-user", "bench", make_message(0))
+    try:
+        appends = [timed(operator.add_message, thread_id, make_message(turn)) for turn in range(1, turns)]
+        full_reads = [timed(operator.get_history, thread_id) for _ in range(reads)]
+        page_reads = [timed(operator.get_history_page, thread_id, 0, 20) for _ in range(reads)]
+    finally:
+        operator.delete_chat(thread_id)
+    return {
+        "storage": storage,
+        "turns": turns,
+        "append": summarize(appends) if appends else None,
+        "read_full": summarize(full_reads),
+        "read_newest_20": summarize(page_reads),
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Compare embedded vs bucketed chat storage.")
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument("--reads", type=int, default=20)
+    args = parser.parse_args(argv)
+    results = [
+        run_layout(storage, turns, args.reads)
+        for turns in args.turns
+        for storage in ("embedded", BUCKETED)
+    ]
+    print(json.dumps({"mongo": os.environ["MONGO_URL_STATIC"].split("@")[-1], "results": results}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
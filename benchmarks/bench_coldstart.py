@@ -0,0 +1,111 @@
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import statistics
+import subprocess
+
+# Runs in a fresh interpreter, like a serverless cold start.
+PROBE = """
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+response = app.app.test_client().get("/api/health")
+served = time.perf_counter()
+heavy = [name for name in ("openai", "pymongo", "requests", "httpx", "pydantic") if name in __import__("sys").modules]
+print(json.dumps({
+    "import_s": imported - started,
+    "first_health_s": served - imported,
+    "status": response.status_code,
+    "heavy_modules_loaded": heavy,
+}))
+"""
+
+
+def probe_env():
+    env = dict(os.environ)
+    env.setdefault("MONGO_URL_STATIC", "mongomock://localhost")
+    env.setdefault("OPENAI_API_KEY", "cold-start")
+    env.setdefault("PIXABAY_API_KEY", "cold-start")
+    env.setdefault("SECRET_KEY", "cold-start")
+    env.setdefault("PIXABAY_CACHE_PATH", "")
+    return env
+
+
+def cold_start(tree):
+    started = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", PROBE], cwd=tree, env=probe_env(), capture_output=True, text=True, check=True
+    )
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["process_s"] = time.perf_counter() - started
+    return result
+
+
+def measure(tree, runs):
+    samples = [cold_start(tree) for _ in range(runs)]
+    summary = {
+        key: round(statistics.median(sample[key] for sample in samples), 4)
+        for key in ("import_s", "first_health_s", "process_s")
+    }
+    summary["heavy_modules_loaded"] = samples[-1]["heavy_modules_loaded"]
+    return summary
+
+
+def import_profile(tree, top):
+    # -X importtime lines: "import time: self [us] | cumulative | package".
+    out = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app"],
+        cwd=tree,
+        env=probe_env(),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    rows = []
+    children = []
+    for line in out.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line[len("import time:") :].split("|")
+        # Nested imports are indented two more spaces per level and are
+        # printed before the module that imported them.
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        row = {"module": name.strip(), "cumulative_ms": round(int(cumulative_us) / 1000, 1)}
+        if depth == 1:
+            children.append(row)
+        elif depth == 0:
+            if row["module"] == "app":
+                rows = [row] + children
+            children = []
+    return sorted(rows, key=lambda row: row["cumulative_ms"], reverse=True)[: top + 1]
+
+
+def export_ref(ref):
+    tree = tempfile.mkdtemp(prefix="speakimage-coldstart-")
+    archive = subprocess.run(["git", "archive", ref], capture_output=True, check=True).stdout
+    subprocess.run(["tar", "-x", "-C", tree], input=archive, check=True)
+    return tree
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Cold-start cost of importing app.py and serving /api/health.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--baseline-ref", help="git ref to compare against, e.g. HEAD~1")
+    parser.add_argument("--top", type=int, default=15, help="top-level imports to list from -X importtime")
+    args = parser.parse_args(argv)
+    tree = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    report = {"current": measure(tree, args.runs), "imports": import_profile(tree, args.top)}
+    if args.baseline_ref:
+        baseline = measure(export_ref(args.baseline_ref), args.runs)
+        report["baseline"] = dict(baseline, ref=args.baseline_ref)
+        report["import_saved_s"] = round(baseline["import_s"] - report["current"]["import_s"], 4)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,67 @@
+import sys
+import json
+import argparse
+
+from services import context
+from services.context import count_tokens, pack_context, summary_range, turn_messages, message_tokens, unsummarized
+
+ANSWER = "Mars is a cold desert world with a thin carbon dioxide atmosphere, dusty red plains and polar ice caps. " * 8
+SUMMARY = "The user is planning a school talk about Mars and asked about its climate, moons and rovers. " * 5
+
+
+def make_turn(index):
+    return {
+        "query": f"Follow-up question number {index}: how does that compare with Earth and why?",
+        "response": {"text": ANSWER},
+    }
+
+
+def turn_tokens(turn):
+    return sum(message_tokens(message) for message in turn_messages(turn))
+
+
+def simulate(length, budget):
+    turns = [make_turn(i) for i in range(length)]
+    naive = []
+    engine = []
+    history_tokens = 0
+    summarized = 0
+    for index, turn in enumerate(turns):
+        query_tokens = count_tokens(turn["query"])
+        # Naive: the whole conversation array on every turn.
+        naive.append(history_tokens + query_tokens)
+        recent = list(reversed(turns[max(0, index - context.CONTEXT_READ_TURNS) : index]))
+        recent = unsummarized(recent, index, summarized)
+        _, used = pack_context(SUMMARY if summarized else None, recent, budget)
+        engine.append(used + query_tokens)
+        history_tokens += turn_tokens(turn)
+        folded = summary_range(index + 1, summarized)
+        if folded is not None:
+            summarized = folded[1]
+    return {
+        "turns": length,
+        "naive_mean_tokens": round(sum(naive) / length),
+        "naive_last_turn_tokens": naive[-1],
+        "engine_mean_tokens": round(sum(engine) / length),
+        "engine_last_turn_tokens": engine[-1],
+        "saved_ratio": round(1 - sum(engine) / sum(naive), 4) if sum(naive) else 0.0,
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Prompt tokens sent per turn, full history vs context engine.")
+    parser.add_argument("--lengths", default="10,50,200")
+    parser.add_argument("--budget", type=int, default=context.CONTEXT_TOKEN_BUDGET)
+    args = parser.parse_args(argv)
+    report = {
+        "tokenizer": "tiktoken" if context._get_encoder() else "heuristic",
+        "budget": args.budget,
+        "max_turns": context.CONTEXT_MAX_TURNS,
+        "threads": [simulate(int(length), args.budget) for length in args.lengths.split(",")],
+    }
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,99 @@
+import os
+import sys
+import json
+import uuid
+import argparse
+import tracemalloc
+
+os.environ.setdefault("MONGO_URL_STATIC", "mongomock://localhost")
+
+from services.export import NDJSON, export_chunks
+
+
+def make_user(index):
+    return {
+        "_id": uuid.uuid4().hex,
+        "email": f"user{index}@example.com",
+        "password": "scrypt:32768:8:1$" + "x" * 150,
+        "full_name": f"Example User {index}",
+    }
+
+
+def generated_users(count):
+    # Stands in for a server-side cursor: one document alive at a time.
+    for index in range(count):
+        user = make_user(index)
+        user.pop("password")
+        yield user
+
+
+def peak_kib(fn):
+    tracemalloc.start()
+    try:
+        fn()
+        return round(tracemalloc.get_traced_memory()[1] / 1024, 1)
+    finally:
+        tracemalloc.stop()
+
+
+def drain(chunks):
+    size = 0
+    for chunk in chunks:
+        size += len(chunk)
+    return size
+
+
+def encoder_only(counts):
+    results = []
+    for count in counts:
+        results.append(
+            {
+                "docs": count,
+                "list_and_dumps_peak_kib": peak_kib(lambda: json.dumps(list(generated_users(count)))),
+                "streaming_peak_kib": peak_kib(lambda: drain(export_chunks(generated_users(count), NDJSON))),
+            }
+        )
+    return results
+
+
+def end_to_end(counts, batch_size):
+    from db.operations import DB_OPERATOR
+
+    operator = DB_OPERATOR()
+    results = []
+    for count in counts:
+        with operator.user_db:
+            operator.user_db.remove_all()
+            operator.user_db.insert_documents([make_user(i) for i in range(count)])
+        results.append(
+            {
+                "docs": count,
+                "get_users_peak_kib": peak_kib(lambda: json.dumps(operator.get_users())),
+                "iter_users_peak_kib": peak_kib(
+                    lambda: drain(export_chunks(operator.iter_users(batch_size=batch_size), NDJSON))
+                ),
+            }
+        )
+    return results
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Peak memory of list-based vs streaming user export.")
+    parser.add_argument("--counts", default="10000,100000")
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument(
+        "--mongo", action="store_true", help="also export through DB_OPERATOR (MONGO_URL_STATIC, mongomock by default)"
+    )
+    args = parser.parse_args(argv)
+    counts = [int(c) for c in args.counts.split(",")]
+    report = {"encoder": encoder_only(counts)}
+    if args.mongo:
+        # mongomock sorts in memory, so its own copy of the collection shows
+        # up in both columns; against a real server only the batch does.
+        report["mongo"] = end_to_end(counts, args.batch_size)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
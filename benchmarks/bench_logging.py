@@ -0,0 +1,80 @@
+import io
+import sys
+import json
+import time
+import logging
+import argparse
+
+from services.logs import configure_logging, start_log_sampling, stop_logging
+
+# Shapes similar to what the request handlers log: a completion message, a
+# user record and the request body.
+MESSAGE = {
+    "role": "assistant",
+    "content": "Mars is a cold desert world with a thin atmosphere. " * 40,
+    "tool_calls": [{"id": f"call_{i}", "function": {"name": "generate_image", "arguments": "{}"}} for i in range(3)],
+}
+USER = {"_id": "0" * 32, "email": "user@example.com", "full_name": "Example User", "password": "scrypt:" + "x" * 160}
+BODY = {"query": "How is life on Mars?", "thread_id": "6650f0c2a1b2c3d4e5f60718"}
+
+
+def eager_request():
+    logging.debug(f"user query: {BODY['query']}")
+    logging.info(f"Received Query: {BODY['query']} | Thread ID: {BODY['thread_id']}")
+    logging.debug(f"MESSAGE: {MESSAGE}")
+    logging.debug(f"User found: {USER}")
+    logging.debug(f"Thread ID: {BODY['thread_id']}")
+    for _ in range(3):
+        logging.debug(f"Matched {1} document(s) and modified {1} document(s).")
+
+
+def lazy_request():
+    start_log_sampling()
+    logging.debug("user query: %s", BODY["query"])
+    logging.info("Received Query: %s | Thread ID: %s", BODY["query"], BODY["thread_id"])
+    logging.debug("MESSAGE: %s", MESSAGE)
+    logging.debug("User found: %s", USER["_id"])
+    logging.debug("Thread ID: %s", BODY["thread_id"])
+    for _ in range(3):
+        logging.debug("Matched %s document(s) and modified %s document(s).", 1, 1)
+
+
+def cpu_per_request(fn, iterations):
+    started = time.process_time()
+    for _ in range(iterations):
+        fn()
+    return (time.process_time() - started) / iterations * 1e6
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Per-request CPU cost of request-path logging.")
+    parser.add_argument("--iterations", type=int, default=20000)
+    args = parser.parse_args(argv)
+    sink = io.StringIO()
+
+    # Before: basicConfig(DEBUG) writing synchronously with eager f-strings.
+    logging.basicConfig(level=logging.DEBUG, stream=sink, force=True)
+    baseline = cpu_per_request(eager_request, args.iterations)
+
+    # After: LOG_LEVEL=INFO, lazy args, queue handler with a listener thread.
+    logging.getLogger().handlers.clear()
+    configure_logging(level=logging.INFO, stream=sink)
+    lazy = cpu_per_request(lazy_request, args.iterations)
+    stop_logging()
+
+    print(
+        json.dumps(
+            {
+                "iterations": args.iterations,
+                "eager_debug_us_per_request": round(baseline, 2),
+                "lazy_queue_info_us_per_request": round(lazy, 2),
+                "saved_us_per_request": round(baseline - lazy, 2),
+            },
+            indent=2,
+        )
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
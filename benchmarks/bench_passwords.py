@@ -0,0 +1,55 @@
+import os
+import sys
+import json
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+from services.passwords import DEFAULT_METHOD, PASSWORD_HASHER
+
+PASSWORD = "correct horse battery staple"
+
+
+def logins_per_second(hasher, hashed, logins, clients):
+    # Each "login" is one verify, issued from `clients` request threads.
+    hasher.verify(hashed, PASSWORD)  # start the workers
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        results = list(pool.map(lambda _: hasher.verify(hashed, PASSWORD), range(logins)))
+    elapsed = time.perf_counter() - started
+    assert all(results)
+    return logins / elapsed
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Login throughput of the password hashing pool.")
+    parser.add_argument("--method", default=os.getenv("PASSWORD_HASH_METHOD", DEFAULT_METHOD))
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--clients", type=int, default=32, help="concurrent request threads")
+    parser.add_argument("--mode", default="process", choices=["process", "thread", "inline"])
+    parser.add_argument(
+        "--workers", default=None, help="comma separated worker counts (default: 1 and the core count)"
+    )
+    args = parser.parse_args(argv)
+    cores = os.cpu_count() or 1
+    workers = [int(w) for w in args.workers.split(",")] if args.workers else sorted({1, cores})
+
+    hashed = PASSWORD_HASHER(method=args.method, mode="inline").hash(PASSWORD)
+    results = []
+    for count in workers:
+        hasher = PASSWORD_HASHER(method=args.method, max_workers=count, mode=args.mode, timeout=600)
+        rate = logins_per_second(hasher, hashed, args.logins, args.clients)
+        results.append(
+            {
+                "workers": count,
+                "mode": hasher.mode,
+                "logins_per_sec": round(rate, 1),
+                "logins_per_sec_per_core": round(rate / min(count, cores), 1),
+            }
+        )
+    print(json.dumps({"method": args.method, "cores": cores, "logins": args.logins, "results": results}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
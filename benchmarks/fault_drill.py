@@ -0,0 +1,112 @@
+import sys
+import json
+import time
+import asyncio
+import argparse
+
+import httpx
+
+from benchmarks.report import metadata, summarize, write_report
+from benchmarks.stubs import parse_faults, start_stub_server
+from services.upstream import CIRCUIT_BREAKER, UPSTREAM, CircuitOpen, DeadlineExceeded, deadline
+
+# Each drill runs the upstream layer against its own fault-injecting stub
+# and reports latency and outcomes under that fault. The behaviour the layer
+# promises is asserted in tests/test_upstream.py.
+BODY = json.dumps({"model": "gpt-4o", "prompt": "drill", "messages": [{"role": "user", "content": "drill"}]})
+DRILLS = {
+    "retry": {"faults": "openai=error:0.3:503", "path": "/v1/chat/completions"},
+    "rate-limit": {"faults": "openai=error:0.5:429", "path": "/v1/chat/completions"},
+    "breaker": {"faults": "dalle=error:1:503", "path": "/v1/images/generations"},
+    "deadline": {"faults": "pixabay=hang:1:5", "path": "/pixabay/", "deadline": 1.0},
+    "hedge": {"faults": "pixabay=hang:0.1:2", "path": "/pixabay/", "hedge_after": 0.25},
+}
+
+
+async def request(client, url, timeout):
+    if "pixabay" in url:
+        response = await client.get(url, timeout=timeout)
+    else:
+        response = await client.post(url, content=BODY, timeout=timeout)
+    # HTTPStatusError carries the response, so the upstream layer sees its
+    # status and Retry-After like it does for the real clients.
+    response.raise_for_status()
+    return response.json()
+
+
+def make_upstream(name):
+    return UPSTREAM(
+        name,
+        timeout=10.0,
+        retries=2,
+        backoff=0.05,
+        max_backoff=1.0,
+        breaker=CIRCUIT_BREAKER(name, failure_threshold=5, reset_timeout=60.0),
+    )
+
+
+async def drive(upstream, spec, stub_url, calls, concurrency):
+    # Runs the calls with at most `concurrency` in flight; returns each
+    # call's latency and outcome (200, an HTTP status or a failure name).
+    latencies = []
+    outcomes = []
+    slots = asyncio.Semaphore(concurrency)
+
+    async def one(client):
+        async with slots:
+            started = time.perf_counter()
+            try:
+                with deadline(spec.get("deadline")):
+                    if spec.get("hedge_after"):
+                        await upstream.hedged(spec["hedge_after"], request, client, stub_url + spec["path"])
+                    else:
+                        await upstream.call(request, client, stub_url + spec["path"])
+                outcome = 200
+            except CircuitOpen:
+                outcome = "circuit_open"
+            except DeadlineExceeded:
+                outcome = "deadline"
+            except httpx.HTTPStatusError as e:
+                outcome = e.response.status_code
+            except Exception as e:
+                outcome = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            outcomes.append(outcome)
+
+    limits = httpx.Limits(max_connections=2 * concurrency)
+    async with httpx.AsyncClient(limits=limits) as client:
+        await asyncio.gather(*(one(client) for _ in range(calls)))
+    return latencies, outcomes
+
+
+def run_drill(name, spec, calls, concurrency):
+    _, stub_url = start_stub_server(faults=parse_faults(spec["faults"]))
+    upstream = make_upstream(name)
+    started = time.perf_counter()
+    latencies, outcomes = asyncio.run(drive(upstream, spec, stub_url, calls, concurrency))
+    result = summarize(latencies, outcomes, time.perf_counter() - started)
+    result["faults"] = spec["faults"]
+    result["upstream"] = upstream.stats()
+    return result
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(
+        description="Upstream layer under injected faults: retries, breakers, deadlines, hedging."
+    )
+    parser.add_argument("--drills", default=",".join(DRILLS))
+    parser.add_argument("--calls", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--output", help="also write the JSON report here")
+    args = parser.parse_args(argv)
+    results = {
+        name: run_drill(name, DRILLS[name], args.calls, args.concurrency)
+        for name in filter(None, args.drills.split(","))
+    }
+    report = {"meta": metadata(calls=args.calls, concurrency=args.concurrency), "drills": results}
+    write_report(report, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from benchmarks.load_async import configure_env
+from benchmarks.report import compare, metadata, summarize, write_report
+from benchmarks.stubs import parse_faults, parse_latency, start_stub_server
+
+SCENARIOS = ("init-chat", "generate-answer", "history", "login")
+EMAIL = "load-test@example.com"
+PASSWORD = "load-test-password"
+USER_ID = "load-test"
+
+
+def start_app(port):
+    from werkzeug.serving import make_server
+    from app import app
+
+    server = make_server("127.0.0.1", port, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{port}"
+
+
+def setup(http):
+    http.post("/signup", json={"email": EMAIL, "password": PASSWORD, "full_name": "Load Test"})
+    response = http.post("/api/init-chat", json={"query": "How is life on Mars?", "user_id": USER_ID})
+    response.raise_for_status()
+    thread_id = response.json()["thread_id"]
+    # Give the history scenario a realistic amount of turns to read.
+    for turn in range(20):
+        http.post("/api/generate-answer", json={"query": f"Tell me more, part {turn}", "thread_id": thread_id})
+    return {"thread_id": thread_id}
+
+
+def build_request(name, index, context):
+    # Queries differ per request so the response cache and single-flight do
+    # not turn the run into a cache benchmark.
+    if name == "init-chat":
+        return "/api/init-chat", {"query": f"How is life on planet number {index}?", "user_id": USER_ID}
+    if name == "generate-answer":
+        return "/api/generate-answer", {"query": f"What about moon number {index}?", "thread_id": context["thread_id"]}
+    if name == "history":
+        return "/api/history", {"thread_id": context["thread_id"]}
+    if name == "login":
+        return "/login", {"email": EMAIL, "password": PASSWORD}
+    raise ValueError(f"Unknown scenario: {name}")
+
+
+def run_scenario(http, name, requests, concurrency, context):
+    latencies = []
+    statuses = []
+    lock = threading.Lock()
+
+    def one(index):
+        path, body = build_request(name, index, context)
+        started = time.perf_counter()
+        try:
+            status = http.post(path, json=body).status_code
+        except Exception as e:
+            status = type(e).__name__
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            statuses.append(status)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    return summarize(latencies, statuses, time.perf_counter() - started)
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="End-to-end load test of app.py against local stand-ins.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument(
+        "--latency",
+        default="openai=lognormal:0.6:0.4,dalle=uniform:4:8,pixabay=lognormal:0.15:0.3",
+        help='per-upstream latency, e.g. "openai=fixed:0.5,dalle=uniform:4:8" or one number',
+    )
+    parser.add_argument(
+        "--faults", default="", help='injected upstream faults, e.g. "dalle=error:1:503,pixabay=hang:0.2:10"'
+    )
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--output", help="also write the JSON report here")
+    parser.add_argument("--baseline", help="earlier report to compare against")
+    args = parser.parse_args(argv)
+    import httpx
+
+    _, stub_url = start_stub_server(parse_latency(args.latency), faults=parse_faults(args.faults))
+    configure_env(stub_url)
+    _, base_url = start_app(args.port)
+
+    results = {}
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    with httpx.Client(base_url=base_url, timeout=120, limits=limits) as http:
+        context = setup(http)
+        for name in filter(None, args.scenarios.split(",")):
+            results[name] = run_scenario(http, name, args.requests, args.concurrency, context)
+        upstream = http.get("/api/upstream-stats").json()
+
+    report = {
+        "meta": metadata(
+            requests=args.requests,
+            concurrency=args.concurrency,
+            latency=args.latency,
+            faults=args.faults,
+            mongo=os.environ.get("MONGO_URL_STATIC"),
+        ),
+        "scenarios": results,
+        "upstream": upstream,
+    }
+    if args.baseline:
+        with open(args.baseline) as f:
+            report["delta"] = compare(results, json.load(f).get("scenarios", {}))
+    write_report(report, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,97 @@
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import statistics
+
+from benchmarks.stubs import start_stub_server
+
+
+def configure_env(stub_url):
+    os.environ["OPENAI_API_KEY"] = "stub"
+    os.environ["OPENAI_BASE_URL"] = f"{stub_url}/v1"
+    os.environ["PIXABAY_API_KEY"] = "stub"
+    os.environ["PIXABAY_API_URL"] = f"{stub_url}/pixabay/"
+    os.environ["PIXABAY_CACHE_PATH"] = ""
+    os.environ["RESPONSE_CACHE_BACKEND"] = "off"
+    # Every load request comes from one user and one IP; the per-user and
+    # per-IP limits would turn the run into a 429 benchmark.
+    os.environ["ADMISSION_BACKEND"] = "off"
+    os.environ.setdefault("MONGO_URL_STATIC", "mongomock://localhost")
+    os.environ.setdefault("SECRET_KEY", "bench")
+
+
+async def run(args):
+    import httpx
+    from hypercorn.asyncio import serve
+    from hypercorn.config import Config
+    from asgi import app
+
+    config = Config()
+    config.bind = [f"127.0.0.1:{args.port}"]
+    config.accesslog = None
+    shutdown = asyncio.Event()
+    server = asyncio.create_task(serve(app, config, shutdown_trigger=shutdown.wait))
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as http:
+        for _ in range(100):
+            try:
+                await http.get("/api/health")
+                break
+            except httpx.TransportError:
+                await asyncio.sleep(0.05)
+
+        semaphore = asyncio.Semaphore(args.concurrency)
+        latencies = []
+
+        async def one(index):
+            async with semaphore:
+                started = time.perf_counter()
+                response = await http.post(
+                    "/api/init-chat",
+                    json={"query": f"How is life on planet number {index}?", "user_id": "load-test"},
+                )
+                latencies.append(time.perf_counter() - started)
+                return response.status_code
+
+        started = time.perf_counter()
+        statuses = await asyncio.gather(*(one(i) for i in range(args.requests)))
+        wall = time.perf_counter() - started
+        stats = (await http.get("/api/async-stats")).json()
+
+    shutdown.set()
+    await server
+    latencies.sort()
+    return {
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "upstream_latency_s": args.latency,
+        "ok": statuses.count(200),
+        "wall_s": round(wall, 3),
+        "rps": round(args.requests / wall, 2),
+        "p50_s": round(statistics.median(latencies), 3),
+        "p95_s": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        # The number that matters: simultaneous requests served by one process.
+        "peak_in_flight": stats["peak_in_flight"],
+    }
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Concurrent load test of the ASGI app against local stubs.")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--latency", type=float, default=0.5, help="seconds per stubbed upstream call")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args(argv)
+    latency = (args.latency, args.latency)
+    _, stub_url = start_stub_server({"openai": latency, "dalle": latency, "pixabay": latency})
+    configure_env(stub_url)
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,80 @@
+import sys
+import json
+import math
+import time
+import platform
+import subprocess
+
+PERCENTILES = (50, 95, 99)
+
+
+def percentile(sorted_values, p):
+    # Nearest-rank percentile of an already sorted list.
+    if not sorted_values:
+        return None
+    rank = max(1, math.ceil(p / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, statuses, wall):
+    latencies = sorted(latencies)
+    codes = {}
+    for status in statuses:
+        codes[str(status)] = codes.get(str(status), 0) + 1
+    summary = {
+        "requests": len(statuses),
+        "ok": sum(1 for status in statuses if isinstance(status, int) and status < 400),
+        "status_codes": codes,
+        "wall_s": round(wall, 3),
+        "rps": round(len(statuses) / wall, 2) if wall else None,
+        "mean_s": round(sum(latencies) / len(latencies), 4) if latencies else None,
+        "max_s": round(latencies[-1], 4) if latencies else None,
+    }
+    for p in PERCENTILES:
+        value = percentile(latencies, p)
+        summary[f"p{p}_s"] = round(value, 4) if value is not None else None
+    return summary
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def metadata(**extra):
+    return dict(
+        {
+            "commit": git_commit(),
+            "timestamp": int(time.time()),
+            "python": platform.python_version(),
+            "platform": sys.platform,
+        },
+        **extra,
+    )
+
+
+def compare(current, baseline, keys=("rps", "p50_s", "p95_s", "p99_s")):
+    # Relative change per scenario, e.g. {"init-chat": {"p95_s": -0.12}}.
+    delta = {}
+    for name, summary in current.items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        delta[name] = {
+            key: round((summary[key] - before[key]) / before[key], 4)
+            for key in keys
+            if summary.get(key) is not None and before.get(key)
+        }
+    return delta
+
+
+def write_report(report, path=None):
+    text = json.dumps(report, indent=2)
+    if path:
+        with open(path, "w") as f:
+            f.write(text + "\n")
+    print(text)
@@ -0,0 +1,226 @@
+import sys
+import json
+import time
+import uuid
+import math
+import random
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+IMAGE_URL = "http://{host}/images/{id}.png?se=2099-01-01T00:00:00Z"
+# A valid 1x1 PNG, served for every generated image URL.
+PNG_BYTES = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+UPSTREAMS = ("openai", "dalle", "pixabay")
+ANSWER = "Mars is a cold desert planet with a thin carbon dioxide atmosphere and dusty red plains."
+
+
+def sample_latency(spec):
+    # spec is (low, high) for a uniform draw, or a (kind, *params) tuple:
+    # ("fixed", s), ("uniform", low, high), ("normal", mean, stddev),
+    # ("lognormal", median, sigma).
+    if not spec:
+        return 0.0
+    if not isinstance(spec[0], str):
+        return random.uniform(*spec)
+    kind, *params = spec
+    if kind == "fixed":
+        return params[0]
+    if kind == "uniform":
+        return random.uniform(*params)
+    if kind == "normal":
+        return max(0.0, random.gauss(*params))
+    if kind == "lognormal":
+        median, sigma = params
+        return random.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+    raise ValueError(f"Unknown latency distribution: {kind}")
+
+
+def parse_latency(text):
+    # "openai=lognormal:0.8:0.5,dalle=uniform:6:12,pixabay=fixed:0.1"; a bare
+    # number applies a fixed latency to every upstream.
+    try:
+        return {upstream: ("fixed", float(text)) for upstream in UPSTREAMS}
+    except ValueError:
+        pass
+    latency = {}
+    for item in filter(None, text.split(",")):
+        upstream, _, spec = item.partition("=")
+        kind, *params = spec.split(":")
+        latency[upstream.strip()] = (kind, *map(float, params))
+    return latency
+
+
+def parse_faults(text):
+    # "openai=error:0.2:503,dalle=hang:0.1:30,pixabay=reset:0.5": each
+    # upstream fails a share of its requests with an HTTP status, a hang of
+    # N seconds, or a dropped connection.
+    faults = {}
+    for item in filter(None, (text or "").split(",")):
+        upstream, _, spec = item.partition("=")
+        kind, rate, *params = spec.split(":")
+        if kind not in ("error", "hang", "reset"):
+            raise ValueError(f"Unknown fault: {kind}")
+        faults[upstream.strip()] = (kind, float(rate), *map(float, params))
+    return faults
+
+
+def completion(body):
+    tool_names = [tool["function"]["name"] for tool in body.get("tools") or []]
+    query = body["messages"][-1]["content"]
+    tool_calls = []
+    content = ANSWER
+    if "get_answer" in tool_names:
+        content = None
+        tool_calls.append(("get_answer", {"query": query}))
+    if "generate_image" in tool_names:
+        tool_calls.append(("generate_image", {"description": f"Illustration of {query}"}))
+    message = {"role": "assistant", "content": content}
+    if tool_calls:
+        message["tool_calls"] = [
+            {
+                "id": f"call_{uuid.uuid4().hex[:12]}",
+                "type": "function",
+                "function": {"name": name, "arguments": json.dumps(args)},
+            }
+            for name, args in tool_calls
+        ]
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": body.get("model", "gpt-4o"),
+        "choices": [
+            {
+                "index": 0,
+                "message": message,
+                "finish_reason": "tool_calls" if tool_calls else "stop",
+            }
+        ],
+        "usage": {"prompt_tokens": 120, "completion_tokens": 60, "total_tokens": 180},
+    }
+
+
+def stream_chunks(payload):
+    message = payload["choices"][0]["message"]
+    base = {k: payload[k] for k in ("id", "created", "model")}
+    base["object"] = "chat.completion.chunk"
+    for word in (message.get("content") or "").split(" "):
+        yield dict(base, choices=[{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}])
+    for index, tool_call in enumerate(message.get("tool_calls") or []):
+        delta = {"tool_calls": [dict(tool_call, index=index)]}
+        yield dict(base, choices=[{"index": 0, "delta": delta, "finish_reason": None}])
+    yield dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": payload["choices"][0]["finish_reason"]}])
+
+
+class STUB_HANDLER(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    latency = {}
+    faults = {}
+
+    def log_message(self, format, *args):
+        pass
+
+    def _sleep(self, upstream):
+        time.sleep(sample_latency(self.latency.get(upstream)))
+
+    def _fault(self, upstream):
+        # True when a fault took the place of the normal response.
+        fault = self.faults.get(upstream)
+        if not fault or random.random() >= fault[1]:
+            return False
+        kind, _, *params = fault
+        if kind == "hang":
+            time.sleep(params[0] if params else 30.0)
+            return False
+        if kind == "reset":
+            self.close_connection = True
+            return True
+        status = int(params[0]) if params else 503
+        headers = {"Retry-After": "1"} if status == 429 else {}
+        self._send_json({"error": {"message": f"injected {status}", "type": "stub_fault"}}, status, headers)
+        return True
+
+    def _send_json(self, payload, status=200, headers=None):
+        raw = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(raw)))
+        self.end_headers()
+        self.wfile.write(raw)
+
+    def _send_stream(self, chunks):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        for chunk in chunks:
+            self.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length) or b"{}")
+        if path.endswith("/chat/completions"):
+            self._sleep("openai")
+            if self._fault("openai"):
+                return
+            payload = completion(body)
+            if body.get("stream"):
+                return self._send_stream(stream_chunks(payload))
+            return self._send_json(payload)
+        if path.endswith("/images/generations"):
+            self._sleep("dalle")
+            if self._fault("dalle"):
+                return
+            return self._send_json(
+                {
+                    "created": int(time.time()),
+                    "data": [{"url": IMAGE_URL.format(host=self.headers.get("Host"), id=uuid.uuid4().hex)}],
+                }
+            )
+        self._send_json({"error": {"message": f"unknown path {path}"}}, status=404)
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path.startswith("/images/"):
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(PNG_BYTES)))
+            self.end_headers()
+            self.wfile.write(PNG_BYTES)
+            return
+        if path.startswith("/pixabay"):
+            self._sleep("pixabay")
+            if self._fault("pixabay"):
+                return
+            if path.startswith("/pixabay/videos"):
+                return self._send_json({"hits": [{"videos": {"medium": {"url": "http://stub.local/video.mp4"}}}]})
+            return self._send_json({"hits": [{"largeImageURL": "http://stub.local/photo.jpg"}]})
+        self._send_json({"error": "not found"}, status=404)
+
+
+class STUB_SERVER(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients giving up on a hung or slow response are expected here.
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+
+def start_stub_server(latency=None, host="127.0.0.1", port=0, faults=None):
+    handler = type(
+        "CONFIGURED_STUB_HANDLER", (STUB_HANDLER,), {"latency": latency or {}, "faults": faults or {}}
+    )
+    server = STUB_SERVER((host, port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
@@ -0,0 +1,26 @@
+import sys
+import argparse
+from db.operations import DB_OPERATOR
+
+MISSING = {"last_activity": {"$exists": False}}
+
+
+def backfill(operator, dry_run=False):
+    # Chats created before last_activity existed sort by creation time.
+    with operator.chat_db:
+        if dry_run:
+            return {"missing": operator.chat_db.collection.count_documents(MISSING), "dry_run": True}
+        result = operator.chat_db.update_many(MISSING, [{"$set": {"last_activity": "$create_timestamp"}}])
+    return {"updated": result.modified_count, "dry_run": False}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Set last_activity on chats stored before it existed.")
+    parser.add_argument("--dry-run", action="store_true", help="only count the chats that would be updated")
+    args = parser.parse_args(argv)
+    print(backfill(DB_OPERATOR(), dry_run=args.dry_run))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,85 @@
+import sys
+import time
+import argparse
+from db.operations import BUCKETED, DB_OPERATOR
+from services.cache import get_url_expiry
+from services.media_store import create_media_store
+
+BATCH_SIZE = 100
+
+
+def iter_documents(model, query, projection, batch_size=BATCH_SIZE):
+    last_id = None
+    while True:
+        page_query = dict(query)
+        if last_id is not None:
+            page_query["_id"] = {"$gt": last_id}
+        with model:
+            docs = model.find_page(page_query, projection, sort=[("_id", 1)], limit=batch_size)
+        if not docs:
+            return
+        for doc in docs:
+            yield doc
+        last_id = docs[-1]["_id"]
+
+
+def iter_turns(operator):
+    # Yields (model, document id, field path of the turn, turn) for every
+    # stored turn, whichever layout its chat uses.
+    chats = iter_documents(operator.chat_db, {"storage": {"$ne": BUCKETED}}, {"conversation": 1})
+    for chat in chats:
+        for index, turn in enumerate(chat.get("conversation") or []):
+            yield operator.chat_db, chat["_id"], f"conversation.{index}", turn
+    for bucket in iter_documents(operator.bucket_db, {}, {"messages": 1}):
+        for index, turn in enumerate(bucket.get("messages") or []):
+            yield operator.bucket_db, bucket["_id"], f"messages.{index}", turn
+
+
+def backfill(operator, store, dry_run=False, limit=None):
+    report = {"stored": 0, "expired": 0, "failed": 0, "already_stored": 0, "dry_run": dry_run}
+    now = time.time()
+    for model, doc_id, path, turn in iter_turns(operator):
+        if limit is not None and report["stored"] + report["failed"] >= limit:
+            break
+        url = (turn.get("response") or {}).get("dalle_image")
+        if not url:
+            continue
+        if store.is_stored(url):
+            report["already_stored"] += 1
+            continue
+        expiry = get_url_expiry(url)
+        if expiry is not None and expiry <= now:
+            # Nothing left to download; these turns stay broken.
+            report["expired"] += 1
+            continue
+        if dry_run:
+            report["stored"] += 1
+            continue
+        stored_url = store.persist(url)
+        if stored_url is None:
+            report["failed"] += 1
+            continue
+        field = f"{path}.response.dalle_image"
+        with model:
+            # Only replace the URL if the turn was not rewritten meanwhile.
+            model.update_one({"_id": doc_id, field: url}, {"$set": {field: stored_url}})
+        report["stored"] += 1
+    return report
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Copy DALL-E images of stored chats into the media store.")
+    parser.add_argument("--dry-run", action="store_true", help="only count the images that would be copied")
+    parser.add_argument("--limit", type=int, default=None, help="copy at most this many images")
+    args = parser.parse_args(argv)
+    operator = DB_OPERATOR()
+    store = create_media_store(operator)
+    if store.backend is None:
+        print("Set MEDIA_STORE_BACKEND to fs or s3 first.")
+        return 1
+    print(backfill(operator, store, dry_run=args.dry_run, limit=args.limit))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
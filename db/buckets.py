@@ -0,0 +1,127 @@
+import os
+from pymongo import ASCENDING, DESCENDING
+
+BUCKET_SIZE = int(os.getenv("CHAT_BUCKET_SIZE", "50"))
+PREVIEW_LENGTH = 120
+
+
+def bucket_seq(turn, size=BUCKET_SIZE):
+    return turn // size
+
+
+def preview(conversation):
+    return (conversation.get("query") or "")[:PREVIEW_LENGTH]
+
+
+def build_bucket(thread_id, seq, messages):
+    return {
+        "thread_id": thread_id,
+        "seq": seq,
+        "count": len(messages),
+        "messages": messages,
+        "summary": {
+            "first_timestamp": messages[0].get("timestamp"),
+            "first_query": preview(messages[0]),
+            "last_timestamp": messages[-1].get("timestamp"),
+            "last_query": preview(messages[-1]),
+        },
+    }
+
+
+def numbered(buckets, size):
+    # (turn, message) pairs; messages stored before turns were recorded are
+    # in append order within their bucket.
+    for bucket in buckets:
+        base = bucket["seq"] * size
+        for index, message in enumerate(bucket.get("messages", [])):
+            yield message.get("turn", base + index), message
+
+
+def without_turn(message):
+    message = dict(message)
+    message.pop("turn", None)
+    return message
+
+
+class MESSAGE_BUCKETS:
+    def __init__(self, model, size=BUCKET_SIZE):
+        self.model = model
+        self.size = size
+
+    def append(self, thread_id, turn, conversation):
+        # turn is the zero-based index of the new message, allocated atomically
+        # on the chat document. Concurrent appends to one bucket can still
+        # land out of order (or leave a gap while one is in flight), so each
+        # message carries its turn and readers go by that, not by position.
+        update = {
+            "$push": {"messages": {"$each": [dict(conversation, turn=turn)], "$sort": {"turn": ASCENDING}}},
+            "$inc": {"count": 1},
+            "$set": {
+                "summary.last_timestamp": conversation.get("timestamp"),
+                "summary.last_query": preview(conversation),
+            },
+            "$setOnInsert": {
+                "summary.first_timestamp": conversation.get("timestamp"),
+                "summary.first_query": preview(conversation),
+            },
+        }
+        with self.model:
+            self.model.update_one(
+                {"thread_id": thread_id, "seq": bucket_seq(turn, self.size)}, update, upsert=True
+            )
+
+    def write_all(self, thread_id, conversation):
+        messages = [dict(message, turn=turn) for turn, message in enumerate(conversation)]
+        buckets = [
+            build_bucket(thread_id, seq, messages[start : start + self.size])
+            for seq, start in enumerate(range(0, len(messages), self.size))
+        ]
+        if buckets:
+            with self.model:
+                self.model.insert_documents(buckets)
+        return len(buckets)
+
+    def read_all(self, thread_id):
+        with self.model:
+            buckets = self.model.find_page(
+                {"thread_id": thread_id}, {"seq": 1, "messages": 1}, sort=[("seq", ASCENDING)]
+            )
+        return [without_turn(message) for _, message in sorted(numbered(buckets, self.size), key=lambda item: item[0])]
+
+    def read_page(self, thread_id, turns, offset, limit):
+        # Newest-first: skip `offset` most recent turns, return up to `limit`.
+        end = turns - offset
+        start = max(0, end - limit)
+        if end <= 0:
+            return []
+        with self.model:
+            buckets = self.model.find_page(
+                {
+                    "thread_id": thread_id,
+                    "seq": {"$gte": bucket_seq(start, self.size), "$lte": bucket_seq(end - 1, self.size)},
+                },
+                {"seq": 1, "messages": 1},
+                sort=[("seq", DESCENDING)],
+            )
+        page = [(turn, message) for turn, message in numbered(buckets, self.size) if start <= turn < end]
+        return [without_turn(message) for _, message in sorted(page, key=lambda item: item[0], reverse=True)]
+
+    def update_message(self, thread_id, message_id, fields):
+        update = {"$set": {f"messages.$.{name}": value for name, value in fields.items()}}
+        with self.model:
+            result = self.model.update_one(
+                {"thread_id": thread_id, "messages.message_id": message_id}, update
+            )
+        return result.matched_count > 0
+
+    def summaries(self, thread_id):
+        with self.model:
+            return self.model.find_page(
+                {"thread_id": thread_id},
+                {"_id": 0, "seq": 1, "count": 1, "summary": 1},
+                sort=[("seq", ASCENDING)],
+            )
+
+    def delete(self, thread_id):
+        with self.model:
+            self.model.delete_as_many({"thread_id": thread_id})
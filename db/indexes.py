@@ -0,0 +1,125 @@
+import sys
+import logging
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "chats": [
+        IndexModel(
+            [("user_id", ASCENDING), ("last_activity", DESCENDING), ("_id", DESCENDING)],
+            name="user_id_last_activity",
+        ),
+    ],
+    "chat_buckets": [
+        IndexModel([("thread_id", ASCENDING), ("seq", ASCENDING)], name="thread_id_seq", unique=True),
+    ],
+    "media": [
+        IndexModel([("prompts", ASCENDING)], name="prompts"),
+    ],
+}
+
+# One entry per query DB_OPERATOR issues: (name, collection, filter, sort).
+QUERY_SHAPES = [
+    ("find_user", "users", {"email": "user@example.com"}, None),
+    ("get_user_by_id", "users", {"_id": "0" * 32}, None),
+    ("get_chat_by_id", "chats", {"_id": ObjectId()}, None),
+    ("get_chats_by_user_id", "chats", {"user_id": "0" * 32}, None),
+    (
+        "list_chats",
+        "chats",
+        {"user_id": "0" * 32},
+        [("last_activity", DESCENDING), ("_id", DESCENDING)],
+    ),
+    (
+        "list_chats_after",
+        "chats",
+        {
+            "user_id": "0" * 32,
+            "$or": [
+                {"last_activity": {"$lt": "2024-01-01T00:00:00"}},
+                {"last_activity": "2024-01-01T00:00:00", "_id": {"$lt": ObjectId()}},
+            ],
+        },
+        [("last_activity", DESCENDING), ("_id", DESCENDING)],
+    ),
+    ("read_buckets", "chat_buckets", {"thread_id": ObjectId()}, [("seq", ASCENDING)]),
+    (
+        "read_bucket_page",
+        "chat_buckets",
+        {"thread_id": ObjectId(), "seq": {"$gte": 0, "$lte": 1}},
+        [("seq", DESCENDING)],
+    ),
+    ("find_media_by_prompt", "media", {"prompts": "0" * 64}, None),
+]
+
+
+def ensure_indexes(database, indexes=None):
+    report = {}
+    for collection_name, models in (indexes or INDEXES).items():
+        try:
+            report[collection_name] = database[collection_name].create_indexes(models)
+        except OperationFailure as e:
+            # e.g. duplicate emails already stored; keep serving, but say so loudly.
+            logging.error("Could not create indexes on %s: %s", collection_name, e)
+            report[collection_name] = {"error": str(e)}
+    return report
+
+
+def plan_stages(plan):
+    stages = []
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            stages.append(plan["stage"])
+        for key in ("inputStage", "queryPlan"):
+            stages.extend(plan_stages(plan.get(key)))
+        for child in plan.get("inputStages", []):
+            stages.extend(plan_stages(child))
+    return stages
+
+
+def explain_query(database, collection_name, query, sort=None):
+    cursor = database[collection_name].find(query)
+    if sort:
+        cursor = cursor.sort(sort)
+    explanation = cursor.explain()
+    winning_plan = explanation.get("queryPlanner", {}).get("winningPlan", {})
+    return plan_stages(winning_plan)
+
+
+def check_query_plans(database, shapes=None):
+    results = []
+    for name, collection_name, query, sort in shapes or QUERY_SHAPES:
+        try:
+            stages = explain_query(database, collection_name, query, sort)
+        except (NotImplementedError, AttributeError):
+            # mongomock has no query planner; main() counts this as a failure
+            # so a check against it never passes by accident.
+            results.append({"query": name, "status": "unsupported", "stages": []})
+            continue
+        status = "collscan" if "COLLSCAN" in stages else "ok"
+        results.append({"query": name, "status": status, "stages": stages})
+    return results
+
+
+def main(argv):
+    from db.operations import DB_OPERATOR
+
+    operator = DB_OPERATOR()
+    with operator.chat_db:
+        database = operator.chat_db.db
+        print(ensure_indexes(database))
+        if "--check" not in argv:
+            return 0
+        failed = False
+        for result in check_query_plans(database):
+            print(f"{result['query']}: {result['status']} {' <- '.join(result['stages'])}")
+            failed = failed or result["status"] != "ok"
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
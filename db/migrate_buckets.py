@@ -0,0 +1,53 @@
+import sys
+import argparse
+from db.operations import BUCKETED, DB_OPERATOR
+
+BATCH_SIZE = 100
+
+
+def iter_embedded_chats(operator, batch_size=BATCH_SIZE):
+    last_id = None
+    while True:
+        query = {"storage": {"$ne": BUCKETED}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        with operator.chat_db:
+            chats = operator.chat_db.find_page(
+                query, {"conversation": 1}, sort=[("_id", 1)], limit=batch_size
+            )
+        if not chats:
+            return
+        for chat in chats:
+            yield chat
+        last_id = chats[-1]["_id"]
+
+
+def migrate(operator, dry_run=False, limit=None):
+    migrated = skipped = turns = 0
+    for chat in iter_embedded_chats(operator):
+        if limit is not None and migrated + skipped >= limit:
+            break
+        count = len(chat.get("conversation") or [])
+        if dry_run:
+            migrated += 1
+            turns += count
+            continue
+        if operator.migrate_chat_to_buckets(chat):
+            migrated += 1
+            turns += count
+        else:
+            skipped += 1
+    return {"migrated": migrated, "skipped": skipped, "turns": turns, "dry_run": dry_run}
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description="Rewrite embedded chat conversations into message buckets.")
+    parser.add_argument("--dry-run", action="store_true", help="only count the chats that would be migrated")
+    parser.add_argument("--limit", type=int, default=None, help="migrate at most this many chats")
+    args = parser.parse_args(argv)
+    print(migrate(DB_OPERATOR(storage=BUCKETED), dry_run=args.dry_run, limit=args.limit))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
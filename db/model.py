@@ -1,7 +1,8 @@
 import os
-import certifi
-import pymongo
-from dotenv import load_dotenv
+import logging
+from pymongo import ReturnDocument
+from db.pool import STATS, get_client
+from services.utils import load_env
 
 
 class MODEL:
@@ -11,29 +12,50 @@ class MODEL:
         self.client = None
         self.collection = None
         try:
-            load_dotenv()
+            load_env()
             self.MONGO_URL_STATIC = os.environ["MONGO_URL_STATIC"]
         except:
             raise Exception("Set MONGO_URL_STATIC in env variable...")
 
     def __enter__(self):
-        self.client = pymongo.MongoClient(
-            self.MONGO_URL_STATIC, tlsCAFile=certifi.where()
-        )
+        # Checking out the shared, process-wide client is cheap; the socket
+        # pool lives inside it and is reused across requests.
+        self.client = get_client(self.MONGO_URL_STATIC)
         self.db = self.client[self.database_name]
         self.collection = self.db[self.collection_name]
+        STATS.model_checkout()
         return self
 
     def __exit__(self, exc_type, exc_value, traceback):
-        self.client.close()
+        pass
+
+    def find_document(self, query, projection=None):
+        return self.collection.find_one(query, projection)
 
-    def find_document(self, query):
-        return self.collection.find_one(query)
+    def find_all_documents(self, query, projection=None):
+        cursor = self.collection.find(query, projection)
+        return [doc for doc in cursor]
 
-    def find_all_documents(self, query):
-        cursor = self.collection.find(query)
+    def find_page(self, query, projection=None, sort=None, limit=0):
+        cursor = self.collection.find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
         return [doc for doc in cursor]
 
+    def iter_documents(self, query, projection=None, sort=None, batch_size=0, limit=0):
+        # Lazily pulls batches from the server instead of building a list.
+        cursor = self.collection.find(query, projection, batch_size=batch_size)
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        return cursor
+
+    def create_index(self, keys, **kwargs):
+        return self.collection.create_index(keys, **kwargs)
+
     def document_exist(self, query):
         return self.collection.count_documents(query, limit=1)
 
@@ -41,31 +63,50 @@ class MODEL:
         res = self.collection.insert_one(doc)
         return res.inserted_id
 
-    def update_one(self, filter_criteria, update_operation):
-        result = self.collection.update_one(filter_criteria, update_operation)
-        print(
-            f"Matched {result.matched_count} document(s) and modified {result.modified_count} document(s)."
+    def insert_documents(self, docs):
+        res = self.collection.insert_many(docs)
+        return res.inserted_ids
+
+    def find_one_and_update(self, filter_criteria, update_operation, projection=None):
+        return self.collection.find_one_and_update(
+            filter_criteria,
+            update_operation,
+            projection=projection,
+            return_document=ReturnDocument.AFTER,
+        )
+
+    def aggregate(self, pipeline):
+        return [doc for doc in self.collection.aggregate(pipeline)]
+
+    def update_one(self, filter_criteria, update_operation, upsert=False):
+        result = self.collection.update_one(filter_criteria, update_operation, upsert=upsert)
+        logging.debug(
+            "Matched %s document(s) and modified %s document(s).",
+            result.matched_count,
+            result.modified_count,
         )
         return result
 
     def update_many(self, filter_criteria, update_operation):
         result = self.collection.update_many(filter_criteria, update_operation)
-        print(
-            f"Matched {result.matched_count} document(s) and modified {result.modified_count} document(s)."
+        logging.debug(
+            "Matched %s document(s) and modified %s document(s).",
+            result.matched_count,
+            result.modified_count,
         )
         return result
 
     def delete_first(self, query):
         result = self.collection.find_one_and_delete(query)
         if result:
-            print("Deleted document")
+            logging.debug("Deleted document")
         else:
-            print("No matching document found to delete")
+            logging.debug("No matching document found to delete")
         return result
 
     def delete_as_many(self, query):
         result = self.collection.delete_many(query)
-        print("Deleted", result.deleted_count, "documents")
+        logging.debug("Deleted %s documents", result.deleted_count)
         return result
 
     def get_all(self):
@@ -73,5 +114,5 @@ class MODEL:
 
     def remove_all(self):
         result = self.collection.delete_many({})
-        print(result.deleted_count, " documents deleted!!")
+        logging.debug("%s documents deleted", result.deleted_count)
         return result
@@ -1,43 +1,218 @@
+import os
+import json
 import uuid
+import base64
 import logging
+import binascii
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
 from db.model import MODEL
+from db.buckets import MESSAGE_BUCKETS
+from db.indexes import ensure_indexes
+from db.pool import get_pool_stats
 from db.utils import get_curr_timestamp
+from services.cache import TTL_CACHE
+from services.metrics import instrument_methods
 
+CHAT_LIST_PROJECTION = {"title": 1, "create_timestamp": 1, "last_activity": 1}
+CHAT_LIST_SORT = [("last_activity", -1), ("_id", -1)]
+MAX_CHAT_PAGE_SIZE = 100
+MAX_HISTORY_PAGE_SIZE = 100
+# "embedded": turns live in the chat's conversation array (original layout).
+# "bucketed": turns live in fixed-size chat_buckets documents.
+CHAT_STORAGE = os.getenv("CHAT_STORAGE", "embedded").lower()
+BUCKETED = "bucketed"
+EXPORT_BATCH_SIZE = 500
+MAX_EXPORT_BATCH_SIZE = 5000
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "10000"))
+USER_CACHE_TTL = int(os.getenv("USER_CACHE_TTL", "300"))
+# Short, so a signup handled by another worker is visible soon.
+USER_NEGATIVE_TTL = int(os.getenv("USER_NEGATIVE_TTL", "30"))
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def without_password(user):
+    if user is None:
+        return None
+    user = dict(user)
+    user.pop("password", None)
+    return user
+
+
+def encode_cursor(last_activity, chat_id):
+    raw = json.dumps([last_activity, str(chat_id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        last_activity, chat_id = json.loads(raw)
+        return last_activity, ObjectId(chat_id)
+    except (binascii.Error, ValueError, TypeError, InvalidId):
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+
+
+@instrument_methods("db")
 class DB_OPERATOR:
-    def __init__(self) -> None:
+    def __init__(self, storage=None) -> None:
         self.chat_db = MODEL("visual-gpt-dev", "chats")
         self.user_db = MODEL("visual-gpt-dev", "users")
+        self.bucket_db = MODEL("visual-gpt-dev", "chat_buckets")
+        self.media_db = MODEL("visual-gpt-dev", "media")
+        self.buckets = MESSAGE_BUCKETS(self.bucket_db)
+        self.storage = (storage or CHAT_STORAGE).lower()
+        # Users are keyed both as "email:<email>" and "id:<_id>".
+        self.user_cache = TTL_CACHE(maxsize=USER_CACHE_SIZE, ttl=USER_CACHE_TTL)
+        self.missing_users = TTL_CACHE(maxsize=USER_CACHE_SIZE, ttl=USER_NEGATIVE_TTL)
 
     def init_chat_in_db(self, user_id, title, conversation):
+        timestamp = get_curr_timestamp()
+        doc = {
+            "user_id": user_id,
+            "title": title,
+            "create_timestamp": timestamp,
+            "last_activity": timestamp,
+        }
+        if self.storage == BUCKETED:
+            doc.update({"storage": BUCKETED, "turns": 1})
+        else:
+            doc["conversation"] = [conversation]
         with self.chat_db:
-            thread_id = self.chat_db.insert_document(
-                {
-                    "user_id": user_id,
-                    "title": title,
-                    "conversation": [conversation],
-                    "create_timestamp": get_curr_timestamp(),
-                }
-            )
+            thread_id = self.chat_db.insert_document(doc)
+        if self.storage == BUCKETED:
+            self.buckets.append(thread_id, 0, conversation)
         return str(thread_id)
 
+    def _append_bucketed(self, chat_id, conversation, timestamp):
+        with self.chat_db:
+            chat = self.chat_db.find_one_and_update(
+                {"_id": chat_id, "storage": BUCKETED},
+                {"$inc": {"turns": 1}, "$set": {"last_activity": timestamp}},
+                projection={"turns": 1},
+            )
+        if chat is None:
+            return False
+        self.buckets.append(chat_id, chat["turns"] - 1, conversation)
+        return True
+
     def add_message(self, thread_id, conversation):
-        filter_query = {"_id": ObjectId(thread_id)}  # Specify the document's _id
-        update_query = {"$push": {"conversation": conversation}}
+        chat_id = ObjectId(thread_id)
+        timestamp = get_curr_timestamp()
+        # Try the configured layout first and fall back to the other one, so
+        # chats created before (or after) a storage switch keep working.
+        if self.storage == BUCKETED and self._append_bucketed(chat_id, conversation, timestamp):
+            return
+        filter_query = {"_id": chat_id, "storage": {"$ne": BUCKETED}}
+        update_query = {
+            "$push": {"conversation": conversation},
+            "$set": {"last_activity": timestamp},
+        }
         with self.chat_db:
-            self.chat_db.update_one(filter_query, update_query)
+            result = self.chat_db.update_one(filter_query, update_query)
+        if result.matched_count == 0 and self.storage != BUCKETED:
+            self._append_bucketed(chat_id, conversation, timestamp)
+
+    def update_message_media(self, thread_id, message_id, media):
+        # Patches the media URLs of a background media job into the stored
+        # turn, wherever the chat keeps its messages.
+        chat_id = ObjectId(thread_id)
+        fields = {f"response.{name}": value for name, value in media.items()}
+        with self.chat_db:
+            result = self.chat_db.update_one(
+                {"_id": chat_id, "conversation.message_id": message_id},
+                {"$set": {f"conversation.$.{name}": value for name, value in fields.items()}},
+            )
+        if result.matched_count > 0:
+            return True
+        return self.buckets.update_message(chat_id, message_id, fields)
+
+    def _load_conversation(self, doc):
+        if doc and doc.get("storage") == BUCKETED:
+            doc["conversation"] = self.buckets.read_all(doc["_id"])
+        return doc
 
     def get_history(self, thread_id):
         with self.chat_db:
             query = {"_id": ObjectId(thread_id)}  # Specify the document's _id
             doc = self.chat_db.find_document(query)
+        doc = self._load_conversation(doc)
         if doc:
             doc.pop("_id")
         return doc
 
+    def get_history_page(self, thread_id, offset=0, limit=20, include_summary=False):
+        chat_id = ObjectId(thread_id)
+        offset = max(0, int(offset))
+        limit = max(1, min(int(limit), MAX_HISTORY_PAGE_SIZE))
+        projection = {
+            "_id": 0,
+            "storage": 1,
+            "turns": 1,
+            "total": {"$size": {"$ifNull": ["$conversation", []]}},
+        }
+        if include_summary:
+            projection["context_summary"] = 1
+        with self.chat_db:
+            rows = self.chat_db.aggregate([{"$match": {"_id": chat_id}}, {"$project": projection}])
+            if not rows:
+                return None
+            doc = rows[0]
+            total = doc["total"]
+            messages = []
+            if doc.get("storage") != BUCKETED and total > offset:
+                # Slice on the server so only the requested turns are sent
+                # back. $slice takes literal numbers, so the size is read first.
+                sliced = self.chat_db.find_document(
+                    {"_id": chat_id},
+                    {"_id": 0, "conversation": {"$slice": [max(0, total - offset - limit), min(limit, total - offset)]}},
+                )
+                messages = list(reversed((sliced or {}).get("conversation", [])))
+        if doc.get("storage") == BUCKETED:
+            total = doc.get("turns", 0)
+            messages = self.buckets.read_page(chat_id, total, offset, limit)
+        next_offset = offset + len(messages)
+        page = {
+            "messages": messages,
+            "total": total,
+            "next_offset": next_offset if next_offset < total else None,
+        }
+        if include_summary:
+            page["summary"] = doc.get("context_summary")
+        return page
+
+    def save_context_summary(self, thread_id, text, turns):
+        # Only ever move the summary forward; a slower concurrent update
+        # covering fewer turns is dropped.
+        with self.chat_db:
+            result = self.chat_db.update_one(
+                {
+                    "_id": ObjectId(thread_id),
+                    "$or": [
+                        {"context_summary.turns": {"$lt": turns}},
+                        {"context_summary": {"$exists": False}},
+                    ],
+                },
+                {"$set": {"context_summary": {"text": text, "turns": turns}}},
+            )
+        return result.modified_count > 0
+
     def clear_history(self, thread_id):
-        filter_query = {"_id": ObjectId(thread_id)}  # Specify the document's _id
-        update_query = {"$set": {"conversation": []}}
+        chat_id = ObjectId(thread_id)
+        with self.chat_db:
+            doc = self.chat_db.find_document({"_id": chat_id}, {"storage": 1, "turns": 1})
+        if doc and doc.get("storage") == BUCKETED:
+            self.buckets.delete(chat_id)
+            with self.chat_db:
+                self.chat_db.update_one(
+                    {"_id": chat_id}, {"$set": {"turns": 0}, "$unset": {"context_summary": ""}}
+                )
+            return doc.get("turns", 0) > 0
+        filter_query = {"_id": chat_id}  # Specify the document's _id
+        update_query = {"$set": {"conversation": []}, "$unset": {"context_summary": ""}}
         with self.chat_db:
             result = self.chat_db.update_one(filter_query, update_query)
         return result.modified_count > 0
@@ -46,63 +221,141 @@ class DB_OPERATOR:
         filter_query = {"_id": ObjectId(thread_id)}
         with self.chat_db:
             self.chat_db.delete_first(filter_query)
+        self.buckets.delete(filter_query["_id"])
 
-    def create_user(self, email, hashed_password, full_name):
-        with self.user_db:
-            user_id = self.user_db.insert_document(
+    def migrate_chat_to_buckets(self, chat):
+        conversation = chat.get("conversation") or []
+        # Drop leftovers of an interrupted run before rewriting.
+        self.buckets.delete(chat["_id"])
+        self.buckets.write_all(chat["_id"], conversation)
+        with self.chat_db:
+            result = self.chat_db.update_one(
                 {
-                    "_id": uuid.uuid4().hex,
-                    "email": email,
-                    "password": hashed_password,
-                    "full_name": full_name,
-                }
+                    "_id": chat["_id"],
+                    "storage": {"$ne": BUCKETED},
+                    "conversation": {"$size": len(conversation)},
+                },
+                {
+                    "$set": {"storage": BUCKETED, "turns": len(conversation)},
+                    "$unset": {"conversation": ""},
+                },
             )
+        if result.modified_count == 0:
+            # A message was appended meanwhile; leave the chat for the next run.
+            self.buckets.delete(chat["_id"])
+            return False
+        return True
+
+    def _cache_user(self, user):
+        self.user_cache.set(f"email:{user['email']}", user)
+        self.user_cache.set(f"id:{user['_id']}", user)
+
+    def invalidate_user(self, email=None, user_id=None):
+        if email is not None:
+            self.user_cache.delete(f"email:{email}")
+            self.missing_users.delete(email)
+        if user_id is not None:
+            self.user_cache.delete(f"id:{user_id}")
+
+    def create_user(self, email, hashed_password, full_name):
+        user = {
+            "_id": uuid.uuid4().hex,
+            "email": email,
+            "password": hashed_password,
+            "full_name": full_name,
+        }
+        with self.user_db:
+            user_id = self.user_db.insert_document(dict(user))
+        self.invalidate_user(email=email, user_id=user_id)
+        self._cache_user(user)
         return str(user_id)
 
+    def update_password(self, user_id, hashed_password, email=None):
+        with self.user_db:
+            result = self.user_db.update_one({"_id": user_id}, {"$set": {"password": hashed_password}})
+        self.invalidate_user(email=email, user_id=user_id)
+        return result.modified_count > 0
+
     def find_user(self, email):
+        # Returns the full record (with the password hash) for login; never
+        # log or return it to clients as is.
+        user = self.user_cache.get(f"email:{email}")
+        if user is not None:
+            return dict(user)
+        if self.missing_users.get(email):
+            return None
         with self.user_db:
             user = self.user_db.find_document({"email": email})
-        return user
+        if user is None:
+            self.missing_users.set(email, True)
+            return None
+        self._cache_user(user)
+        return dict(user)
 
     def user_exist(self, email):
-        with self.user_db:
-            if self.user_db.find_document({"email": email}):
-                return True
-        return False
+        return self.find_user(email) is not None
+
+    def user_cache_stats(self):
+        return {"users": self.user_cache.stats(), "missing_users": self.missing_users.stats()}
 
     def get_users(self):
         try:
             with self.user_db:
-                users = self.user_db.get_all()
+                users = self.user_db.find_all_documents({}, {"password": 0})
                 # Convert ObjectId to string
                 for user in users:
                     user["_id"] = str(user["_id"])
             return users
         except Exception as e:
-            logging.error(f"Error fetching users: {str(e)}")
+            logging.error("Error fetching users: %s", e)
             return None
 
+    def _export(self, model, query, fields, hidden, after, batch_size, limit):
+        batch_size = max(1, min(int(batch_size or EXPORT_BATCH_SIZE), MAX_EXPORT_BATCH_SIZE))
+        limit = max(0, int(limit or 0))
+        # An empty projection returns every field, hidden ones included, so
+        # a field list naming only hidden fields falls back to excluding them.
+        projection = {field: 1 for field in fields or () if field not in hidden}
+        if not projection:
+            projection = {field: 0 for field in hidden} or None
+        if after is not None:
+            query = dict(query, _id={"$gt": after})
+        with model:
+            cursor = model.iter_documents(
+                query, projection, sort=[("_id", 1)], batch_size=batch_size, limit=limit
+            )
+        # The generator keeps the cursor open while the response streams.
+        return (dict(doc, _id=str(doc["_id"])) for doc in cursor)
+
+    def iter_users(self, fields=None, after=None, batch_size=None, limit=None):
+        return self._export(self.user_db, {}, fields, ("password",), after, batch_size, limit)
+
+    def iter_chats(self, fields=None, after=None, batch_size=None, limit=None, user_id=None):
+        if after is not None:
+            try:
+                after = ObjectId(after)
+            except (InvalidId, TypeError):
+                raise InvalidCursor(f"Invalid cursor: {after}")
+        query = {"user_id": user_id} if user_id else {}
+        return self._export(self.chat_db, query, fields, (), after, batch_size, limit)
+
     def get_chats(self):
         try:
-            with self.chat_db:
-                chats = self.chat_db.get_all()
-                # Convert ObjectId to string
-                for chat in chats:
-                    chat["_id"] = str(chat["_id"])
-            return chats
+            return list(self.iter_chats())
         except Exception as e:
-            logging.error(f"Error fetching chats: {str(e)}")
+            logging.error("Error fetching chats: %s", e)
             return None
 
     def get_chat_by_id(self, chat_id):
         try:
             with self.chat_db:
                 chat = self.chat_db.find_document({"_id": ObjectId(chat_id)})
-                if chat:
-                    chat["_id"] = str(chat["_id"])
+            chat = self._load_conversation(chat)
+            if chat:
+                chat["_id"] = str(chat["_id"])
             return chat
         except Exception as e:
-            logging.error(f"Error fetching chat by ID: {str(e)}")
+            logging.error("Error fetching chat by ID: %s", e)
             return None
 
     def get_user_chats_ids(self, user_id):
@@ -110,10 +363,10 @@ class DB_OPERATOR:
             with self.chat_db:
                 chats = self.chat_db.find_all_documents({"user_id": user_id})
                 chats = [str(c["_id"]) for c in chats]
-                print(chats)
+                logging.debug("Chat ids for %s: %s", user_id, chats)
             return chats
         except Exception as e:
-            logging.error(f"Error fetching chats for user_id: {str(e)}")
+            logging.error("Error fetching chats for user_id: %s", e)
             return None
 
     def get_chats_by_user_id(self, user_id):
@@ -124,16 +377,69 @@ class DB_OPERATOR:
                     chat["_id"] = str(chat["_id"])
             return chats
         except Exception as e:
-            logging.error(f"Error fetching chats for user_id: {str(e)}")
+            logging.error("Error fetching chats for user_id: %s", e)
             return None
 
     def get_user_by_id(self, user_id):
         try:
-            with self.user_db:
-                user = self.user_db.find_document({"_id": user_id})
-                if user:
-                    user["_id"] = str(user["_id"])
+            user = self.user_cache.get(f"id:{user_id}")
+            if user is None:
+                with self.user_db:
+                    user = self.user_db.find_document({"_id": user_id})
+                if user is None:
+                    return None
+                self._cache_user(user)
+            user = without_password(user)
+            user["_id"] = str(user["_id"])
             return user
         except Exception as e:
-            logging.error(f"Error fetching user by ID: {str(e)}")
+            logging.error("Error fetching user by ID: %s", e)
             return None
+
+    def ensure_indexes(self):
+        # Chats from before last_activity existed need a one-off run of
+        # db.backfill_last_activity to show up in list_chats.
+        with self.chat_db:
+            return ensure_indexes(self.chat_db.db)
+
+    def list_chats(self, user_id, limit=20, after=None):
+        limit = max(1, min(int(limit), MAX_CHAT_PAGE_SIZE))
+        query = {"user_id": user_id}
+        if after:
+            last_activity, chat_id = decode_cursor(after)
+            query["$or"] = [
+                {"last_activity": {"$lt": last_activity}},
+                {"last_activity": last_activity, "_id": {"$lt": chat_id}},
+            ]
+        with self.chat_db:
+            chats = self.chat_db.find_page(
+                query, CHAT_LIST_PROJECTION, sort=CHAT_LIST_SORT, limit=limit + 1
+            )
+        next_cursor = None
+        if len(chats) > limit:
+            chats = chats[:limit]
+            next_cursor = encode_cursor(chats[-1].get("last_activity"), chats[-1]["_id"])
+        for chat in chats:
+            chat["_id"] = str(chat["_id"])
+        return {"chats": chats, "next": next_cursor}
+
+    def find_media_by_prompt(self, prompt_key):
+        with self.media_db:
+            return self.media_db.find_document({"prompts": prompt_key}, {"name": 1})
+
+    def save_media(self, digest, name, content_type, size, prompt_key=None):
+        update = {
+            "$setOnInsert": {
+                "name": name,
+                "content_type": content_type,
+                "size": size,
+                "create_timestamp": get_curr_timestamp(),
+            }
+        }
+        if prompt_key:
+            update["$addToSet"] = {"prompts": prompt_key}
+        with self.media_db:
+            self.media_db.update_one({"_id": digest}, update, upsert=True)
+
+    def pool_stats(self):
+        return get_pool_stats()
@@ -0,0 +1,223 @@
+import os
+import time
+import logging
+import threading
+import certifi
+import pymongo
+from pymongo import monitoring
+
+
+def _env_int(name, default):
+    value = os.getenv(name)
+    return int(value) if value else default
+
+
+def _env_flag(name, default=False):
+    value = os.getenv(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def pool_options():
+    return {
+        "maxPoolSize": _env_int("MONGO_MAX_POOL_SIZE", 50),
+        "minPoolSize": _env_int("MONGO_MIN_POOL_SIZE", 0),
+        "maxIdleTimeMS": _env_int("MONGO_MAX_IDLE_TIME_MS", 300000),
+        "connectTimeoutMS": _env_int("MONGO_CONNECT_TIMEOUT_MS", 10000),
+        "socketTimeoutMS": _env_int("MONGO_SOCKET_TIMEOUT_MS", 30000),
+        "serverSelectionTimeoutMS": _env_int("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000),
+        "waitQueueTimeoutMS": _env_int("MONGO_WAIT_QUEUE_TIMEOUT_MS", 10000),
+    }
+
+
+class POOL_STATS(monitoring.ConnectionPoolListener):
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.model_checkouts = 0
+            self.client_waits = 0
+            self.clients_created = 0
+            self.client_created_at = None
+            self.connection_checkouts = 0
+            self.checkout_failures = 0
+            self.checkout_waits = 0
+            self.checkout_wait_seconds = 0.0
+            self.max_checkout_wait_seconds = 0.0
+            self.connections_created = 0
+            self.connections_closed = 0
+            self.connections = {}
+
+    # MODEL-level events
+    def model_checkout(self):
+        with self._lock:
+            self.model_checkouts += 1
+
+    def client_wait(self):
+        with self._lock:
+            self.client_waits += 1
+
+    def client_created(self):
+        with self._lock:
+            self.clients_created += 1
+            self.client_created_at = time.time()
+
+    # pymongo connection pool events
+    def pool_created(self, event):
+        pass
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def connection_created(self, event):
+        with self._lock:
+            self.connections_created += 1
+            self.connections[(event.address, event.connection_id)] = time.monotonic()
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.connections_closed += 1
+            self.connections.pop((event.address, event.connection_id), None)
+
+    def connection_check_out_started(self, event):
+        self._local.started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self._local.started = None
+        with self._lock:
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        started = getattr(self._local, "started", None)
+        self._local.started = None
+        waited = time.perf_counter() - started if started else 0.0
+        with self._lock:
+            self.connection_checkouts += 1
+            # Anything slower than a plain idle-socket handoff means the
+            # caller waited for a new socket or for one to be returned.
+            if waited > 0.001:
+                self.checkout_waits += 1
+                self.checkout_wait_seconds += waited
+                self.max_checkout_wait_seconds = max(self.max_checkout_wait_seconds, waited)
+
+    def connection_checked_in(self, event):
+        pass
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            ages = [now - created for created in self.connections.values()]
+            return {
+                "pid": os.getpid(),
+                "options": pool_options(),
+                "model_checkouts": self.model_checkouts,
+                "client_waits": self.client_waits,
+                "clients_created": self.clients_created,
+                "client_age_seconds": round(time.time() - self.client_created_at, 3)
+                if self.client_created_at
+                else None,
+                "connection_checkouts": self.connection_checkouts,
+                "checkout_failures": self.checkout_failures,
+                "checkout_waits": self.checkout_waits,
+                "checkout_wait_seconds_total": round(self.checkout_wait_seconds, 6),
+                "checkout_wait_seconds_max": round(self.max_checkout_wait_seconds, 6),
+                "connections_created": self.connections_created,
+                "connections_closed": self.connections_closed,
+                "connections_open": len(ages),
+                "connection_age_seconds": {
+                    "min": round(min(ages), 3) if ages else None,
+                    "max": round(max(ages), 3) if ages else None,
+                    "avg": round(sum(ages) / len(ages), 3) if ages else None,
+                },
+            }
+
+
+STATS = POOL_STATS()
+
+_lock = threading.Lock()
+_clients = {}
+_pid = os.getpid()
+
+
+def _reset_after_fork():
+    # Sockets inherited from the parent must never be reused in the child, so
+    # drop the references (without closing them) and build fresh clients lazily.
+    global _lock, _clients, _pid
+    _lock = threading.Lock()
+    _clients = {}
+    _pid = os.getpid()
+    STATS.reset()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _create_client(url):
+    if url.startswith("mongomock://"):
+        # In-memory stand-in for local benchmarks and checks.
+        import mongomock
+
+        STATS.client_created()
+        return mongomock.MongoClient()
+    client = pymongo.MongoClient(
+        url,
+        tlsCAFile=certifi.where(),
+        event_listeners=[STATS],
+        appname="speakimage-backend",
+        **pool_options(),
+    )
+    STATS.client_created()
+    if _env_flag("MONGO_WARMUP"):
+        try:
+            client.admin.command("ping")
+        except Exception as e:
+            logging.warning("MongoDB warm-up ping failed: %s", e)
+    return client
+
+
+def get_client(url):
+    if os.getpid() != _pid:
+        _reset_after_fork()
+    client = _clients.get(url)
+    if client is not None:
+        return client
+    if not _lock.acquire(blocking=False):
+        STATS.client_wait()
+        _lock.acquire()
+    try:
+        client = _clients.get(url)
+        if client is None:
+            client = _create_client(url)
+            _clients[url] = client
+        return client
+    finally:
+        _lock.release()
+
+
+def warm_up(url):
+    get_client(url).admin.command("ping")
+
+
+def close_clients():
+    with _lock:
+        for client in _clients.values():
+            client.close()
+        _clients.clear()
+
+
+def get_pool_stats():
+    return STATS.snapshot()
@@ -19,3 +19,23 @@ PROMPT_TO_ANALYSE_QUERY = """
 
     This approach ensures that the majority of responses are enriched with visual content unless the query specifically warrants a simple textual response.
 """
+
+PROMPT_TO_ANSWER_WITH_TOOLS = """
+    Answer the user query with a bit of detailed explanation. There could be causal question or specific question.
+
+    Always write the full textual answer in your reply. In addition, call the generate_image function with a short
+    visual description whenever an image would enrich the answer, unless the query is very generic or purely conversational.
+
+    Use the generate_image function for queries like:
+        - "How is life on Mars?"
+        - "Do Siamese cats sleep a lot?"
+        - "What does the Eiffel Tower look like at night?"
+        - "Describe a bustling city street."
+        - "What is the distance of Mars from Earth?"
+        - "How far is the closest star to our solar system?"
+
+    Do not use the generate_image function for non-specific or conversational queries such as but not limited to:
+        - "Hi"
+        - "How are you?"
+        - "What’s the weather like?"
+"""
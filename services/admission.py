@@ -0,0 +1,358 @@
+import os
+import math
+import time
+import heapq
+import asyncio
+import logging
+import sqlite3
+import itertools
+import threading
+import contextvars
+from concurrent.futures import Future, TimeoutError
+from contextlib import asynccontextmanager, contextmanager
+from services.cache import TTL_CACHE
+
+FOREGROUND = 0
+BACKGROUND = 1
+
+_client = contextvars.ContextVar("admission_client", default=None)
+_priority = contextvars.ContextVar("admission_priority", default=FOREGROUND)
+
+
+class Overloaded(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Too many upstream calls in flight, retry in {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+def set_client(key):
+    # Whose budgets this request draws from: the signed-in user, else the
+    # client IP.
+    _client.set(key)
+
+
+def current_client():
+    return _client.get()
+
+
+def set_priority(priority):
+    _priority.set(priority)
+
+
+def current_priority():
+    return _priority.get()
+
+
+def client_ip(headers, remote_addr, trusted_hops=None):
+    # X-Forwarded-For is client-controlled except for the entries our own
+    # proxies appended, so it is read only when TRUSTED_PROXY_HOPS says how
+    # many proxies sit in front of the app (1 on Vercel). The client is the
+    # entry the outermost trusted proxy added, counting from the right.
+    hops = int(os.getenv("TRUSTED_PROXY_HOPS", "0")) if trusted_hops is None else trusted_hops
+    forwarded = headers.get("X-Forwarded-For")
+    if hops <= 0 or not forwarded:
+        return remote_addr
+    entries = [entry.strip() for entry in forwarded.split(",") if entry.strip()]
+    return entries[-min(hops, len(entries))] if entries else remote_addr
+
+
+def spend(tokens, updated, now, cost, rate, capacity):
+    # Token bucket refilled at rate tokens/s up to capacity. Returns the new
+    # level and 0.0 if cost was taken, or the seconds until it could be.
+    # A negative cost refunds tokens.
+    tokens = min(capacity, tokens + max(0.0, now - updated) * rate)
+    if tokens >= cost:
+        return min(capacity, tokens - cost), 0.0
+    return tokens, (cost - tokens) / rate
+
+
+class MEMORY_BUCKETS:
+    def __init__(self, maxsize=100000, idle_ttl=3600):
+        # Idle buckets expire; by then they would have refilled anyway.
+        self.buckets = TTL_CACHE(maxsize=maxsize, ttl=idle_ttl)
+        self._lock = threading.Lock()
+
+    def take(self, key, cost, rate, capacity):
+        now = time.time()
+        with self._lock:
+            tokens, updated = self.buckets.get(key) or (capacity, now)
+            tokens, retry_after = spend(tokens, updated, now, cost, rate, capacity)
+            self.buckets.set(key, (tokens, now))
+        return retry_after
+
+    def stats(self):
+        return {"backend": "memory", "buckets": len(self.buckets)}
+
+
+class SQLITE_BUCKETS:
+    # Shares buckets between worker processes on one host. Each take is one
+    # BEGIN IMMEDIATE transaction, so concurrent processes serialise on the
+    # database write lock instead of double-spending a bucket.
+    def __init__(self, path, timeout=5.0, idle_ttl=3600, prune_every=1000):
+        self.path = path
+        self.timeout = timeout
+        self.idle_ttl = idle_ttl
+        self.prune_every = prune_every
+        self.takes = 0
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None or self._local.pid != os.getpid():
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS buckets "
+                "(key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+            )
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def take(self, key, cost, rate, capacity):
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            now = time.time()
+            row = conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens, retry_after = spend(tokens, updated, now, cost, rate, capacity)
+            conn.execute(
+                "INSERT INTO buckets (key, tokens, updated) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                (key, tokens, now),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self.takes += 1
+        if self.takes % self.prune_every == 0:
+            conn.execute("DELETE FROM buckets WHERE updated < ?", (time.time() - self.idle_ttl,))
+        return retry_after
+
+    def stats(self):
+        count = self._connection().execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+        return {"backend": "sqlite", "buckets": count}
+
+
+class RATE_LIMITER:
+    def __init__(self, backend, limits):
+        # limits: name -> (tokens per second, burst capacity)
+        self.backend = backend
+        self.limits = limits
+        self.allowed = {name: 0 for name in limits}
+        self.limited = {name: 0 for name in limits}
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def take(self, name, key, cost=1.0):
+        rate, capacity = self.limits[name]
+        try:
+            retry_after = self.backend.take(f"{name}:{key}", cost, rate, capacity)
+        except Exception as e:
+            # A broken limiter must not take the chat endpoints down with it.
+            logging.error("Rate limiter backend failed, allowing request: %s", e)
+            with self._lock:
+                self.errors += 1
+            return 0.0
+        if cost > 0:
+            with self._lock:
+                if retry_after:
+                    self.limited[name] += 1
+                else:
+                    self.allowed[name] += 1
+        return retry_after
+
+    def refund(self, name, key, cost=1.0):
+        self.take(name, key, -cost)
+        with self._lock:
+            self.allowed[name] -= 1
+
+    def admit(self, user_id, ip):
+        # Seconds to wait before retrying, or 0.0 when admitted. A request
+        # denied by its user bucket gives the IP token back.
+        if ip:
+            retry_after = self.take("ip", ip)
+            if retry_after:
+                return retry_after
+        if user_id:
+            retry_after = self.take("user", user_id)
+            if retry_after:
+                if ip:
+                    self.refund("ip", ip)
+                return retry_after
+        return 0.0
+
+    def allow_image(self, key):
+        return not key or not self.take("image", key)
+
+    def stats(self):
+        with self._lock:
+            stats = {
+                "allowed": dict(self.allowed),
+                "limited": dict(self.limited),
+                "errors": self.errors,
+            }
+        try:
+            stats.update(self.backend.stats())
+        except Exception as e:
+            logging.error("Could not read rate limiter stats: %s", e)
+        return stats
+
+
+class NULL_RATE_LIMITER:
+    def admit(self, user_id, ip):
+        return 0.0
+
+    def allow_image(self, key):
+        return True
+
+    def stats(self):
+        return {}
+
+
+class UPSTREAM_GATE:
+    # Caps upstream calls in flight across the process. Calls over the cap
+    # queue in priority order (FOREGROUND before BACKGROUND, then arrival)
+    # for up to max_wait seconds, so short bursts are smoothed rather than
+    # rejected; only a sustained overload raises Overloaded.
+    def __init__(self, max_in_flight, max_wait):
+        self.max_in_flight = max_in_flight
+        self.max_wait = max_wait
+        self.in_flight = 0
+        self.admitted = 0
+        self.queued = 0
+        self.timed_out = 0
+        self.max_queue = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def _enter(self):
+        # None when a slot was free, else the queued waiter, whose future is
+        # resolved when a slot is handed over.
+        with self._lock:
+            self.admitted += 1
+            if self.in_flight < self.max_in_flight and not self._waiters:
+                self.in_flight += 1
+                return None
+            # [priority, arrival, future, cancelled]
+            waiter = [current_priority(), next(self._seq), Future(), False]
+            heapq.heappush(self._waiters, waiter)
+            self.queued += 1
+            self.max_queue = max(self.max_queue, len(self._waiters))
+        return waiter
+
+    def _leave(self, waiter):
+        # Takes a waiter out of the queue; False if the slot was handed over
+        # just as it gave up.
+        with self._lock:
+            if waiter[2].done():
+                return False
+            waiter[3] = True
+            self.admitted -= 1
+        return True
+
+    def _overloaded(self):
+        with self._lock:
+            self.timed_out += 1
+        return Overloaded(max(1.0, self.max_wait / 2))
+
+    def _timeout(self, timeout):
+        return self.max_wait if timeout is None else min(timeout, self.max_wait)
+
+    def acquire(self, timeout=None):
+        waiter = self._enter()
+        if waiter is None:
+            return
+        try:
+            waiter[2].result(self._timeout(timeout))
+        except TimeoutError:
+            if self._leave(waiter):
+                raise self._overloaded() from None
+
+    async def acquire_async(self, timeout=None):
+        waiter = self._enter()
+        if waiter is None:
+            return
+        try:
+            # shield: a cancelled wait must not cancel the shared future.
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(waiter[2])), self._timeout(timeout))
+        except asyncio.TimeoutError:
+            if self._leave(waiter):
+                raise self._overloaded() from None
+        except asyncio.CancelledError:
+            if not self._leave(waiter):
+                self.release()
+            raise
+
+    def release(self):
+        with self._lock:
+            while self._waiters:
+                waiter = heapq.heappop(self._waiters)
+                if not waiter[3]:
+                    # The slot passes straight to the waiter; in_flight is unchanged.
+                    waiter[2].set_result(None)
+                    return
+            self.in_flight -= 1
+
+    @contextmanager
+    def slot(self, timeout=None):
+        self.acquire(timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    @asynccontextmanager
+    async def aslot(self, timeout=None):
+        await self.acquire_async(timeout)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        with self._lock:
+            return {
+                "max_in_flight": self.max_in_flight,
+                "in_flight": self.in_flight,
+                "waiting": sum(1 for waiter in self._waiters if not waiter[3]),
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "timed_out": self.timed_out,
+                "max_queue": self.max_queue,
+            }
+
+
+def per_second(name, per, default):
+    return float(os.getenv(name, default)) / per
+
+
+def create_rate_limiter():
+    backend_name = os.getenv("ADMISSION_BACKEND", "memory").lower()
+    if backend_name == "off":
+        return NULL_RATE_LIMITER()
+    if backend_name == "sqlite":
+        backend = SQLITE_BUCKETS(os.getenv("ADMISSION_DB_PATH", "/tmp/speakimage_admission.sqlite3"))
+    else:
+        backend = MEMORY_BUCKETS(int(os.getenv("ADMISSION_MAX_BUCKETS", "100000")))
+    limits = {
+        "user": (per_second("USER_RATE_PER_MINUTE", 60, "20"), float(os.getenv("USER_BURST", "10"))),
+        "ip": (per_second("IP_RATE_PER_MINUTE", 60, "60"), float(os.getenv("IP_BURST", "30"))),
+        # DALL-E images are the expensive part of a chat turn.
+        "image": (per_second("IMAGE_RATE_PER_HOUR", 3600, "30"), float(os.getenv("IMAGE_BURST", "5"))),
+    }
+    return RATE_LIMITER(backend, limits)
+
+
+def create_upstream_gate():
+    max_in_flight = int(os.getenv("UPSTREAM_MAX_IN_FLIGHT", "32"))
+    if max_in_flight <= 0:
+        return None
+    return UPSTREAM_GATE(max_in_flight, float(os.getenv("UPSTREAM_MAX_QUEUE_WAIT", "10")))
+
+
+def retry_after_header(seconds):
+    return str(max(1, math.ceil(seconds)))
@@ -0,0 +1,293 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlparse
+from services.utils import normalize_query
+
+
+class TTL_CACHE:
+    def __init__(self, maxsize=1024, ttl=3600):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        now = time.time()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return default
+            expires_at, value = item
+            if expires_at is not None and expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.time() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            return self._data.pop(key, None) is not None
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def keys(self):
+        with self._lock:
+            return list(self._data.keys())
+
+    def items(self):
+        now = time.time()
+        with self._lock:
+            return [
+                (key, expires_at, value)
+                for key, (expires_at, value) in self._data.items()
+                if expires_at is None or expires_at > now
+            ]
+
+    def load(self, items):
+        now = time.time()
+        with self._lock:
+            for key, expires_at, value in items:
+                if expires_at is None or expires_at > now:
+                    self._data[key] = (expires_at, value)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class MEMORY_BACKEND:
+    def __init__(self, maxsize, ttl):
+        self.cache = TTL_CACHE(maxsize=maxsize, ttl=ttl)
+
+    def get(self, key):
+        return self.cache.get(key)
+
+    def set(self, key, value, ttl):
+        self.cache.set(key, value, ttl=ttl)
+
+    def delete(self, key):
+        self.cache.delete(key)
+
+    def stats(self):
+        stats = self.cache.stats()
+        return {
+            "backend": "memory",
+            "size": stats["size"],
+            "maxsize": stats["maxsize"],
+            "evictions": stats["evictions"],
+            "expirations": stats["expirations"],
+        }
+
+
+class REDIS_BACKEND:
+    # Works against Redis or any protocol-compatible local server (KeyDB,
+    # Dragonfly, ...). Size eviction is left to the server's maxmemory policy.
+    def __init__(self, url, prefix="speakimage:chat:"):
+        import redis
+
+        self.client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.prefix = prefix
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        return json.loads(raw) if raw else None
+
+    def set(self, key, value, ttl):
+        self.client.set(self.prefix + key, json.dumps(value), ex=max(1, int(ttl)) if ttl else None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def stats(self):
+        out = {"backend": "redis"}
+        try:
+            info = self.client.info("stats")
+            out["evictions"] = info.get("evicted_keys")
+            out["expirations"] = info.get("expired_keys")
+        except Exception as e:
+            logging.warning("Could not read redis stats: %s", e)
+        return out
+
+
+def get_url_expiry(url):
+    # OpenAI image URLs are Azure blob SAS links whose "se" parameter is the
+    # signed expiry, e.g. se=2024-05-20T12:00:00Z.
+    if not url:
+        return None
+    try:
+        values = parse_qs(urlparse(url).query).get("se")
+        if not values:
+            return None
+        return datetime.strptime(values[0], "%Y-%m-%dT%H:%M:%SZ").replace(tzinfo=timezone.utc).timestamp()
+    except ValueError:
+        return None
+
+
+class RESPONSE_CACHE:
+    def __init__(self, backend, ttl=3600, similarity=0.0, index_size=2048, url_margin=300):
+        self.backend = backend
+        self.ttl = ttl
+        self.similarity = similarity
+        self.url_margin = url_margin
+        # Token sets of recently cached queries, used for near-duplicate lookups.
+        self._index = OrderedDict()
+        self._index_size = index_size
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self.stale_media = 0
+        self.errors = 0
+
+    def _effective_ttl(self, response):
+        ttl = self.ttl
+        expiry = get_url_expiry(response.get("dalle_image"))
+        if expiry is not None:
+            ttl = min(ttl, expiry - self.url_margin - time.time())
+        return ttl
+
+    def _find_similar(self, key):
+        tokens = set(key.split(" "))
+        best_key, best_score = None, 0.0
+        with self._lock:
+            candidates = list(self._index.items())
+        for candidate, candidate_tokens in candidates:
+            union = len(tokens | candidate_tokens)
+            score = len(tokens & candidate_tokens) / union if union else 0.0
+            if score > best_score:
+                best_key, best_score = candidate, score
+        if best_score >= self.similarity:
+            return best_key
+        return None
+
+    def _lookup(self, key):
+        try:
+            response = self.backend.get(key)
+        except Exception as e:
+            self.errors += 1
+            logging.warning("Response cache lookup failed: %s", e)
+            return None
+        if response is None:
+            return None
+        expiry = get_url_expiry(response.get("dalle_image"))
+        if expiry is not None and expiry - self.url_margin <= time.time():
+            self.stale_media += 1
+            self.backend.delete(key)
+            return None
+        return response
+
+    def get(self, query):
+        key = normalize_query(query)
+        if not key:
+            return None
+        response = self._lookup(key)
+        if response is not None:
+            self.hits += 1
+            return response
+        if self.similarity > 0:
+            similar_key = self._find_similar(key)
+            if similar_key is not None:
+                response = self._lookup(similar_key)
+                if response is not None:
+                    self.similar_hits += 1
+                    return response
+                with self._lock:
+                    self._index.pop(similar_key, None)
+        self.misses += 1
+        return None
+
+    def set(self, query, response):
+        key = normalize_query(query)
+        if not key:
+            return
+        ttl = self._effective_ttl(response)
+        if ttl <= 0:
+            return
+        try:
+            self.backend.set(key, response, ttl)
+        except Exception as e:
+            self.errors += 1
+            logging.warning("Response cache store failed: %s", e)
+            return
+        if self.similarity > 0:
+            with self._lock:
+                self._index[key] = set(key.split(" "))
+                self._index.move_to_end(key)
+                while len(self._index) > self._index_size:
+                    self._index.popitem(last=False)
+
+    def stats(self):
+        lookups = self.hits + self.similar_hits + self.misses
+        out = {
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_ratio": round((self.hits + self.similar_hits) / lookups, 4) if lookups else 0.0,
+            "stale_media": self.stale_media,
+            "errors": self.errors,
+        }
+        out.update(self.backend.stats())
+        return out
+
+
+class NULL_CACHE:
+    def get(self, query):
+        return None
+
+    def set(self, query, response):
+        pass
+
+    def stats(self):
+        return {"backend": "off"}
+
+
+def create_response_cache():
+    backend_name = os.getenv("RESPONSE_CACHE_BACKEND", "memory").lower()
+    ttl = int(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+    similarity = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0"))
+    if backend_name == "off":
+        return NULL_CACHE()
+    if backend_name == "redis":
+        backend = REDIS_BACKEND(os.getenv("RESPONSE_CACHE_URL", "redis://localhost:6379/0"))
+    else:
+        backend = MEMORY_BACKEND(int(os.getenv("RESPONSE_CACHE_SIZE", "1024")), ttl)
+    return RESPONSE_CACHE(backend, ttl=ttl, similarity=similarity)
@@ -0,0 +1,64 @@
+import os
+import re
+from services.utils import normalize_query
+
+MAX_WORDS = 6
+
+CONVERSATIONAL_PHRASES = {
+    "hi",
+    "hello",
+    "hey",
+    "yo",
+    "sup",
+    "hiya",
+    "howdy",
+    "greetings",
+    "how are you",
+    "how are you doing",
+    "how is it going",
+    "hows it going",
+    "whats up",
+    "good morning",
+    "good afternoon",
+    "good evening",
+    "good night",
+    "thanks",
+    "thank you",
+    "thank you so much",
+    "thanks a lot",
+    "ok",
+    "okay",
+    "cool",
+    "great",
+    "nice",
+    "bye",
+    "goodbye",
+    "see you",
+    "who are you",
+    "what is your name",
+    "whats your name",
+    "whats the weather like",
+    "nice to meet you",
+}
+
+# Only a fixed set of vocatives may follow: "hello kitty" or "thanks obama"
+# name a topic and must go to the model.
+_GREETING_PREFIX = re.compile(
+    r"^(hi|hello|hey|thanks|thank you)( there| again| so much)?( (all|everyone|friend|buddy|mate|bot))?$"
+)
+
+
+def classifier_enabled():
+    # Off by default: a false positive answers a real question with small talk.
+    return os.getenv("LOCAL_QUERY_CLASSIFIER", "0").lower() not in ("0", "false", "no", "off")
+
+
+def is_conversational(query):
+    if not classifier_enabled():
+        return False
+    normalized = normalize_query(query)
+    if not normalized:
+        return False
+    if len(normalized.split(" ")) > MAX_WORDS:
+        return False
+    return normalized in CONVERSATIONAL_PHRASES or bool(_GREETING_PREFIX.match(normalized))
@@ -0,0 +1,122 @@
+import os
+import logging
+import contextvars
+
+CONTEXT_ENABLED = os.getenv("CONVERSATION_CONTEXT", "1") != "0"
+# Most recent turns kept verbatim, out of the rolling summary.
+CONTEXT_MAX_TURNS = int(os.getenv("CONTEXT_MAX_TURNS", "10"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "1500"))
+# Older turns are folded into the rolling summary once this many piled up.
+CONTEXT_SUMMARY_EVERY = int(os.getenv("CONTEXT_SUMMARY_EVERY", "10"))
+# Turns read from Mongo for each follow-up: the window plus a batch that has
+# left it but is not folded into the summary yet.
+CONTEXT_READ_TURNS = CONTEXT_MAX_TURNS + CONTEXT_SUMMARY_EVERY
+TOKENIZER_ENCODING = os.getenv("CONTEXT_TOKENIZER", "o200k_base")
+SUMMARY_PREFIX = "Summary of the earlier conversation: "
+# Per-message overhead of the chat format (role, separators).
+MESSAGE_OVERHEAD = 4
+
+_context = contextvars.ContextVar("conversation_context", default=())
+_encoder = None
+
+
+def _get_encoder():
+    global _encoder
+    if _encoder is None:
+        try:
+            import tiktoken
+
+            _encoder = tiktoken.get_encoding(TOKENIZER_ENCODING)
+        except Exception as e:
+            # No tiktoken (or no cached encoding offline): use the estimate.
+            logging.info("tiktoken unavailable, estimating token counts: %s", e)
+            _encoder = False
+    return _encoder
+
+
+def count_tokens(text):
+    if not text:
+        return 0
+    encoder = _get_encoder()
+    if encoder:
+        return len(encoder.encode(text))
+    # ~4 characters per token for English prose, never fewer than the words.
+    return max(len(text) // 4, len(text.split()))
+
+
+def message_tokens(message):
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD
+
+
+def turn_messages(turn):
+    messages = [{"role": "user", "content": turn.get("query") or ""}]
+    text = (turn.get("response") or {}).get("text")
+    if text:
+        messages.append({"role": "assistant", "content": text})
+    return messages
+
+
+def pack_context(summary, turns, budget=None):
+    # turns are newest first. Keeps the summary plus as many whole recent
+    # turns as fit into the budget; returns messages in chronological order.
+    budget = CONTEXT_TOKEN_BUDGET if budget is None else budget
+    packed = []
+    used = 0
+    summary_message = None
+    if summary:
+        candidate = {"role": "system", "content": SUMMARY_PREFIX + summary}
+        if message_tokens(candidate) <= budget:
+            summary_message = candidate
+            used = message_tokens(candidate)
+    for turn in turns:
+        messages = turn_messages(turn)
+        cost = sum(message_tokens(message) for message in messages)
+        if used + cost > budget:
+            break
+        packed[:0] = messages
+        used += cost
+    if summary_message:
+        packed.insert(0, summary_message)
+    return packed, used
+
+
+def unsummarized(turns, total, summarized):
+    # turns are the newest first; drops those already in the summary, so
+    # every turn is either summarized or a candidate for pack_context.
+    return turns[: max(0, total - summarized)]
+
+
+def summary_range(total, summarized, window=None, every=None, max_batch=50):
+    # Turns [start, end) that should be folded into the summary now, or None.
+    # Long threads from before the summary existed catch up in batches.
+    window = CONTEXT_MAX_TURNS if window is None else window
+    every = CONTEXT_SUMMARY_EVERY if every is None else every
+    end = total - window
+    if end - summarized < every:
+        return None
+    return summarized, min(end, summarized + max_batch)
+
+
+def summary_prompt(summary, turns):
+    lines = [
+        f"User: {turn.get('query') or ''}\nAssistant: {(turn.get('response') or {}).get('text') or ''}"
+        for turn in turns
+    ]
+    previous = f"Current summary:\n{summary}\n\n" if summary else ""
+    return [
+        {
+            "role": "system",
+            "content": "Maintain a short running summary of a conversation. Keep names, facts, "
+            "preferences and open questions; drop small talk. Reply with the updated summary only, "
+            "at most 150 words.",
+        },
+        {"role": "user", "content": previous + "New turns:\n" + "\n\n".join(lines)},
+    ]
+
+
+def set_context(messages):
+    _context.set(tuple(messages))
+
+
+def current_context():
+    return list(_context.get())
@@ -0,0 +1,55 @@
+import json
+
+NDJSON = "ndjson"
+JSON = "json"
+MIMETYPES = {NDJSON: "application/x-ndjson", JSON: "application/json"}
+# Encoded documents are flushed in chunks of roughly this size, so the
+# server neither buffers the whole export nor writes one tiny chunk per doc.
+CHUNK_BYTES = 64 * 1024
+
+
+def encode(doc):
+    # default=str covers ObjectId and datetime values straight from Mongo.
+    return json.dumps(doc, default=str, separators=(",", ":"))
+
+
+def _chunked(pieces, chunk_bytes):
+    buffer = []
+    size = 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= chunk_bytes:
+            yield "".join(buffer)
+            buffer = []
+            size = 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def ndjson_chunks(docs, chunk_bytes=CHUNK_BYTES):
+    return _chunked((encode(doc) + "\n" for doc in docs), chunk_bytes)
+
+
+def json_chunks(docs, limit=None, chunk_bytes=CHUNK_BYTES):
+    # {"items": [...], "next": <last _id>}; "next" is only known at the end,
+    # which is why it follows the items. It is null once the export is done.
+    def pieces():
+        last_id = None
+        count = 0
+        yield '{"items":['
+        for doc in docs:
+            last_id = doc.get("_id")
+            yield ("," if count else "") + encode(doc)
+            count += 1
+        more = limit is not None and count >= limit and last_id is not None
+        yield '],"next":' + encode(str(last_id) if more else None) + "}"
+
+    return _chunked(pieces(), chunk_bytes)
+
+
+def export_chunks(docs, fmt, limit=None, chunk_bytes=CHUNK_BYTES):
+    # NDJSON clients resume from the _id of the last line they received.
+    if fmt == NDJSON:
+        return ndjson_chunks(docs, chunk_bytes)
+    return json_chunks(docs, limit, chunk_bytes)
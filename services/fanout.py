@@ -0,0 +1,101 @@
+import os
+import asyncio
+import logging
+import threading
+import contextvars
+from asyncio import FIRST_COMPLETED
+from concurrent.futures import ThreadPoolExecutor
+
+
+class TASK:
+    def __init__(self, name, fn, *args, timeout=None, default=None, required=False, **kwargs):
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.timeout = timeout
+        self.default = default
+        # Required tasks have no partial-result default: see FAN_OUT.run.
+        self.required = required
+
+
+class FAN_OUT:
+    def __init__(self, name, max_workers=None):
+        self.name = name
+        self.max_workers = max_workers
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.max_workers, thread_name_prefix=self.name
+                    )
+                    self._pid = os.getpid()
+        return self._executor
+
+    def submit(self, fn, *args, **kwargs):
+        # Run in a copy of the caller's context so request-scoped context
+        # variables are visible inside the worker thread.
+        ctx = contextvars.copy_context()
+        return self.executor.submit(ctx.run, fn, *args, **kwargs)
+
+    async def call(self, fn, *args, **kwargs):
+        # For coroutines: runs a blocking call (pymongo, the media store) on
+        # the pool instead of the event loop.
+        return await asyncio.wrap_future(self.submit(fn, *args, **kwargs))
+
+    async def _settle(self, task):
+        # A task's output, or its default when it fails or runs out of time.
+        try:
+            return await asyncio.wait_for(task.fn(*task.args, **task.kwargs), task.timeout)
+        except asyncio.TimeoutError:
+            logging.warning("%s: %s exceeded its %ss deadline", self.name, task.name, task.timeout)
+        except Exception as e:
+            logging.error("%s: %s failed: %s", self.name, task.name, e)
+        return task.default
+
+    async def run(self, tasks):
+        # Runs coroutine tasks side by side on the event loop. Required tasks
+        # have no default: their exceptions reach the caller, and the other
+        # tasks are cancelled.
+        running = [
+            asyncio.ensure_future(task.fn(*task.args, **task.kwargs) if task.required else self._settle(task))
+            for task in tasks
+        ]
+        try:
+            outputs = await asyncio.gather(*running)
+        except BaseException:
+            for future in running:
+                future.cancel()
+            raise
+        return {task.name: output for task, output in zip(tasks, outputs)}
+
+    async def iter_completed(self, tasks):
+        # Yields (name, output) as tasks finish, with defaults for the ones
+        # that fail or run out of time.
+        pending = {asyncio.ensure_future(self._settle(task)): task for task in tasks}
+        try:
+            while pending:
+                done, _ = await asyncio.wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future).name, future.result()
+        finally:
+            for future in pending:
+                future.cancel()
+
+
+def env_timeout(name, default):
+    value = os.getenv(name)
+    return float(value) if value else default
+
+
+# Tool calls are coroutines and need no threads of their own.
+TOOL_POOL = FAN_OUT("tool")
+MEDIA_POOL = FAN_OUT("media", int(os.getenv("MEDIA_POOL_SIZE", "32")))
+# Mongo and response-cache calls made from the chat pipeline's coroutines.
+DB_POOL = FAN_OUT("db", int(os.getenv("DB_POOL_SIZE", "32")))
@@ -0,0 +1,40 @@
+import logging
+from services.admission import retry_after_header
+
+# app.py's handlers are plain functions shared by the Flask app and the
+# Quart app in asgi.py. They take an INCOMING and return either a Flask/Quart
+# style (body, status[, headers]) tuple with a JSON-able body, or a STREAM.
+
+
+class INCOMING:
+    # What a handler may read from the request, copied out by whichever
+    # framework is serving it.
+    def __init__(self, data=None, args=None, headers=None, session=None):
+        self.data = data or {}
+        self.args = args if args is not None else {}
+        self.headers = headers if headers is not None else {}
+        self.session = session if session is not None else {}
+
+
+class STREAM:
+    # A streamed reply; each framework wraps the chunks (a generator, or an
+    # async generator from the chat handlers) in its own response.
+    def __init__(self, chunks, mimetype, headers=None):
+        self.chunks = chunks
+        self.mimetype = mimetype
+        self.headers = headers or {}
+
+
+def upstream_unavailable(e):
+    logging.error("Upstream unavailable: %s", e)
+    seconds = retry_after_header(getattr(e, "retry_after", 1))
+    return {"error": "The assistant is temporarily unavailable, try again shortly"}, 503, {"Retry-After": seconds}
+
+
+def rate_limited(retry_after):
+    seconds = retry_after_header(retry_after)
+    return {"error": "Too many requests, slow down", "retry_after": int(seconds)}, 429, {"Retry-After": seconds}
+
+
+def hasher_busy():
+    return {"error": "Too many login attempts, try again shortly"}, 503, {"Retry-After": "1"}
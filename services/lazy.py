@@ -0,0 +1,57 @@
+import asyncio
+import weakref
+import threading
+
+
+class LAZY:
+    # Stands in for a heavy object (DB operator, API clients) and builds it
+    # on first attribute access, so cold starts that never touch it (health
+    # checks, "/") skip its imports and construction. Warm invocations reuse
+    # the instance.
+    def __init__(self, factory):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._instance is not None
+
+    def get(self):
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    def __getattr__(self, name):
+        return getattr(self.get(), name)
+
+    def stats_when_loaded(self, method_name):
+        # For metrics collectors: report nothing rather than force creation.
+        def stats():
+            return getattr(self._instance, method_name)() if self.loaded else {}
+
+        return stats
+
+
+class LOOP_LOCAL(LAZY):
+    # A LAZY per event loop, for async clients: their connection pools
+    # belong to the loop that opened them.
+    def __init__(self, factory):
+        super().__init__(factory)
+        self._instances = weakref.WeakKeyDictionary()
+
+    @property
+    def loaded(self):
+        return bool(self._instances)
+
+    def get(self):
+        loop = asyncio.get_running_loop()
+        instance = self._instances.get(loop)
+        if instance is None:
+            with self._lock:
+                instance = self._instances.get(loop)
+                if instance is None:
+                    instance = self._instances[loop] = self._factory()
+        return instance
@@ -0,0 +1,92 @@
+import os
+import sys
+import queue
+import atexit
+import random
+import logging
+import contextvars
+from logging.handlers import QueueHandler, QueueListener
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s"
+
+_sampled = contextvars.ContextVar("log_sampled", default=True)
+_listener = None
+
+
+class REQUEST_SAMPLING_FILTER(logging.Filter):
+    # Drops DEBUG/INFO records of requests that were not sampled; warnings and
+    # errors are always kept.
+    def filter(self, record):
+        return record.levelno >= logging.WARNING or _sampled.get()
+
+
+class LAZY_QUEUE_HANDLER(QueueHandler):
+    def prepare(self, record):
+        # Merge the args into the message here (the args may be mutated after
+        # the call returns), but leave Formatter work to the listener thread.
+        record.msg = record.getMessage()
+        record.args = None
+        record.exc_text = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def get_log_level():
+    level = logging.getLevelName(os.getenv("LOG_LEVEL", "INFO").upper())
+    return level if isinstance(level, int) else logging.INFO
+
+
+def get_sample_rate():
+    try:
+        return min(1.0, max(0.0, float(os.getenv("LOG_SAMPLE_RATE", "1"))))
+    except ValueError:
+        return 1.0
+
+
+def start_log_sampling(rate=None):
+    rate = get_sample_rate() if rate is None else rate
+    sampled = rate >= 1.0 or random.random() < rate
+    _sampled.set(sampled)
+    return sampled
+
+
+def configure_logging(level=None, stream=None):
+    global _listener
+    if _listener is not None:
+        return _listener
+    root = logging.getLogger()
+    root.setLevel(level if level is not None else get_log_level())
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+
+    output = logging.StreamHandler(stream or sys.stderr)
+    output.setFormatter(logging.Formatter(LOG_FORMAT))
+    log_queue = queue.SimpleQueue()
+    handler = LAZY_QUEUE_HANDLER(log_queue)
+    handler.addFilter(REQUEST_SAMPLING_FILTER())
+    root.addHandler(handler)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+    return _listener
+
+
+def _restart_after_fork():
+    # The listener thread does not survive fork(); give the child its own.
+    if _listener is not None:
+        _listener._thread = None
+        _listener.start()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+def stop_logging():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
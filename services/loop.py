@@ -0,0 +1,113 @@
+import os
+import asyncio
+import logging
+import threading
+import contextvars
+from concurrent.futures import Future
+
+_background = set()
+
+
+def spawn(coro):
+    # Fire-and-forget work on the running loop (context summaries), in a copy
+    # of the caller's context. The loop only keeps weak references to tasks.
+    task = asyncio.ensure_future(coro)
+    _background.add(task)
+    task.add_done_callback(_finished)
+    return task
+
+
+def _finished(task):
+    _background.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logging.error("Background task failed: %s", task.exception())
+
+
+class LOOP_THREAD:
+    # The chat pipeline is written once, as coroutines. asgi.py awaits them
+    # on the server's loop; the Flask app's worker threads hand them to this
+    # process-wide loop and wait, so every thread shares one set of async
+    # upstream clients and their connection pools.
+    def __init__(self, name):
+        self.name = name
+        self._loop = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self):
+        if self._loop is None or self._pid != os.getpid():
+            with self._lock:
+                if self._loop is None or self._pid != os.getpid():
+                    loop = asyncio.new_event_loop()
+                    threading.Thread(target=loop.run_forever, name=self.name, daemon=True).start()
+                    self._loop = loop
+                    self._pid = os.getpid()
+        return self._loop
+
+    def submit(self, coro):
+        # Runs coro on the loop in a copy of the caller's context (request
+        # usage, trace, admission client); returns a concurrent Future.
+        context = contextvars.copy_context()
+        future = Future()
+
+        def settle(task):
+            if task.cancelled():
+                future.cancel()
+            elif task.exception() is not None:
+                future.set_exception(task.exception())
+            else:
+                future.set_result(task.result())
+
+        def start():
+            # The task copies the context current at its creation.
+            task = context.run(self.loop.create_task, coro)
+            task.add_done_callback(settle)
+
+        self.loop.call_soon_threadsafe(start)
+        return future
+
+    def run(self, coro):
+        return self.submit(coro).result()
+
+    def iterate(self, chunks):
+        # Drives an async generator from a sync one (Flask streaming). One
+        # task runs the whole generator, so it sees its own context changes
+        # from one chunk to the next; each step hands it a future to fill.
+        steps = asyncio.Queue()
+        done = object()
+
+        async def drive():
+            try:
+                while True:
+                    step = await steps.get()
+                    if step is None:
+                        return
+                    try:
+                        step.set_result(await chunks.__anext__())
+                    except StopAsyncIteration:
+                        step.set_result(done)
+                        return
+                    except BaseException as e:
+                        step.set_exception(e)
+                        raise
+            finally:
+                await chunks.aclose()
+
+        driver = self.submit(drive())
+        try:
+            while True:
+                step = Future()
+                self.loop.call_soon_threadsafe(steps.put_nowait, step)
+                chunk = step.result()
+                if chunk is done:
+                    return
+                yield chunk
+        finally:
+            # Also when the client goes away mid-stream: close the generator.
+            self.loop.call_soon_threadsafe(steps.put_nowait, None)
+            try:
+                driver.result()
+            except Exception:
+                # Already raised from the step that hit it.
+                pass
@@ -0,0 +1,133 @@
+import os
+import time
+import uuid
+import asyncio
+import logging
+import threading
+from services.cache import TTL_CACHE
+from services.fanout import FAN_OUT
+from services.utils import normalize_query
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _running_loop():
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+class MEDIA_JOB:
+    def __init__(self, description):
+        self.id = uuid.uuid4().hex
+        self.description = description
+        self.status = QUEUED
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.finished = None
+        self.callbacks = []
+        self.subscribers = 1
+        self.done = threading.Event()
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "media": self.result,
+            "error": self.error,
+            "created": self.created,
+            "finished": self.finished,
+        }
+
+
+class MEDIA_JOB_QUEUE:
+    # Jobs and their state live in this process only: pollers must reach the
+    # same long-running process, and a serverless function frozen after its
+    # reply never finishes them (app.py's ASYNC_MEDIA_JOBS).
+    def __init__(self, run_fn, max_workers=None, max_pending=None, keep_seconds=3600):
+        self.run_fn = run_fn
+        self.max_pending = max_pending or int(os.getenv("MEDIA_JOB_MAX_PENDING", "100"))
+        self.pool = FAN_OUT("media-job", max_workers or int(os.getenv("MEDIA_JOB_WORKERS", "4")))
+        self.jobs = TTL_CACHE(maxsize=10000, ttl=keep_seconds)
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self.submitted = 0
+        self.deduplicated = 0
+        self.rejected = 0
+
+    def submit(self, description, callback=None):
+        key = normalize_query(description)
+        with self._lock:
+            job = self._in_flight.get(key)
+            if job is not None:
+                # Same description already rendering: share the job.
+                job.subscribers += 1
+                if callback:
+                    job.callbacks.append(callback)
+                self.deduplicated += 1
+                return job
+            if len(self._in_flight) >= self.max_pending:
+                self.rejected += 1
+                raise QueueFull("Too many pending media jobs")
+            job = MEDIA_JOB(description)
+            if callback:
+                job.callbacks.append(callback)
+            self._in_flight[key] = job
+            self.jobs.set(job.id, job)
+            self.submitted += 1
+        self.pool.submit(self._run, key, job, _running_loop())
+        return job
+
+    def _run(self, key, job, loop=None):
+        job.status = RUNNING
+        try:
+            result = self.run_fn(job.description)
+            if asyncio.iscoroutine(result):
+                # Coroutine jobs go back to the submitting loop, which owns
+                # the async upstream clients; this thread only waits.
+                result = asyncio.run_coroutine_threadsafe(result, loop).result()
+            job.result = result
+            job.status = DONE
+        except Exception as e:
+            logging.error("Media job %s failed: %s", job.id, e)
+            job.error = str(e)
+            job.status = FAILED
+        job.finished = time.time()
+        with self._lock:
+            self._in_flight.pop(key, None)
+            callbacks = list(job.callbacks)
+        for callback in callbacks:
+            try:
+                callback(job)
+            except Exception as e:
+                logging.error("Media job %s callback failed: %s", job.id, e)
+        job.done.set()
+
+    def get(self, job_id):
+        return self.jobs.get(job_id)
+
+    def wait(self, job_id, timeout):
+        job = self.get(job_id)
+        if job is not None and timeout:
+            job.done.wait(timeout)
+        return job
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": len(self._in_flight),
+                "max_pending": self.max_pending,
+                "submitted": self.submitted,
+                "deduplicated": self.deduplicated,
+                "rejected": self.rejected,
+                "tracked": len(self.jobs),
+            }
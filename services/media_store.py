@@ -0,0 +1,251 @@
+import os
+import time
+import hashlib
+import logging
+import tempfile
+import mimetypes
+import threading
+import requests
+from urllib.parse import urlsplit
+from requests.adapters import HTTPAdapter
+from services.utils import normalize_query
+
+CHUNK_SIZE = 64 * 1024
+MAX_MEDIA_BYTES = int(os.getenv("MEDIA_STORE_MAX_BYTES", str(20 * 1024 * 1024)))
+# Names are content hashes, so a stored file never changes.
+CACHE_MAX_AGE = 365 * 24 * 60 * 60
+EXTENSIONS = {"image/png": ".png", "image/jpeg": ".jpg", "image/webp": ".webp", "image/gif": ".gif"}
+
+
+def prompt_key(prompt):
+    return hashlib.sha256(normalize_query(prompt).encode()).hexdigest()
+
+
+def media_name(digest, content_type):
+    return digest + EXTENSIONS.get(content_type, ".bin")
+
+
+def is_absolute_url(url):
+    parts = urlsplit(url)
+    return parts.scheme in ("http", "https") and bool(parts.netloc)
+
+
+def content_type_for(name):
+    return mimetypes.guess_type(name)[0] or "application/octet-stream"
+
+
+class FS_BACKEND:
+    def __init__(self, root):
+        self.root = root
+        self.tmp_dir = os.path.join(root, "tmp")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+
+    def path(self, name):
+        return os.path.join(self.root, name[:2], name)
+
+    def exists(self, name):
+        return os.path.exists(self.path(name))
+
+    def commit(self, tmp_path, name, content_type):
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # tmp_dir sits on the same filesystem, so the rename is atomic.
+        os.replace(tmp_path, path)
+
+    def local_path(self, name):
+        path = self.path(name)
+        return path if os.path.exists(path) else None
+
+    def signed_url(self, name):
+        return None
+
+    def stats(self):
+        return {"backend": "fs"}
+
+
+class S3_BACKEND:
+    # Any S3-compatible service works (MinIO, R2, ...) via endpoint_url.
+    def __init__(self, bucket, prefix="media/", endpoint_url=None):
+        import boto3
+
+        self.client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.bucket = bucket
+        self.prefix = prefix
+        self.tmp_dir = None
+
+    def key(self, name):
+        return self.prefix + name
+
+    def exists(self, name):
+        from botocore.exceptions import ClientError
+
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.key(name))
+            return True
+        except ClientError:
+            return False
+
+    def commit(self, tmp_path, name, content_type):
+        try:
+            self.client.upload_file(
+                tmp_path,
+                self.bucket,
+                self.key(name),
+                ExtraArgs={
+                    "ContentType": content_type,
+                    "CacheControl": f"public, max-age={CACHE_MAX_AGE}, immutable",
+                },
+            )
+        finally:
+            os.unlink(tmp_path)
+
+    def local_path(self, name):
+        return None
+
+    def signed_url(self, name, expires=3600):
+        return self.client.generate_presigned_url(
+            "get_object", Params={"Bucket": self.bucket, "Key": self.key(name)}, ExpiresIn=expires
+        )
+
+    def stats(self):
+        return {"backend": "s3"}
+
+
+class MEDIA_STORE:
+    def __init__(self, backend, public_url, index=None, timeout=(3, 30), max_bytes=MAX_MEDIA_BYTES):
+        self.backend = backend
+        # index records which prompts produced which file (DB_OPERATOR).
+        self.index = index
+        self.public_url = public_url.rstrip("/")
+        self.timeout = timeout
+        self.max_bytes = max_bytes
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=16)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._lock = threading.Lock()
+        self.stored = 0
+        self.duplicates = 0
+        self.prompt_hits = 0
+        self.failures = 0
+        self.bytes_written = 0
+
+    def url_for(self, name):
+        return f"{self.public_url}/{name}"
+
+    def is_stored(self, url):
+        return bool(url) and url.startswith(self.public_url + "/")
+
+    def find_by_prompt(self, prompt):
+        if self.index is None or not prompt:
+            return None
+        try:
+            doc = self.index.find_media_by_prompt(prompt_key(prompt))
+        except Exception as e:
+            logging.warning("Media prompt lookup failed: %s", e)
+            return None
+        if doc is None:
+            return None
+        with self._lock:
+            self.prompt_hits += 1
+        return self.url_for(doc["name"])
+
+    def _download(self, url, tmp):
+        digest = hashlib.sha256()
+        size = 0
+        with self.session.get(url, stream=True, timeout=self.timeout) as response:
+            response.raise_for_status()
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip()
+            for chunk in response.iter_content(CHUNK_SIZE):
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise ValueError(f"Media larger than {self.max_bytes} bytes: {url}")
+                digest.update(chunk)
+                tmp.write(chunk)
+        return digest.hexdigest(), content_type, size
+
+    def store_url(self, url, prompt=None):
+        started = time.perf_counter()
+        with tempfile.NamedTemporaryFile(dir=self.backend.tmp_dir, delete=False) as tmp:
+            try:
+                digest, content_type, size = self._download(url, tmp)
+            except BaseException:
+                tmp.close()
+                os.unlink(tmp.name)
+                raise
+        name = media_name(digest, content_type)
+        if self.backend.exists(name):
+            os.unlink(tmp.name)
+            duplicate = True
+        else:
+            self.backend.commit(tmp.name, name, content_type)
+            duplicate = False
+        if self.index is not None:
+            self.index.save_media(digest, name, content_type, size, prompt_key(prompt) if prompt else None)
+        with self._lock:
+            if duplicate:
+                self.duplicates += 1
+            else:
+                self.stored += 1
+                self.bytes_written += size
+        logging.debug("Stored %s (%s bytes) in %.3fs", name, size, time.perf_counter() - started)
+        return self.url_for(name)
+
+    def persist(self, url, prompt=None):
+        # Never fails the caller: the original URL still works for a while.
+        try:
+            return self.store_url(url, prompt)
+        except Exception as e:
+            # Includes index (PyMongoError) and S3 (botocore) failures.
+            with self._lock:
+                self.failures += 1
+            logging.error("Could not persist media %s: %s", url, e)
+            return None
+
+    def stats(self):
+        with self._lock:
+            out = {
+                "stored": self.stored,
+                "duplicates": self.duplicates,
+                "prompt_hits": self.prompt_hits,
+                "failures": self.failures,
+                "bytes_written": self.bytes_written,
+            }
+        out.update(self.backend.stats())
+        return out
+
+
+class NULL_MEDIA_STORE:
+    backend = None
+
+    def is_stored(self, url):
+        return False
+
+    def find_by_prompt(self, prompt):
+        return None
+
+    def persist(self, url, prompt=None):
+        return None
+
+    def stats(self):
+        return {"backend": "off"}
+
+
+def create_media_store(index=None):
+    backend_name = os.getenv("MEDIA_STORE_BACKEND", "off").lower()
+    public_url = os.getenv("MEDIA_PUBLIC_URL", "")
+    if backend_name in ("fs", "s3") and not is_absolute_url(public_url):
+        # Stored URLs are saved in chat history and returned to clients, so
+        # they need the scheme and host, e.g. https://speakimage.app/media.
+        raise ValueError(f"MEDIA_PUBLIC_URL must be an absolute URL, got {public_url!r}")
+    if backend_name == "fs":
+        backend = FS_BACKEND(os.getenv("MEDIA_STORE_PATH", "/tmp/speakimage_media"))
+    elif backend_name == "s3":
+        backend = S3_BACKEND(
+            os.environ["MEDIA_STORE_BUCKET"],
+            prefix=os.getenv("MEDIA_STORE_PREFIX", "media/"),
+            endpoint_url=os.getenv("MEDIA_STORE_ENDPOINT") or None,
+        )
+    else:
+        return NULL_MEDIA_STORE()
+    return MEDIA_STORE(backend, index=index, public_url=public_url)
@@ -0,0 +1,202 @@
+import os
+import time
+import bisect
+import inspect
+import logging
+import threading
+import functools
+import contextvars
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0, 30.0, 60.0)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0").lower() in ("1", "true", "yes", "on")
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(names, values):
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+class HISTOGRAM:
+    def __init__(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labels):
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = [(labels, list(s[0]), s[1], s[2]) for labels, s in self._series.items()]
+        for labels, counts, total, count in sorted(items):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                label_str = _format_labels(self.label_names + ("le",), labels + (le,))
+                lines.append(f"{self.name}_bucket{label_str} {cumulative}")
+            label_str = _format_labels(self.label_names, labels)
+            lines.append(f"{self.name}_sum{label_str} {total}")
+            lines.append(f"{self.name}_count{label_str} {count}")
+        return lines
+
+
+class METRICS_REGISTRY:
+    def __init__(self):
+        self.histograms = []
+        self.collectors = []
+
+    def histogram(self, name, help, label_names=(), buckets=DEFAULT_BUCKETS):
+        histogram = HISTOGRAM(name, help, label_names, buckets)
+        self.histograms.append(histogram)
+        return histogram
+
+    def register_collector(self, collector):
+        # collector() yields (name, type, help, [(labels_dict, value), ...]).
+        self.collectors.append(collector)
+
+    def render(self):
+        lines = []
+        for histogram in self.histograms:
+            lines.extend(histogram.render())
+        for collector in self.collectors:
+            try:
+                families = list(collector())
+            except Exception as e:
+                logging.warning("Metrics collector failed: %s", e)
+                continue
+            for name, metric_type, help, samples in families:
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {metric_type}")
+                for labels, value in samples:
+                    if value is None:
+                        continue
+                    names = tuple(labels.keys())
+                    lines.append(f"{name}{_format_labels(names, tuple(labels.values()))} {value}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = METRICS_REGISTRY()
+STAGE_SECONDS = REGISTRY.histogram(
+    "speakimage_stage_duration_seconds", "Duration of chat pipeline and DB stages.", ("stage",)
+)
+REQUEST_SECONDS = REGISTRY.histogram(
+    "speakimage_http_request_duration_seconds",
+    "Duration of HTTP requests by route.",
+    ("method", "route", "status"),
+)
+
+_trace = contextvars.ContextVar("request_trace", default=None)
+
+
+def start_trace():
+    trace = []
+    _trace.set(trace)
+    return trace
+
+
+def current_trace():
+    return _trace.get()
+
+
+def record_stage(stage, seconds):
+    STAGE_SECONDS.observe(seconds, stage)
+    trace = _trace.get()
+    if trace is not None:
+        trace.append((stage, seconds))
+
+
+@contextmanager
+def span(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(stage, time.perf_counter() - started)
+
+
+def timed(stage):
+    def decorator(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def async_wrapper(*args, **kwargs):
+                started = time.perf_counter()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    record_stage(stage, time.perf_counter() - started)
+
+            return async_wrapper
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record_stage(stage, time.perf_counter() - started)
+
+        return wrapper
+
+    return decorator
+
+
+def instrument_methods(prefix):
+    def decorator(cls):
+        for name, member in list(vars(cls).items()):
+            if name.startswith("_") or not inspect.isfunction(member):
+                continue
+            setattr(cls, name, timed(f"{prefix}.{name}")(member))
+        return cls
+
+    return decorator
+
+
+def server_timing_header(trace):
+    totals = {}
+    for stage, seconds in trace or []:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(
+        f"{stage.replace('.', '_')};dur={seconds * 1000:.1f}" for stage, seconds in totals.items()
+    )
+
+
+def render_metrics():
+    return REGISTRY.render()
+
+
+def _flatten(prefix, stats):
+    for key, value in stats.items():
+        name = f"{prefix}_{key}"
+        if isinstance(value, dict):
+            yield from _flatten(name, value)
+        elif isinstance(value, bool):
+            yield name, int(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+
+def stats_collector(prefix, stats_fn, help="Snapshot of internal stats."):
+    def collect():
+        for name, value in _flatten(prefix, stats_fn()):
+            yield name, "gauge", help, [({}, value)]
+
+    return collect
@@ -0,0 +1,149 @@
+import os
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from werkzeug.security import check_password_hash, generate_password_hash
+
+# werkzeug method strings, e.g. "scrypt:32768:8:1" or "pbkdf2:sha256:600000".
+DEFAULT_METHOD = "scrypt:32768:8:1"
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def stored_method(hashed):
+    return hashed.split("$", 1)[0] if hashed else ""
+
+
+def _hash(password, method, salt_length):
+    return generate_password_hash(password, method=method, salt_length=salt_length)
+
+
+def _verify(hashed, password):
+    return check_password_hash(hashed, password)
+
+
+class PASSWORD_HASHER:
+    def __init__(self, method=None, salt_length=16, max_workers=None, mode=None, max_pending=None, timeout=None):
+        self.method = method or os.getenv("PASSWORD_HASH_METHOD", DEFAULT_METHOD)
+        self.salt_length = salt_length
+        self.max_workers = max_workers or int(os.getenv("PASSWORD_HASH_WORKERS", "0")) or os.cpu_count() or 1
+        # "process" keeps hashing off the request threads and the GIL; "thread"
+        # is the fallback where process pools are unavailable (e.g. no
+        # /dev/shm); "inline" hashes on the calling thread.
+        self.mode = (mode or os.getenv("PASSWORD_HASH_POOL", "process")).lower()
+        self.timeout = timeout or float(os.getenv("PASSWORD_HASH_TIMEOUT", "10"))
+        self._slots = threading.BoundedSemaphore(max_pending or self.max_workers * 4)
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._method_prefix = None
+        self.hashed = 0
+        self.verified = 0
+        self.rehashed = 0
+        self.rejected = 0
+
+    @property
+    def executor(self):
+        if self._executor is None or self._pid != os.getpid():
+            with self._lock:
+                if self._executor is None or self._pid != os.getpid():
+                    self._executor = self._create_executor()
+                    self._pid = os.getpid()
+        return self._executor
+
+    def _create_executor(self):
+        if self.mode == "process":
+            try:
+                return ProcessPoolExecutor(max_workers=self.max_workers)
+            except (OSError, NotImplementedError, ImportError) as e:
+                logging.warning("Process pool unavailable for password hashing, using threads: %s", e)
+                self.mode = "thread"
+        return ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="password")
+
+    def _discard_executor(self, executor):
+        # A worker died (OOM kill, segfault): the pool refuses all further
+        # work, so the next call builds a new one.
+        with self._lock:
+            if self._executor is executor:
+                self._executor = None
+        executor.shutdown(wait=False)
+
+    def _submit(self, fn, *args):
+        executor = self.executor
+        try:
+            return executor.submit(fn, *args), executor
+        except BrokenProcessPool:
+            logging.warning("Password hashing pool broke, starting a new one")
+            self._discard_executor(executor)
+            executor = self.executor
+            return executor.submit(fn, *args), executor
+
+    def _run(self, fn, *args):
+        if self.mode == "inline":
+            return fn(*args)
+        # Bound the queue so a login burst is turned away instead of piling
+        # up behind the workers.
+        if not self._slots.acquire(timeout=self.timeout):
+            self.rejected += 1
+            raise HasherBusy("Password hashing is saturated")
+        try:
+            future, executor = self._submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        # The slot is held until the work really finishes, not just until
+        # this caller stops waiting for it.
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except TimeoutError:
+            future.cancel()
+            self.rejected += 1
+            raise HasherBusy("Password hashing timed out") from None
+        except BrokenProcessPool:
+            self._discard_executor(executor)
+            raise
+
+    def hash(self, password):
+        self.hashed += 1
+        return self._run(_hash, password, self.method, self.salt_length)
+
+    def verify(self, hashed, password):
+        self.verified += 1
+        return self._run(_verify, hashed, password)
+
+    @property
+    def method_prefix(self):
+        # werkzeug expands e.g. "scrypt" to "scrypt:32768:8:1" in the stored
+        # hash, so learn the full form from one cheap throwaway hash.
+        if self._method_prefix is None:
+            self._method_prefix = stored_method(_hash("", self.method, 1))
+        return self._method_prefix
+
+    def needs_rehash(self, hashed):
+        return stored_method(hashed) != self.method_prefix
+
+    def rehash_in_background(self, password, on_done):
+        # Runs after a successful login whose stored hash uses old parameters.
+        def run():
+            try:
+                on_done(self.hash(password))
+                self.rehashed += 1
+            except Exception as e:
+                logging.error("Password rehash failed: %s", e)
+
+        threading.Thread(target=run, name="password-rehash", daemon=True).start()
+
+    def stats(self):
+        return {
+            "method": self.method,
+            "mode": self.mode,
+            "workers": self.max_workers,
+            "hashed": self.hashed,
+            "verified": self.verified,
+            "rehashed": self.rehashed,
+            "rejected": self.rejected,
+        }
@@ -0,0 +1,94 @@
+import json
+import logging
+from prompt import PROMPT_TO_ANALYSE_QUERY, PROMPT_TO_ANSWER_WITH_TOOLS
+from services.context import current_context
+
+OAI_MODEL = "gpt-4o"
+DALL_E_MODEL = "dall-e-3"
+IMG_SIZE = "1024x1024"
+
+GENERATE_IMAGE_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "generate_image",
+        "description": "Generate an image related to description.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "description": {
+                    "type": "string",
+                    "description": "The description of image which needs to be generated",
+                }
+            },
+            "required": ["description"],
+        },
+    },
+}
+
+GET_ANSWER_TOOL = {
+    "type": "function",
+    "function": {
+        "name": "get_answer",
+        "description": "Get the text response for the query from the user.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "query": {
+                    "type": "string",
+                    "description": "The query from the user that needs to be answered",
+                }
+            },
+            "required": ["query"],
+        },
+    },
+}
+
+ROUTER_TOOLS = [GENERATE_IMAGE_TOOL, GET_ANSWER_TOOL]
+SINGLE_CALL_TOOLS = [GENERATE_IMAGE_TOOL]
+
+
+def router_messages(query):
+    return [
+        {"role": "system", "content": PROMPT_TO_ANALYSE_QUERY},
+        *current_context(),
+        {"role": "user", "content": query},
+    ]
+
+
+def single_call_messages(query):
+    return [
+        {"role": "system", "content": PROMPT_TO_ANSWER_WITH_TOOLS},
+        *current_context(),
+        {"role": "user", "content": query},
+    ]
+
+
+def answer_messages(query):
+    return [
+        {
+            "role": "system",
+            "content": "Answer with a bit of detailed explanation. There could be causal question or specific question.",
+        },
+        *current_context(),
+        {"role": "user", "content": query},
+    ]
+
+
+def build_response(text, media=(None, None, None)):
+    gpt_image_url, pixabay_img_url, video_url = media
+    return {
+        "text": text,
+        "dalle_image": gpt_image_url,
+        "pixabay_img": pixabay_img_url,
+        "pixabay_video": video_url,
+    }
+
+
+def parse_image_description(calls):
+    for name, arguments in calls:
+        if name == "generate_image":
+            try:
+                return json.loads(arguments).get("description")
+            except ValueError:
+                logging.error("Invalid generate_image arguments: %s", arguments)
+    return None
@@ -0,0 +1,163 @@
+import os
+import json
+import atexit
+import asyncio
+import logging
+import threading
+import httpx
+from services.cache import TTL_CACHE
+from services.lazy import LOOP_LOCAL
+from services.upstream import get_upstream
+from services.utils import normalize_query
+
+PIXABAY_API_URL = os.getenv("PIXABAY_API_URL", "https://pixabay.com/api/")
+# Pixabay asks API clients to cache search results for 24 hours.
+CACHE_TTL = 24 * 60 * 60
+
+
+def default_timeout():
+    return (
+        float(os.getenv("PIXABAY_CONNECT_TIMEOUT", "2")),
+        float(os.getenv("PIXABAY_READ_TIMEOUT", "4")),
+    )
+
+
+def hedge_after():
+    # Seconds before a second copy of a slow search is sent; 0 disables.
+    return float(os.getenv("PIXABAY_HEDGE_AFTER", "0"))
+
+
+def parse_image(out):
+    if out.get("hits"):
+        large_img_url = out["hits"][0].get("largeImageURL")
+        return large_img_url if large_img_url else out["hits"][0]["imageURL"]
+    return None
+
+
+def parse_video(out):
+    if out.get("hits"):
+        return out["hits"][0]["videos"]["medium"]["url"]
+    return None
+
+
+class PIXABAY_CACHE:
+    def __init__(self, cache_size=None, cache_path=None, persist_every=25):
+        self.cache = TTL_CACHE(
+            maxsize=cache_size or int(os.getenv("PIXABAY_CACHE_SIZE", "5000")), ttl=CACHE_TTL
+        )
+        self.cache_path = cache_path if cache_path is not None else os.getenv(
+            "PIXABAY_CACHE_PATH", "/tmp/speakimage_pixabay_cache.json"
+        )
+        self.persist_every = persist_every
+        self._dirty = 0
+        self._persist_lock = threading.Lock()
+        self.load()
+        atexit.register(self.persist)
+
+    @staticmethod
+    def key(kind, description):
+        return f"{kind}:{normalize_query(description)}"
+
+    def get(self, kind, description):
+        return self.cache.get(self.key(kind, description))
+
+    def set(self, kind, description, url):
+        self.cache.set(self.key(kind, description), {"url": url})
+        self._dirty += 1
+        if self.persist_every and self._dirty >= self.persist_every:
+            self.persist()
+
+    def load(self):
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path) as f:
+                self.cache.load(tuple(item) for item in json.load(f))
+        except (OSError, ValueError) as e:
+            logging.warning("Could not load Pixabay cache from %s: %s", self.cache_path, e)
+
+    def persist(self):
+        if not self.cache_path:
+            return
+        with self._persist_lock:
+            self._dirty = 0
+            tmp_path = f"{self.cache_path}.{os.getpid()}.tmp"
+            try:
+                with open(tmp_path, "w") as f:
+                    json.dump(self.cache.items(), f)
+                os.replace(tmp_path, self.cache_path)
+            except OSError as e:
+                logging.warning("Could not persist Pixabay cache to %s: %s", self.cache_path, e)
+
+    def stats(self):
+        return self.cache.stats()
+
+
+class PIXABAY_CLIENT:
+    def __init__(self, api_key, base_url=PIXABAY_API_URL, timeout=None, pool_size=None, cache=None):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/") + "/"
+        self.timeout = timeout or default_timeout()
+        self.pool_size = pool_size or int(os.getenv("PIXABAY_POOL_SIZE", "20"))
+        self.http = LOOP_LOCAL(self._create_http)
+        self.hedge_after = hedge_after()
+        self.upstream = get_upstream("pixabay", self.timeout)
+        self.cache = cache or PIXABAY_CACHE()
+
+    def _create_http(self):
+        # Like the requests adapter this replaces: keep pool_size connections
+        # alive but never queue a search behind the pool, hedges included.
+        limits = httpx.Limits(max_connections=None, max_keepalive_connections=self.pool_size)
+        return httpx.AsyncClient(limits=limits)
+
+    async def _get(self, path, params, timeout):
+        connect, read = timeout
+        # get() on the LOOP_LOCAL itself returns this loop's client.
+        client = self.http.get()
+        response = await client.get(
+            self.base_url + path,
+            params=dict(params, key=self.api_key),
+            timeout=httpx.Timeout(read, connect=connect),
+        )
+        response.raise_for_status()
+        return response.json()
+
+    async def _search(self, path, params):
+        if self.hedge_after > 0:
+            return await self.upstream.hedged(self.hedge_after, self._get, path, params)
+        return await self.upstream.call(self._get, path, params)
+
+    async def _cached(self, kind, description, fetch):
+        entry = self.cache.get(kind, description)
+        if entry is not None:
+            return entry["url"]
+        url = await fetch(description)
+        self.cache.set(kind, description, url)
+        return url
+
+    async def _fetch_image(self, description):
+        return parse_image(await self._search("", {"q": description, "image_type": "photo"}))
+
+    async def _fetch_video(self, description):
+        return parse_video(await self._search("videos/", {"q": description}))
+
+    async def search_image(self, description):
+        return await self._cached("image", description, self._fetch_image)
+
+    async def search_video(self, description):
+        return await self._cached("video", description, self._fetch_video)
+
+    async def lookup(self, description):
+        results = await asyncio.gather(
+            self.search_image(description), self.search_video(description), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                logging.error("Pixabay lookup failed for %r: %s", description, result)
+        return tuple(None if isinstance(result, BaseException) else result for result in results)
+
+    def persist(self):
+        self.cache.persist()
+
+    def stats(self):
+        return self.cache.stats()
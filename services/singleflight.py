@@ -0,0 +1,172 @@
+import os
+import copy
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from concurrent.futures import Future
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not available on Windows
+    fcntl = None
+
+_MISSING = object()
+
+
+class FILE_LOCK_BACKEND:
+    # Coalesces across worker processes on one host: the first process to
+    # take the per-key flock computes the value and leaves it in a result
+    # file; processes that had to wait for the lock reuse that result.
+    def __init__(self, lock_dir, result_ttl=5.0, wait_timeout=60.0, poll_interval=0.05):
+        if fcntl is None:
+            raise RuntimeError("fcntl is not available on this platform")
+        self.lock_dir = lock_dir
+        self.result_ttl = result_ttl
+        self.wait_timeout = wait_timeout
+        self.poll_interval = poll_interval
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def _path(self, key, suffix):
+        return os.path.join(self.lock_dir, hashlib.sha256(key.encode()).hexdigest() + suffix)
+
+    async def _acquire(self, fd):
+        # Returns whether another process held the lock, or None on timeout.
+        deadline = time.monotonic() + self.wait_timeout
+        waited = False
+        while True:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                return waited
+            except BlockingIOError:
+                if time.monotonic() >= deadline:
+                    return None
+                waited = True
+                await asyncio.sleep(self.poll_interval)
+
+    def _read_result(self, key):
+        path = self._path(key, ".json")
+        try:
+            if time.time() - os.path.getmtime(path) > self.result_ttl:
+                return _MISSING
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return _MISSING
+
+    def _write_result(self, key, value):
+        path = self._path(key, ".json")
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, "w") as f:
+                json.dump(value, f)
+            os.replace(tmp_path, path)
+        except (OSError, TypeError, ValueError) as e:
+            logging.debug("Could not share single-flight result: %s", e)
+
+    async def run(self, key, fn):
+        # fn returns an awaitable; the lock is held while it runs.
+        fd = os.open(self._path(key, ".lock"), os.O_CREAT | os.O_RDWR, 0o600)
+        try:
+            waited = await self._acquire(fd)
+            if waited is None:
+                logging.warning("Timed out waiting for the single-flight lock; computing locally")
+                return await fn(), True
+            try:
+                if waited:
+                    value = self._read_result(key)
+                    if value is not _MISSING:
+                        return value, False
+                value = await fn()
+                self._write_result(key, value)
+                return value, True
+            finally:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+        finally:
+            os.close(fd)
+
+
+class SINGLE_FLIGHT:
+    def __init__(self, name, backend=None):
+        self.name = name
+        self.backend = backend
+        self._calls = {}
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.executed = 0
+        self.coalesced = 0
+        self.coalesced_remote = 0
+
+    async def do(self, key, fn, *args, **kwargs):
+        # fn is a coroutine function. Returns (value, leader). Concurrent
+        # callers with the same key share the leader's result; each follower
+        # gets its own deep copy. The shared future is a thread-safe one, so
+        # callers on different event loops coalesce too.
+        with self._lock:
+            self.requests += 1
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            # shield: a follower giving up must not cancel the shared future.
+            return copy.deepcopy(await asyncio.shield(asyncio.wrap_future(future))), False
+        executed = True
+        try:
+            if self.backend is not None:
+                value, executed = await self.backend.run(key, lambda: fn(*args, **kwargs))
+            else:
+                value, executed = await fn(*args, **kwargs), True
+            future.set_result(copy.deepcopy(value))
+        except asyncio.CancelledError:
+            # The leader's request went away; its followers have not.
+            future.set_exception(RuntimeError(f"{self.name} single-flight leader was cancelled"))
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+                if self.backend is not None and not executed:
+                    self.coalesced_remote += 1
+                else:
+                    self.executed += 1
+        return value, executed
+
+    def stats(self):
+        with self._lock:
+            shared = self.coalesced + self.coalesced_remote
+            return {
+                "requests": self.requests,
+                "executed": self.executed,
+                "coalesced": self.coalesced,
+                "coalesced_remote": self.coalesced_remote,
+                "in_flight": len(self._calls),
+                "coalescing_ratio": round(shared / self.requests, 4) if self.requests else 0.0,
+            }
+
+
+class NO_FLIGHT:
+    async def do(self, key, fn, *args, **kwargs):
+        return await fn(*args, **kwargs), True
+
+    def stats(self):
+        return {"enabled": False}
+
+
+def create_single_flight(name):
+    if os.getenv("SINGLE_FLIGHT", "1") == "0":
+        return NO_FLIGHT()
+    lock_dir = os.getenv("SINGLE_FLIGHT_LOCK_DIR")
+    backend = None
+    if lock_dir and fcntl is not None:
+        backend = FILE_LOCK_BACKEND(
+            os.path.join(lock_dir, name),
+            result_ttl=float(os.getenv("SINGLE_FLIGHT_RESULT_TTL", "5")),
+        )
+    return SINGLE_FLIGHT(name, backend)
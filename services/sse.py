@@ -0,0 +1,20 @@
+import json
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+def format_event(event, data):
+    payload = json.dumps(data, default=str)
+    return f"event: {event}\ndata: {payload}\n\n"
+
+
+def wants_stream(req):
+    # req is a services.handler.INCOMING.
+    if "text/event-stream" in req.headers.get("Accept", ""):
+        return True
+    if req.args.get("stream", "").lower() in ("1", "true", "yes"):
+        return True
+    return bool(req.data.get("stream"))
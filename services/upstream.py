@@ -0,0 +1,299 @@
+import os
+import time
+import random
+import asyncio
+import logging
+import threading
+import contextvars
+from asyncio import FIRST_COMPLETED
+from contextlib import contextmanager, nullcontext
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+# Errors without a status code that still mean "try again": connection
+# resets and timeouts from openai, requests and httpx.
+RETRYABLE_ERRORS = {
+    "APIConnectionError",
+    "APITimeoutError",
+    "ConnectionError",
+    "ConnectTimeout",
+    "ReadTimeout",
+    "Timeout",
+    "TimeoutError",
+    "TimeoutException",
+    "TransportError",
+}
+
+_deadline = contextvars.ContextVar("upstream_deadline", default=None)
+
+
+class DeadlineExceeded(Exception):
+    pass
+
+
+class CircuitOpen(Exception):
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} circuit is open, retry in {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def setting(name, key, default):
+    # DALLE_RETRIES overrides UPSTREAM_RETRIES for the dalle upstream.
+    value = os.getenv(f"{name.upper()}_{key}") or os.getenv(f"UPSTREAM_{key}")
+    return type(default)(value) if value else default
+
+
+def start_deadline(seconds):
+    # Every upstream call made for the current request (including fan-out
+    # workers, which copy the context) shares this budget.
+    _deadline.set(None if seconds is None else time.monotonic() + seconds)
+
+
+@contextmanager
+def deadline(seconds):
+    # None lifts the deadline, for background work that outlives its request.
+    token = _deadline.set(None if seconds is None else time.monotonic() + seconds)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def remaining():
+    expires = _deadline.get()
+    return None if expires is None else max(0.0, expires - time.monotonic())
+
+
+def clamp_timeout(timeout, left):
+    if left is None:
+        return timeout
+    if timeout is None:
+        return left
+    if isinstance(timeout, tuple):
+        return tuple(min(part, left) for part in timeout)
+    return min(timeout, left)
+
+
+def status_of(error):
+    status = getattr(error, "status_code", None)
+    if status is None:
+        status = getattr(getattr(error, "response", None), "status_code", None)
+    return status
+
+
+def is_retryable(error):
+    status = status_of(error)
+    if isinstance(status, int):
+        return status == 429 or status >= 500
+    return any(cls.__name__ in RETRYABLE_ERRORS for cls in type(error).__mro__)
+
+
+def retry_after_of(error):
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    try:
+        return float(headers.get("retry-after")) if headers else None
+    except (TypeError, ValueError):
+        return None
+
+
+class CIRCUIT_BREAKER:
+    # Opens after failure_threshold consecutive upstream failures, fails fast
+    # for reset_timeout seconds, then lets a single probe call through.
+    def __init__(self, name, failure_threshold=None, reset_timeout=None):
+        self.name = name
+        self.failure_threshold = failure_threshold or setting(name, "BREAKER_FAILURES", 5)
+        self.reset_timeout = reset_timeout or setting(name, "BREAKER_RESET", 30.0)
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.opened = 0
+        self.short_circuited = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def _cooled_down(self):
+        return time.monotonic() - self.opened_at >= self.reset_timeout
+
+    def available(self):
+        # Read-only check for callers deciding whether to skip the upstream.
+        return self.state != OPEN or self._cooled_down()
+
+    def allow(self):
+        with self._lock:
+            if self.state == OPEN and self._cooled_down():
+                self.state = HALF_OPEN
+                self._probing = False
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN and not self._probing:
+                self._probing = True
+                return True
+            self.short_circuited += 1
+            return False
+
+    def retry_after(self):
+        return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logging.info("%s circuit closed", self.name)
+            self.state = CLOSED
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != OPEN:
+                    self.opened += 1
+                    logging.warning("%s circuit opened after %s failures", self.name, self.failures)
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+                self._probing = False
+
+    def stats(self):
+        return {
+            "state": self.state,
+            "consecutive_failures": self.failures,
+            "opened": self.opened,
+            "short_circuited": self.short_circuited,
+        }
+
+
+class UPSTREAM:
+    def __init__(self, name, timeout, retries=None, backoff=None, max_backoff=None, breaker=None, gate=None):
+        self.name = name
+        self.timeout = timeout
+        # Optional services.admission.UPSTREAM_GATE shared between upstreams.
+        self.gate = gate
+        self.retries = setting(name, "RETRIES", 2) if retries is None else retries
+        self.backoff = setting(name, "BACKOFF", 0.25) if backoff is None else backoff
+        self.max_backoff = setting(name, "MAX_BACKOFF", 4.0) if max_backoff is None else max_backoff
+        self.breaker = breaker or CIRCUIT_BREAKER(name)
+        self.calls = 0
+        self.retried = 0
+        self.failed = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+
+    def _count(self, counter):
+        with self._lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    def available(self):
+        return self.breaker.available()
+
+    def _delay(self, attempt, error):
+        retry_after = retry_after_of(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        # Full jitter keeps retries from many workers from lining up.
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** attempt)))
+
+    async def _attempt(self, fn, args, kwargs, left):
+        # The gate slot covers the call itself, never the backoff sleep.
+        async with self.gate.aslot(left) if self.gate is not None else nullcontext():
+            if not self.breaker.allow():
+                raise CircuitOpen(self.name, self.breaker.retry_after())
+            try:
+                result = await fn(*args, timeout=clamp_timeout(self.timeout, left), **kwargs)
+            except Exception as e:
+                # 429 and other 4xx mean the upstream is up and answering; only
+                # 5xx, timeouts and connection errors count against the circuit.
+                if is_retryable(e) and status_of(e) != 429:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                raise
+            self.breaker.record_success()
+            return result
+
+    async def call(self, fn, *args, **kwargs):
+        # fn is a coroutine function (the async OpenAI and httpx clients); it
+        # gets timeout=, trimmed to what is left of the request deadline.
+        self._count("calls")
+        attempt = 0
+        while True:
+            left = remaining()
+            if left is not None and left <= 0:
+                self._count("failed")
+                raise DeadlineExceeded(f"No time left to call {self.name}")
+            try:
+                return await self._attempt(fn, args, kwargs, left)
+            except Exception as e:
+                delay = self._delay(attempt, e) if is_retryable(e) and attempt < self.retries else None
+                left = remaining()
+                if delay is None or (left is not None and delay >= left):
+                    self._count("failed")
+                    raise
+                logging.warning("%s call failed (%s), retrying in %.2fs", self.name, e, delay)
+                self._count("retried")
+                await asyncio.sleep(delay)
+                attempt += 1
+
+    async def hedged(self, hedge_after, fn, *args, **kwargs):
+        # Only for idempotent reads: if the first attempt has not answered
+        # within hedge_after seconds a second one is sent and the first
+        # success wins. The slower request is cancelled.
+        first = asyncio.ensure_future(self.call(fn, *args, **kwargs))
+        pending = {first}
+        error = None
+        try:
+            done, _ = await asyncio.wait(pending, timeout=hedge_after)
+            if done:
+                return first.result()
+            self._count("hedges")
+            second = asyncio.ensure_future(self.call(fn, *args, **kwargs))
+            pending.add(second)
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=remaining(), return_when=FIRST_COMPLETED)
+                if not done:
+                    raise DeadlineExceeded(f"{self.name} hedged call ran out of time")
+                for task in done:
+                    if task.exception() is None:
+                        if task is second:
+                            self._count("hedge_wins")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    def stats(self):
+        return dict(
+            self.breaker.stats(),
+            calls=self.calls,
+            retries=self.retried,
+            failures=self.failed,
+            hedges=self.hedges,
+            hedge_wins=self.hedge_wins,
+        )
+
+
+_upstreams = {}
+_upstreams_lock = threading.Lock()
+
+
+def get_upstream(name, timeout=None, gate=None):
+    with _upstreams_lock:
+        if name not in _upstreams:
+            _upstreams[name] = UPSTREAM(name, timeout, gate=gate)
+        return _upstreams[name]
+
+
+def upstream_stats():
+    with _upstreams_lock:
+        return {name: upstream.stats() for name, upstream in _upstreams.items()}
+
+
+def upstream_available(name):
+    # Upstreams that have not been used yet count as available.
+    with _upstreams_lock:
+        upstream = _upstreams.get(name)
+    return upstream is None or upstream.available()
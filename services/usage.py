@@ -0,0 +1,126 @@
+import threading
+import contextvars
+
+
+class REQUEST_USAGE:
+    def __init__(self, pipeline=None):
+        self.pipeline = pipeline
+        self.calls = {}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self._lock = threading.Lock()
+
+    @property
+    def total_calls(self):
+        return sum(self.calls.values())
+
+    def record(self, kind, response=None):
+        usage = getattr(response, "usage", None)
+        with self._lock:
+            self.calls[kind] = self.calls.get(kind, 0) + 1
+            if usage is not None:
+                self.prompt_tokens += getattr(usage, "prompt_tokens", 0) or 0
+                self.completion_tokens += getattr(usage, "completion_tokens", 0) or 0
+
+    def to_dict(self):
+        return {
+            "pipeline": self.pipeline,
+            "calls": dict(self.calls),
+            "total_calls": self.total_calls,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+        }
+
+
+class USAGE_TOTALS:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.pipelines = {}
+
+    def add(self, usage):
+        if usage.pipeline is None:
+            return
+        with self._lock:
+            totals = self.pipelines.setdefault(
+                usage.pipeline,
+                {"requests": 0, "calls": {}, "total_calls": 0, "prompt_tokens": 0, "completion_tokens": 0},
+            )
+            totals["requests"] += 1
+            for kind, count in usage.calls.items():
+                totals["calls"][kind] = totals["calls"].get(kind, 0) + count
+            totals["total_calls"] += usage.total_calls
+            totals["prompt_tokens"] += usage.prompt_tokens
+            totals["completion_tokens"] += usage.completion_tokens
+
+    def snapshot(self):
+        with self._lock:
+            out = {}
+            for pipeline, totals in self.pipelines.items():
+                out[pipeline] = dict(totals, calls=dict(totals["calls"]))
+                out[pipeline]["calls_per_request"] = round(
+                    totals["total_calls"] / totals["requests"], 3
+                ) if totals["requests"] else 0
+            return out
+
+
+TOTALS = USAGE_TOTALS()
+_current = contextvars.ContextVar("openai_usage", default=None)
+
+
+def start_request():
+    usage = REQUEST_USAGE()
+    _current.set(usage)
+    return usage
+
+
+def current_usage():
+    return _current.get()
+
+
+def set_pipeline(pipeline):
+    usage = _current.get()
+    if usage is not None:
+        usage.pipeline = pipeline
+
+
+def record_call(kind, response=None):
+    usage = _current.get()
+    if usage is not None:
+        usage.record(kind, response)
+
+
+def finish_request():
+    usage = _current.get()
+    if usage is not None:
+        TOTALS.add(usage)
+    return usage
+
+
+def usage_collector():
+    snapshot = TOTALS.snapshot()
+    yield (
+        "speakimage_chat_requests_total",
+        "counter",
+        "Chat requests by pipeline.",
+        [({"pipeline": pipeline}, totals["requests"]) for pipeline, totals in snapshot.items()],
+    )
+    yield (
+        "speakimage_openai_calls_total",
+        "counter",
+        "OpenAI calls by pipeline and call kind.",
+        [
+            ({"pipeline": pipeline, "kind": kind}, count)
+            for pipeline, totals in snapshot.items()
+            for kind, count in totals["calls"].items()
+        ],
+    )
+    yield (
+        "speakimage_openai_tokens_total",
+        "counter",
+        "OpenAI tokens by pipeline and direction.",
+        [
+            ({"pipeline": pipeline, "direction": direction}, totals[f"{direction}_tokens"])
+            for pipeline, totals in snapshot.items()
+            for direction in ("prompt", "completion")
+        ],
+    )
@@ -0,0 +1,26 @@
+import re
+import unicodedata
+
+_env_loaded = False
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_query(query):
+    if not query:
+        return ""
+    text = unicodedata.normalize("NFKC", query).lower()
+    text = text.replace("’", "'").replace("'", "")
+    text = _PUNCTUATION.sub(" ", text)
+    return _WHITESPACE.sub(" ", text).strip()
+
+
+def load_env():
+    # One .env read per process, however many entry points ask for it.
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        _env_loaded = True
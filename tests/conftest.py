@@ -0,0 +1,12 @@
+import uuid
+
+import pytest
+
+from db.operations import DB_OPERATOR
+
+
+@pytest.fixture
+def operator(monkeypatch):
+    # db.pool keeps one client per URL, so a fresh URL is a fresh database.
+    monkeypatch.setenv("MONGO_URL_STATIC", f"mongomock://{uuid.uuid4().hex}")
+    return DB_OPERATOR()
@@ -0,0 +1,34 @@
+import pytest
+
+from services.admission import client_ip
+
+SPOOFED = {"X-Forwarded-For": "6.6.6.6, 203.0.113.7"}
+
+
+def test_forwarded_for_is_ignored_without_trusted_proxies():
+    assert client_ip(SPOOFED, "10.0.0.1", trusted_hops=0) == "10.0.0.1"
+
+
+@pytest.mark.parametrize(
+    "hops, expected",
+    [
+        # One proxy: only the entry it appended can be trusted.
+        (1, "203.0.113.7"),
+        (2, "6.6.6.6"),
+        # More trusted hops than entries: the leftmost is as far as it goes.
+        (3, "6.6.6.6"),
+    ],
+)
+def test_forwarded_for_counts_trusted_hops_from_the_right(hops, expected):
+    assert client_ip(SPOOFED, "10.0.0.1", trusted_hops=hops) == expected
+
+
+def test_remote_addr_without_forwarded_for():
+    assert client_ip({}, "10.0.0.1", trusted_hops=1) == "10.0.0.1"
+
+
+def test_trusted_hops_come_from_the_environment(monkeypatch):
+    monkeypatch.setenv("TRUSTED_PROXY_HOPS", "1")
+    assert client_ip(SPOOFED, "10.0.0.1") == "203.0.113.7"
+    monkeypatch.delenv("TRUSTED_PROXY_HOPS")
+    assert client_ip(SPOOFED, "10.0.0.1") == "10.0.0.1"
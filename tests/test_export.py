@@ -0,0 +1,26 @@
+import pytest
+
+
+@pytest.fixture
+def users(operator):
+    operator.create_user("a@example.com", "hash-a", "A")
+    operator.create_user("b@example.com", "hash-b", "B")
+    return operator
+
+
+@pytest.mark.parametrize(
+    "fields",
+    [None, ["password"], ["email", "password"], ["_id", "password"], ["missing"]],
+)
+def test_exported_users_never_include_password(users, fields):
+    exported = list(users.iter_users(fields=fields))
+
+    assert len(exported) == 2
+    assert all("password" not in user for user in exported)
+
+
+def test_export_keeps_requested_fields(users):
+    exported = list(users.iter_users(fields=["email"]))
+
+    assert sorted(user["email"] for user in exported) == ["a@example.com", "b@example.com"]
+    assert all(set(user) == {"_id", "email"} for user in exported)
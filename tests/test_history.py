@@ -0,0 +1,60 @@
+import pytest
+
+from db.operations import BUCKETED
+
+
+@pytest.fixture(params=["embedded", BUCKETED])
+def chat(request, operator):
+    # A chat of 25 turns, "q0" the oldest, stored in each layout.
+    operator.storage = request.param
+    thread_id = operator.init_chat_in_db("u1", "Title", {"query": "q0"})
+    for turn in range(1, 25):
+        operator.add_message(thread_id, {"query": f"q{turn}"})
+    return operator, thread_id
+
+
+def queries(page):
+    return [message["query"] for message in page["messages"]]
+
+
+def test_first_page_is_newest_first(chat):
+    operator, thread_id = chat
+
+    page = operator.get_history_page(thread_id, 0, 10)
+
+    assert queries(page) == [f"q{turn}" for turn in range(24, 14, -1)]
+    assert page["total"] == 25
+    assert page["next_offset"] == 10
+
+
+def test_last_page_is_short(chat):
+    operator, thread_id = chat
+
+    page = operator.get_history_page(thread_id, 20, 10)
+
+    assert queries(page) == ["q4", "q3", "q2", "q1", "q0"]
+    assert page["next_offset"] is None
+
+
+def test_offset_past_the_end_is_empty(chat):
+    operator, thread_id = chat
+
+    page = operator.get_history_page(thread_id, 30, 10)
+
+    assert page["messages"] == []
+    assert page["total"] == 25
+    assert page["next_offset"] is None
+
+
+def test_summary_is_returned_on_request(chat):
+    operator, thread_id = chat
+    operator.save_context_summary(thread_id, "So far", 5)
+
+    page = operator.get_history_page(thread_id, 0, 5, include_summary=True)
+
+    assert page["summary"] == {"text": "So far", "turns": 5}
+    assert "summary" not in operator.get_history_page(thread_id, 0, 5)
+
+
+def test_missing_chat(operator):
+    assert operator.get_history_page("0123456789ab0123456789ab") is None
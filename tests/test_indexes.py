@@ -0,0 +1,42 @@
+import os
+import uuid
+
+import pytest
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+from db.indexes import QUERY_SHAPES, check_query_plans, ensure_indexes, main
+
+# Shapes looked up by _id are served by the built-in _id index.
+ID_LOOKUPS = {"get_user_by_id", "get_chat_by_id"}
+
+
+@pytest.fixture
+def database():
+    client = MongoClient(os.getenv("MONGO_TEST_URL", "mongodb://localhost:27017"), serverSelectionTimeoutMS=1000)
+    try:
+        client.admin.command("ping")
+    except PyMongoError:
+        client.close()
+        pytest.skip("no mongod available")
+    name = f"test_indexes_{uuid.uuid4().hex[:8]}"
+    yield client[name]
+    client.drop_database(name)
+    client.close()
+
+
+def test_every_query_shape_uses_an_index(database):
+    ensure_indexes(database)
+
+    results = {result["query"]: result for result in check_query_plans(database)}
+
+    assert set(results) == {shape[0] for shape in QUERY_SHAPES}
+    for name, result in results.items():
+        assert result["status"] == "ok", result
+        if name not in ID_LOOKUPS:
+            assert "IXSCAN" in result["stages"], result
+
+
+def test_check_fails_without_a_query_planner(operator):
+    # The operator fixture points MONGO_URL_STATIC at mongomock.
+    assert main(["--check"]) == 1
@@ -0,0 +1,149 @@
+import time
+import random
+import asyncio
+
+import httpx
+import pytest
+
+from benchmarks.stubs import parse_faults, start_stub_server
+from services.upstream import CIRCUIT_BREAKER, UPSTREAM, CircuitOpen, DeadlineExceeded, deadline
+
+CHAT = "/v1/chat/completions"
+IMAGES = "/v1/images/generations"
+PIXABAY = "/pixabay/"
+
+
+@pytest.fixture
+def stub():
+    # Tests change the fault and latency settings mid-run through `handler`.
+    server, url = start_stub_server()
+    yield server.RequestHandlerClass, url
+    server.shutdown()
+    server.server_close()
+
+
+async def request(client, url, timeout):
+    if PIXABAY in url:
+        response = await client.get(url, timeout=timeout)
+    else:
+        response = await client.post(url, json={"messages": [{"role": "user", "content": "test"}]}, timeout=timeout)
+    response.raise_for_status()
+    return response.json()
+
+
+def make_upstream(retries=2, failure_threshold=100, reset_timeout=60.0):
+    breaker = CIRCUIT_BREAKER("test", failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+    return UPSTREAM("test", timeout=10.0, retries=retries, backoff=0.01, max_backoff=0.05, breaker=breaker)
+
+
+async def outcome(coro):
+    try:
+        await coro
+        return 200
+    except CircuitOpen:
+        return "circuit_open"
+    except httpx.HTTPStatusError as e:
+        return e.response.status_code
+
+
+def test_retries_recover_from_transient_errors(stub):
+    handler, url = stub
+    handler.faults = parse_faults("openai=error:0.3:503")
+    upstream = make_upstream()
+    # The stub's faults and the retry jitter draw from the same generator.
+    random.seed(3)
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            return [await outcome(upstream.call(request, client, url + CHAT)) for _ in range(20)]
+
+    outcomes = asyncio.run(run())
+
+    assert upstream.retried > 0
+    assert outcomes.count(200) >= 18
+
+
+def test_rate_limits_do_not_open_the_circuit(stub):
+    handler, url = stub
+    handler.faults = parse_faults("openai=error:1:429")
+    upstream = make_upstream(retries=0, failure_threshold=2)
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            return [await outcome(upstream.call(request, client, url + CHAT)) for _ in range(5)]
+
+    assert asyncio.run(run()) == [429] * 5
+    assert upstream.breaker.stats()["opened"] == 0
+
+
+def test_breaker_fails_fast_then_lets_one_probe_through(stub):
+    handler, url = stub
+    handler.faults = parse_faults("dalle=error:1:503")
+    upstream = make_upstream(retries=0, failure_threshold=3, reset_timeout=0.3)
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            failing = [await outcome(upstream.call(request, client, url + IMAGES)) for _ in range(3)]
+            started = time.perf_counter()
+            fast = await outcome(upstream.call(request, client, url + IMAGES))
+            fast_s = time.perf_counter() - started
+            # Healthy again, but slow enough that a second call arrives while
+            # the probe is still in flight.
+            handler.faults = {}
+            handler.latency = {"dalle": ("fixed", 0.2)}
+            await asyncio.sleep(0.35)
+            probes = await asyncio.gather(
+                outcome(upstream.call(request, client, url + IMAGES)),
+                outcome(upstream.call(request, client, url + IMAGES)),
+            )
+            return failing, fast, fast_s, probes
+
+    failing, fast, fast_s, probes = asyncio.run(run())
+
+    assert failing == [503] * 3
+    assert fast == "circuit_open"
+    assert fast_s < 0.05
+    assert sorted(probes, key=str) == [200, "circuit_open"]
+    assert upstream.breaker.stats()["state"] == "closed"
+
+
+def test_calls_are_bounded_by_the_deadline(stub):
+    handler, url = stub
+    handler.faults = parse_faults("pixabay=hang:1:5")
+    upstream = make_upstream()
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            with deadline(0.5):
+                await upstream.call(request, client, url + PIXABAY)
+
+    started = time.perf_counter()
+    with pytest.raises((DeadlineExceeded, httpx.TimeoutException)):
+        asyncio.run(run())
+    assert time.perf_counter() - started < 1.0
+
+
+def test_hedged_call_wins_over_a_hung_first_attempt(stub):
+    handler, url = stub
+    handler.faults = parse_faults("pixabay=hang:1:2")
+    upstream = make_upstream()
+
+    async def heal():
+        # Only the first attempt hangs; the hedge goes out after 0.2s.
+        await asyncio.sleep(0.1)
+        handler.faults = {}
+
+    async def run():
+        async with httpx.AsyncClient() as client:
+            healing = asyncio.ensure_future(heal())
+            started = time.perf_counter()
+            result = await upstream.hedged(0.2, request, client, url + PIXABAY)
+            await healing
+            return result, time.perf_counter() - started
+
+    result, elapsed = asyncio.run(run())
+
+    assert result["hits"]
+    assert upstream.hedges == 1
+    assert upstream.hedge_wins == 1
+    assert elapsed < 1.0
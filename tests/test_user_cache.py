@@ -0,0 +1,42 @@
+def test_signup_clears_negative_cache(operator):
+    assert operator.find_user("new@example.com") is None
+    assert operator.missing_users.get("new@example.com")
+
+    user_id = operator.create_user("new@example.com", "hash", "New User")
+
+    assert operator.missing_users.get("new@example.com") is None
+    user = operator.find_user("new@example.com")
+    assert user["_id"] == user_id
+    assert user["password"] == "hash"
+
+
+def test_find_user_caches_after_first_read(operator):
+    with operator.user_db:
+        operator.user_db.insert_document({"_id": "u1", "email": "old@example.com", "password": "hash"})
+
+    assert operator.find_user("old@example.com")["_id"] == "u1"
+    with operator.user_db:
+        operator.user_db.delete_first({"_id": "u1"})
+    assert operator.find_user("old@example.com")["_id"] == "u1"
+
+
+def test_get_user_by_id_omits_password(operator):
+    user_id = operator.create_user("me@example.com", "hash", "Me")
+
+    user = operator.get_user_by_id(user_id)
+
+    assert user["email"] == "me@example.com"
+    assert "password" not in user
+    # Stripping the hash must not touch the cached record login relies on.
+    assert operator.find_user("me@example.com")["password"] == "hash"
+
+
+def test_get_user_by_id_reads_through_on_cache_miss(operator):
+    user_id = operator.create_user("cold@example.com", "hash", "Cold")
+    operator.invalidate_user(email="cold@example.com", user_id=user_id)
+
+    user = operator.get_user_by_id(user_id)
+
+    assert user["_id"] == user_id
+    assert "password" not in user
+    assert operator.get_user_by_id("missing") is None